@@ -1,10 +1,80 @@
+import datetime
+import tempfile
+from itertools import izip
+
 from django.http import StreamingHttpResponse
 
 from rest_framework import renderers
 from rest_framework_csv.renderers import CSVRenderer
 
-from StringIO import StringIO
+import numpy as np
 import pandas as pd
+import unicodecsv as csv
+import xlsxwriter
+
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+class Echo(object):
+    """
+    File-like object returning what is written to it (see `iter_csv`)
+    """
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """
+    Yield every row (the header included) as a line of CSV
+    """
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def iter_file(file_obj, chunk_size=FILE_CHUNK_SIZE):
+    """
+    Yield the contents of `file_obj` in chunks, then close it
+    """
+    try:
+        file_obj.seek(0)
+        while True:
+            chunk = file_obj.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        file_obj.close()
+
+
+def write_dataframe(workbook, sheet_name, dataframe, datetime_format):
+    """
+    Write `dataframe` (and its index) to a new worksheet, row by row, as
+    required by workbooks in `constant_memory` mode.
+    Returns the worksheet.
+    """
+    worksheet = workbook.add_worksheet(sheet_name)
+    date_format = workbook.add_format({'num_format': datetime_format})
+    header = [name or '' for name in dataframe.index.names]
+    header.extend(unicode(column) for column in dataframe.columns)
+    worksheet.write_row(0, 0, header)
+    rows = izip(dataframe.index, dataframe.itertuples(index=False))
+    for row_number, (index, values) in enumerate(rows, 1):
+        if not isinstance(index, tuple):
+            index = (index, )
+        for col_number, value in enumerate(index + tuple(values)):
+            if isinstance(value, np.generic):
+                value = value.item()
+            if value is None or pd.isnull(value):
+                continue
+            if isinstance(value, datetime.datetime):
+                worksheet.write_datetime(
+                    row_number, col_number, value, date_format
+                )
+            else:
+                worksheet.write(row_number, col_number, value)
+    return worksheet
 
 
 class PandasExcelRenderer(CSVRenderer):
@@ -20,31 +90,40 @@ class PandasExcelRenderer(CSVRenderer):
         drf_response = renderer_context.get('response', None)
         # Hard-coded headers_ordering required to force an explicit ordering, otherwise headers are sorted by key-name
         headers_ordering = renderer_context.get('headers_ordering', None)
-        table_gen = self.tablize(data, header=headers_ordering)
-        table = [r for r in table_gen]
-        headers = table.pop(0)
-        raw_dataframe = pd.DataFrame(table, columns=headers)
-        #Save to StringIO
-        sio = StringIO()
-        writer = pd.ExcelWriter(sio, engine='xlsxwriter')
-        if 'excel_writer_hook' not in renderer_context:
-            raise Exception(
-                "Implementation error -- Using PandasExcelRenderer without including 'excel_writer_hook' in renderer_context"
-            )
-
-        callback = renderer_context.get('excel_writer_hook')
-        writer = callback(raw_dataframe, writer)
-        # ASSERT: Writer should be saved by now
-        # StringIO to response:
-        sio.seek(0)
-        workbook = sio.getvalue()
+        table = self.tablize(data, header=headers_ordering)
+        headers = next(table, [])
+        raw_dataframe = pd.DataFrame.from_records(table, columns=headers)
+        workbook_file = self.write_workbook(raw_dataframe, renderer_context)
         response = StreamingHttpResponse(
-            workbook, content_type='application/vnd.ms-excel'
+            iter_file(workbook_file), content_type=self.media_type
         )
         drf_response['Content-Disposition'
                     ] = 'attachment; filename="%s"' % filename
         return response
 
+    @staticmethod
+    def write_workbook(raw_dataframe, renderer_context, file_obj=None):
+        """
+        Write the workbook built by the 'excel_writer_hook' of the
+        renderer_context to `file_obj` (a new temporary file by default),
+        in `constant_memory` mode: the hook must write sheets row by row
+        (see `write_dataframe`).
+        Returns the file.
+        """
+        if 'excel_writer_hook' not in renderer_context:
+            raise Exception(
+                "Implementation error -- Using PandasExcelRenderer without including 'excel_writer_hook' in renderer_context"
+            )
+        if file_obj is None:
+            file_obj = tempfile.TemporaryFile(suffix='.xlsx')
+        workbook = xlsxwriter.Workbook(file_obj, {'constant_memory': True})
+        callback = renderer_context.get('excel_writer_hook')
+        try:
+            callback(raw_dataframe, workbook)
+        finally:
+            workbook.close()
+        return file_obj
+
 
 class PNGRenderer(renderers.BaseRenderer):
     media_type = "image/png"
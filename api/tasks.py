@@ -0,0 +1,71 @@
+"""
+Long running API requests, offloaded to celery
+"""
+import os
+import time
+
+from celery.decorators import task
+from django.conf import settings
+from django.utils.datastructures import MultiValueDict
+from threepio import celery_logger
+
+from api.v2.views.reporting import (
+    ReportingViewSet, get_export_dir, get_export_path, write_export_metadata
+)
+from core.models import AtmosphereUser
+
+
+def _remove_expired_exports(export_dir, max_age):
+    expired = time.time() - max_age
+    for name in os.listdir(export_dir):
+        path = os.path.join(export_dir, name)
+        try:
+            if os.path.getmtime(path) < expired:
+                os.remove(path)
+        except OSError as exc:
+            celery_logger.warn("Could not remove export %s: %s" % (path, exc))
+
+
+@task(name="export_instance_report")
+def export_instance_report(export_id, username, query_params, export_format):
+    """
+    Write the instance report of `username` (filtered by the `query_params` of
+    the reporting API) to REPORTING_EXPORT_DIR, along with the metadata read
+    by ReportingViewSet to download it.
+    """
+    export_dir = get_export_dir()
+    _remove_expired_exports(
+        export_dir, getattr(settings, 'REPORTING_EXPORT_MAX_AGE', 24 * 60 * 60)
+    )
+    query_params = MultiValueDict(query_params)
+    export = {
+        'username':
+            username,
+        'format':
+            export_format,
+        'filename':
+            query_params.get(
+                'filename', 'instance_reporting.%s' % export_format
+            ),
+    }
+    path = get_export_path(export_id, export_format)
+    started = time.time()
+    try:
+        user = AtmosphereUser.objects.get(username=username)
+        queryset = ReportingViewSet.get_report_queryset(user, query_params)
+        # Without a request, the serialized URLs are relative
+        with open(path + '.part', 'wb') as export_file:
+            ReportingViewSet.write_report(
+                queryset, export_format, export_file,
+                ReportingViewSet.get_frequency(query_params), {'request': None}
+            )
+        os.rename(path + '.part', path)
+    except Exception:
+        write_export_metadata(export_id, dict(export, status='FAILURE'))
+        raise
+    write_export_metadata(export_id, dict(export, status='SUCCESS'))
+    celery_logger.info(
+        "Exported the %s report %s of %s in %.2f seconds" %
+        (export_format, export_id, username, time.time() - started)
+    )
+    return dict(export, path=path)
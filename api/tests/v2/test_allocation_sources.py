@@ -3,6 +3,7 @@ import itertools
 import uuid
 from unittest import skip
 from django.core import urlresolvers
+from django.test import override_settings
 from rest_framework.test import APIClient, APIRequestFactory
 from rest_framework.test import APITestCase, force_authenticate
 
@@ -10,7 +11,9 @@ from api.tests.factories import (
     UserFactory, AnonymousUserFactory, IdentityFactory, ProviderFactory,
     AllocationSourceFactory, UserAllocationSourceFactory
 )
-from cyverse_allocation.tasks import update_snapshot_cyverse
+from cyverse_allocation.tasks import (
+    allocation_threshold_check, update_snapshot_cyverse
+)
 from .base import APISanityTestCase
 from api.v2.views import AllocationSourceViewSet as ViewSet
 
@@ -112,6 +115,38 @@ class AllocationSourceTests(APITestCase, APISanityTestCase):
         )
         self.assertEqual(allocation_source.is_over_allocation(), False)
 
+    @override_settings(CHECK_THRESHOLD=True)
+    def test_threshold_check_fires_each_threshold_once(self):
+        """Thresholds are met one at a time, and only once"""
+        from core.models import AllocationSourceSnapshot, EventTable
+        allocation_source = AllocationSourceFactory.create(
+            name='TG-THR990003', compute_allowed=100
+        )
+        AllocationSourceSnapshot.objects.update_or_create(
+            allocation_source=allocation_source,
+            defaults={
+                'compute_used': 95,
+                'compute_allowed': 100,
+                'global_burn_rate': 0
+            }
+        )
+
+        def _thresholds_met():
+            return sorted(
+                event.payload['threshold']
+                for event in EventTable.objects.filter(
+                    name='allocation_source_threshold_met',
+                    entity_id=allocation_source.name
+                )
+            )
+
+        allocation_threshold_check()
+        self.assertEqual(_thresholds_met(), [50.0])
+        allocation_threshold_check()
+        self.assertEqual(_thresholds_met(), [50.0, 90.0])
+        allocation_threshold_check()
+        self.assertEqual(_thresholds_met(), [50.0, 90.0])
+
     def test_renewal_rules(self):
         """Check renewal rules"""
         import datetime
@@ -1,6 +1,8 @@
+import pickle
 import uuid
 from unittest import skip
 
+import mock
 from django.core.urlresolvers import reverse
 from django.utils import timezone
 
@@ -13,6 +15,12 @@ from api.tests.factories import (
     InstanceStatusFactory, ProviderMachineFactory, IdentityFactory,
     ProviderFactory
 )
+from core.metrics.application import (
+    METRICS_FULL_REFRESH_INTERVAL, METRICS_LAST_FULL_RUN_KEY,
+    METRICS_LAST_RUN_KEY, calculate_summarized_application_metrics,
+    calculate_summarized_application_metrics_many,
+    precompute_application_metrics
+)
 from .base import APISanityTestCase
 
 
@@ -184,6 +192,74 @@ class ImageMetricsTest(APITestCase, APISanityTestCase):
         response = client.get(url)
         self.assertEquals(response.status_code, 404)
 
+    def test_bulk_metrics_match_single_application_metrics(self):
+        other_machine = ProviderMachineFactory.create_provider_machine(
+            self.user, self.user_identity
+        )
+        other_application = other_machine.application_version.application
+
+        bulk_metrics = calculate_summarized_application_metrics_many(
+            [self.application.id, other_application.id]
+        )
+
+        self.assertEquals(
+            bulk_metrics[self.application.id],
+            calculate_summarized_application_metrics(self.application)
+        )
+        self.assertEquals(
+            bulk_metrics[self.application.id]['instances'], {
+                'total': 4,
+                'percent': 25.0,
+                'success': 1
+            }
+        )
+        self.assertEquals(
+            bulk_metrics[other_application.id],
+            calculate_summarized_application_metrics(other_application)
+        )
+
+    def _precompute(self, cache):
+        with mock.patch(
+            'core.metrics.application.get_many',
+            side_effect=lambda keys: [cache.get(key) for key in keys]
+        ), mock.patch(
+            'core.metrics.application.set_many',
+            side_effect=lambda mapping, expire: cache.update(mapping)
+        ):
+            return precompute_application_metrics()
+
+    def test_incremental_precompute(self):
+        other_machine = ProviderMachineFactory.create_provider_machine(
+            self.user, self.user_identity
+        )
+        full_run = timezone.now() - timezone.timedelta(days=1)
+        cache = {
+            METRICS_LAST_RUN_KEY:
+                pickle.dumps(timezone.now() - timezone.timedelta(hours=1)),
+            METRICS_LAST_FULL_RUN_KEY:
+                pickle.dumps(full_run)
+        }
+
+        # Only the application launched since the last run is refreshed
+        self.assertEquals(self._precompute(cache), 1)
+        self.assertEquals(
+            pickle.loads(cache[METRICS_LAST_FULL_RUN_KEY]), full_run
+        )
+
+        # Until the last full run is too old
+        cache[METRICS_LAST_FULL_RUN_KEY] = pickle.dumps(
+            timezone.now() -
+            timezone.timedelta(seconds=METRICS_FULL_REFRESH_INTERVAL)
+        )
+        self.assertGreaterEqual(self._precompute(cache), 2)
+        self.assertIn(
+            'metrics-application-summary-%s' %
+            other_machine.application_version.application.id, cache
+        )
+        self.assertGreater(
+            pickle.loads(cache[METRICS_LAST_FULL_RUN_KEY]), full_run
+        )
+
     @skip(
         "Test is non deterministic and yields different results based on its redis cache"
     )
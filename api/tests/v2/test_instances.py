@@ -2,6 +2,8 @@ import uuid
 import mock
 
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from rest_framework.test import APIClient
@@ -10,10 +12,11 @@ from rest_framework.test import APITestCase
 from api.tests.factories import (
     UserFactory, AnonymousUserFactory, InstanceFactory, InstanceHistoryFactory,
     InstanceStatusFactory, ProviderMachineFactory, IdentityFactory,
-    ProviderFactory
+    ProviderFactory, AllocationSourceFactory
 )
 from .base import APISanityTestCase
 from api.v2.views import InstanceViewSet
+from core.models import InstanceAllocationSourceSnapshot
 
 
 class InstanceTests(APITestCase, APISanityTestCase):
@@ -154,6 +157,41 @@ class InstanceTests(APITestCase, APISanityTestCase):
         self.assertEquals(data['status'], 'active')
         self.assertEquals(data['activity'], '')
 
+    def test_list_query_count_does_not_grow_with_instances(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse(self.url_route + "-list")
+        allocation_source = AllocationSourceFactory.create()
+        active = InstanceStatusFactory.create(name='active')
+
+        def create_instance():
+            instance = InstanceFactory.create(
+                provider_alias=uuid.uuid4(),
+                source=self.machine.instance_source,
+                created_by=self.user,
+                created_by_identity=self.user_identity,
+                start_date=timezone.now()
+            )
+            InstanceHistoryFactory.create(
+                status=active, activity="", instance=instance
+            )
+            InstanceAllocationSourceSnapshot.objects.create(
+                instance=instance, allocation_source=allocation_source
+            )
+
+        def count_queries(instance_count):
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            self.assertEquals(response.status_code, 200)
+            self.assertEquals(len(response.data['results']), instance_count)
+            return len(queries)
+
+        create_instance()
+        query_count = count_queries(5)
+        for _ in range(5):
+            create_instance()
+        self.assertEquals(count_queries(10), query_count)
+
     def test_instance_delete(self):
         client = APIClient()
         client.force_authenticate(user=self.user)
@@ -1,10 +1,30 @@
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import timedelta
 from unittest import skip
 
+import mock
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework.test import APITestCase, APIRequestFactory, force_authenticate
 
-from api.tests.factories import UserFactory, AnonymousUserFactory
+from api.tasks import export_instance_report
+from api.tests.factories import (
+    UserFactory, AnonymousUserFactory, IdentityFactory, InstanceFactory,
+    InstanceHistoryFactory, InstanceStatusFactory, ProviderFactory,
+    ProviderMachineFactory, SizeFactory
+)
 from api.v2.views import ReportingViewSet
+from api.v2.views.reporting import (
+    HEADERS_ORDERING, read_export_metadata, write_export_metadata
+)
+from core.models import Instance
 
 
 class ReportingTests(APITestCase):
@@ -12,6 +32,23 @@ class ReportingTests(APITestCase):
         self.anonymous_user = AnonymousUserFactory()
         self.user = UserFactory.create()
         self.view = ReportingViewSet.as_view({'get': 'list'})
+        self.staff_user = UserFactory.create(is_staff=True)
+        self.provider = ProviderFactory.create()
+        self.identity = IdentityFactory.create_identity(
+            created_by=self.staff_user, provider=self.provider
+        )
+        self.machine = ProviderMachineFactory.create_provider_machine(
+            self.staff_user, self.identity
+        )
+        self.active = InstanceStatusFactory.create(name='active')
+        self.deploy_error = InstanceStatusFactory.create(name='deploy_error')
+        self.export_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.export_dir)
+        export_settings = override_settings(
+            REPORTING_EXPORT_DIR=self.export_dir
+        )
+        export_settings.enable()
+        self.addCleanup(export_settings.disable)
 
     def test_is_not_public(self):
         factory = APIRequestFactory()
@@ -51,6 +88,263 @@ class ReportingTests(APITestCase):
                 'Invalid filter parameters'
             )
 
+    def _create_staff_instances(self, count):
+        for idx in range(count):
+            instance = InstanceFactory.create(
+                provider_alias=uuid.uuid4(),
+                source=self.machine.instance_source,
+                created_by=self.staff_user,
+                created_by_identity=self.identity,
+                start_date=timezone.now()
+            )
+            InstanceHistoryFactory.create(
+                status=self.active if idx % 2 else self.deploy_error,
+                activity="",
+                instance=instance
+            )
+
+    def _report_params(self, **params):
+        params.update(
+            {
+                'start_date': (timezone.now() - timedelta(days=1)).isoformat(),
+                'end_date': (timezone.now() + timedelta(days=1)).isoformat(),
+                'provider_id': self.provider.id
+            }
+        )
+        return params
+
+    def _task_params(self, **params):
+        return dict(
+            (key, [str(value)])
+            for key, value in self._report_params(**params).items()
+        )
+
+    def _report_request(self, user, params):
+        url = reverse('api:v2:reporting-list')
+        request = APIRequestFactory().get(url, params)
+        force_authenticate(request, user=user)
+        return request
+
+    def _staff_report_request(self, **params):
+        return self._report_request(
+            self.staff_user, self._report_params(**params)
+        )
+
+    def test_query_count_does_not_grow_with_instances(self):
+        def list_instances():
+            request = self._staff_report_request()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.view(request)
+                response.render()
+            self.assertEquals(response.status_code, 200)
+            return response.data, len(queries)
+
+        self._create_staff_instances(2)
+        data, query_count = list_instances()
+        self.assertEquals(len(data), 2)
+        self._create_staff_instances(6)
+        data, more_query_count = list_instances()
+        self.assertEquals(len(data), 8)
+        self.assertEquals(query_count, more_query_count)
+        for row in data:
+            self.assertEquals(
+                row['hit_active'], not row['hit_deploy_error'], row
+            )
+            self.assertFalse(row['hit_aborted'])
+
+    def test_report_size_prefers_the_projection(self):
+        self._create_staff_instances(2)
+        projected, unprojected = Instance.objects.filter(
+            created_by=self.staff_user
+        ).order_by('id')
+        projected_size = SizeFactory.create()
+        Instance.objects.filter(id=projected.id
+                               ).update(last_size=projected_size)
+        Instance.objects.filter(id=unprojected.id).update(last_size=None)
+
+        response = self.view(self._staff_report_request())
+
+        self.assertEquals(response.status_code, 200)
+        sizes = dict((row['id'], row['size']['id']) for row in response.data)
+        self.assertEquals(
+            sizes, {
+                projected.id: projected_size.id,
+                unprojected.id: unprojected.get_last_history().size.id
+            }
+        )
+
+    def test_csv_export_is_streamed(self):
+        self._create_staff_instances(3)
+        response = self.view(self._staff_report_request(format='csv'))
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = ''.join(response.streaming_content).splitlines()
+        self.assertEquals(lines[0], ','.join(HEADERS_ORDERING))
+        self.assertEquals(len(lines), 4)
+
+    def test_export_is_queued(self):
+        with mock.patch('api.v2.views.reporting.app') as app:
+            response = self.view(self._staff_report_request(export='csv'))
+
+        self.assertEquals(response.status_code, 202)
+        export_id = response.data['export_id']
+        self.assertEquals(response.data['status'], 'PENDING')
+        (task_name, ), kwargs = app.send_task.call_args
+        self.assertEquals(task_name, 'export_instance_report')
+        self.assertEquals(kwargs['task_id'], export_id)
+        args = kwargs['args']
+        self.assertEquals(
+            (args[0], args[1], args[3]),
+            (export_id, self.staff_user.username, 'csv')
+        )
+        self.assertEquals(args[2]['export'], ['csv'])
+        self.assertEquals(
+            read_export_metadata(export_id), {
+                'username': self.staff_user.username,
+                'format': 'csv',
+                'filename': 'instance_reporting.csv',
+                'status': 'PENDING'
+            }
+        )
+
+    def test_export_format_is_validated(self):
+        with mock.patch('api.v2.views.reporting.app') as app:
+            response = self.view(self._staff_report_request(export='pdf'))
+
+        self.assertEquals(response.status_code, 400)
+        self.assertFalse(app.send_task.called)
+
+    def test_export_instance_report(self):
+        self._create_staff_instances(3)
+        query_params = self._task_params(filename='report.csv')
+        export_id = str(uuid.uuid4())
+
+        export = export_instance_report(
+            export_id, self.staff_user.username, query_params, 'csv'
+        )
+
+        self.assertEquals(
+            export, {
+                'username': self.staff_user.username,
+                'path': os.path.join(self.export_dir, '%s.csv' % export_id),
+                'format': 'csv',
+                'filename': 'report.csv'
+            }
+        )
+        self.assertEquals(
+            read_export_metadata(export_id), {
+                'username': self.staff_user.username,
+                'format': 'csv',
+                'filename': 'report.csv',
+                'status': 'SUCCESS'
+            }
+        )
+        with open(export['path']) as export_file:
+            lines = export_file.read().splitlines()
+        self.assertEquals(lines[0], ','.join(HEADERS_ORDERING))
+        self.assertEquals(len(lines), 4)
+
+    def test_failed_export_instance_report(self):
+        export_id = str(uuid.uuid4())
+        with mock.patch.object(
+            ReportingViewSet, 'write_report', side_effect=ValueError
+        ):
+            with self.assertRaises(ValueError):
+                export_instance_report(
+                    export_id, self.staff_user.username, self._task_params(),
+                    'csv'
+                )
+
+        self.assertEquals(read_export_metadata(export_id)['status'], 'FAILURE')
+
+    def _download(self, user, export_id):
+        params = self._report_params(export_id=export_id)
+        return self.view(self._report_request(user, params))
+
+    def _export(self, user, status='SUCCESS'):
+        export_id = str(uuid.uuid4())
+        write_export_metadata(
+            export_id, {
+                'username': user.username,
+                'format': 'csv',
+                'filename': 'report.csv',
+                'status': status
+            }
+        )
+        if status == 'SUCCESS':
+            path = os.path.join(self.export_dir, '%s.csv' % export_id)
+            with open(path, 'w') as export_file:
+                export_file.write('id\n1\n')
+        return export_id
+
+    def test_download_export(self):
+        response = self._download(self.user, self._export(self.user))
+
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(
+            response['Content-Disposition'], 'attachment; filename="report.csv"'
+        )
+        self.assertEquals(''.join(response.streaming_content), 'id\n1\n')
+
+    def test_staff_can_download_any_export(self):
+        response = self._download(self.staff_user, self._export(self.user))
+
+        self.assertEquals(response.status_code, 200)
+
+    def test_download_export_of_another_user(self):
+        other_user = UserFactory.create()
+        for status in ['PENDING', 'FAILURE', 'SUCCESS']:
+            response = self._download(
+                other_user, self._export(self.user, status=status)
+            )
+
+            self.assertEquals(response.status_code, 403)
+            self.assertNotIn('status', response.data)
+
+    def test_download_pending_export(self):
+        export_id = self._export(self.user, status='PENDING')
+        response = self._download(self.user, export_id)
+
+        self.assertEquals(response.status_code, 202)
+        self.assertEquals(
+            response.data, {
+                'export_id': export_id,
+                'status': 'PENDING'
+            }
+        )
+
+    def test_download_failed_export(self):
+        response = self._download(
+            self.user, self._export(self.user, status='FAILURE')
+        )
+
+        self.assertEquals(response.status_code, 500)
+
+    def test_download_unknown_export(self):
+        for export_id in [str(uuid.uuid4()), 'some-export', '../export']:
+            response = self._download(self.user, export_id)
+
+            self.assertEquals(response.status_code, 404)
+
+    def test_download_expired_export(self):
+        export_id = self._export(self.user)
+        expired = time.time() - 25 * 60 * 60
+        os.utime(
+            os.path.join(self.export_dir, '%s.json' % export_id),
+            (expired, expired)
+        )
+        with override_settings(REPORTING_EXPORT_MAX_AGE=24 * 60 * 60):
+            response = self._download(self.user, export_id)
+
+        self.assertEquals(response.status_code, 404)
+
+    def test_download_removed_export(self):
+        export_id = self._export(self.user)
+        os.remove(os.path.join(self.export_dir, '%s.csv' % export_id))
+        response = self._download(self.user, export_id)
+
+        self.assertEquals(response.status_code, 404)
+
     @skip('skip for now')
     def test_access_invalid_provider(self):
         raise NotImplementedError
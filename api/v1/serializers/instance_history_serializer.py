@@ -38,5 +38,6 @@ class InstanceHistorySerializer(serializers.ModelSerializer):
         model = Instance
         exclude = (
             'id', 'source', 'provider_alias', 'shell', 'vnc',
-            'created_by_identity'
+            'created_by_identity', 'last_status', 'last_activity', 'last_size',
+            'last_status_date'
         )
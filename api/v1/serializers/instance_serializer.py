@@ -59,7 +59,8 @@ class InstanceSerializer(serializers.ModelSerializer):
         model = Instance
         exclude = (
             'source', 'provider_alias', 'shell', 'vnc', 'password',
-            'created_by_identity'
+            'created_by_identity', 'last_status', 'last_activity', 'last_size',
+            'last_status_date'
         )
 
 
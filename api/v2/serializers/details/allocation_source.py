@@ -1,6 +1,7 @@
 from decimal import Decimal
 
 import django
+from django.db.models import Prefetch
 from rest_framework import serializers
 
 from core.models.allocation_source import AllocationSource, AllocationSourceSnapshot, UserAllocationSnapshot
@@ -8,6 +9,11 @@ from api.v2.serializers.fields.base import UUIDHyperlinkedIdentityField
 
 
 class AllocationSourceSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Reads the snapshot of the allocation source (see `select_related`) and the
+    snapshot of the request user (see `prefetch_user_snapshots`) when they are
+    loaded with it.
+    """
     compute_allowed = serializers.SerializerMethodField()
     compute_used = serializers.SerializerMethodField()
     global_burn_rate = serializers.SerializerMethodField()
@@ -19,11 +25,22 @@ class AllocationSourceSerializer(serializers.HyperlinkedModelSerializer):
         view_name='api:v2:allocationsource-detail',
     )
 
+    @staticmethod
+    def prefetch_user_snapshots(user, lookup='user_allocation_snapshots'):
+        """
+        Prefetch the UserAllocationSnapshots of `user` (the request user), where
+        `lookup` leads to them from the serialized queryset.
+        """
+        return Prefetch(
+            lookup,
+            queryset=UserAllocationSnapshot.objects.filter(user=user),
+            to_attr='request_user_snapshots'
+        )
+
     def _get_allocation_source_snapshot(self, allocation_source, attr_name):
-        snapshot = AllocationSourceSnapshot.objects.filter(
-            allocation_source=allocation_source
-        ).first()
-        if not snapshot:
+        try:
+            snapshot = allocation_source.snapshot
+        except AllocationSourceSnapshot.DoesNotExist:
             return None
         attr = getattr(snapshot, attr_name)
         return attr
@@ -34,10 +51,14 @@ class AllocationSourceSerializer(serializers.HyperlinkedModelSerializer):
         return self.context['request'].user
 
     def _get_user_allocation_snapshot(self, allocation_source, attr_name):
-        user = self._get_request_user()
-        snapshot = UserAllocationSnapshot.objects.filter(
-            allocation_source=allocation_source, user=user
-        ).first()
+        if hasattr(allocation_source, 'request_user_snapshots'):
+            snapshots = allocation_source.request_user_snapshots
+            snapshot = snapshots[0] if snapshots else None
+        else:
+            user = self._get_request_user()
+            snapshot = UserAllocationSnapshot.objects.filter(
+                allocation_source=allocation_source, user=user
+            ).first()
         if not snapshot:
             return None
         attr = getattr(snapshot, attr_name)
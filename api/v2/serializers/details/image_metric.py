@@ -1,5 +1,7 @@
 from core.models import Application as Image
-from core.metrics.application import _get_summarized_application_metrics
+from core.metrics.application import (
+    _get_summarized_application_metrics, get_summarized_application_metrics_many
+)
 from rest_framework import serializers
 from api.v2.serializers.fields.base import UUIDHyperlinkedIdentityField
 
@@ -16,6 +18,17 @@ class SwapBooleanField(serializers.BooleanField):
         return swap_value
 
 
+class ImageMetricListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Read the cached metrics of the whole page in one round trip
+        applications = list(data.all() if hasattr(data, 'all') else data)
+        self.child.prefetched_metrics = get_summarized_application_metrics_many(
+            applications
+        )
+        return super(ImageMetricListSerializer,
+                     self).to_representation(applications)
+
+
 class ImageMetricSerializer(serializers.HyperlinkedModelSerializer):
     url = UUIDHyperlinkedIdentityField(
         view_name='api:v2:applicationmetric-detail',
@@ -36,10 +49,14 @@ class ImageMetricSerializer(serializers.HyperlinkedModelSerializer):
                 "context! context={'user':user}"
             )
         # Summarized metrics example
+        prefetched_metrics = getattr(self, 'prefetched_metrics', {})
+        if application.id in prefetched_metrics:
+            return prefetched_metrics[application.id]
         return _get_summarized_application_metrics(application)
 
     class Meta:
         model = Image
+        list_serializer_class = ImageMetricListSerializer
         fields = (
             'id',
             'url',
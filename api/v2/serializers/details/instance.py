@@ -1,5 +1,5 @@
 from core.models import (
-    Project, BootScript, Instance, Application as Image,
+    Project, BootScript, Instance, AllocationSourceSnapshot,
     InstanceAllocationSourceSnapshot
 )
 from rest_framework import serializers
@@ -15,6 +15,10 @@ from api.v2.serializers.fields.base import UUIDHyperlinkedIdentityField
 
 
 class InstanceSerializer(serializers.HyperlinkedModelSerializer):
+    """
+    Reads the relations loaded by `InstanceViewSet.get_queryset` (the last
+    history, the allocation source and the image) instead of querying them.
+    """
     identity = IdentitySummarySerializer(source='created_by_identity')
     user = UserSummarySerializer(source='created_by')
     provider = ProviderSummarySerializer(source='created_by_identity.provider')
@@ -46,22 +50,30 @@ class InstanceSerializer(serializers.HyperlinkedModelSerializer):
         uuid_field='provider_alias'
     )
 
+    def _get_allocation_source(self, instance):
+        try:
+            snapshot = instance.instanceallocationsourcesnapshot
+        except InstanceAllocationSourceSnapshot.DoesNotExist:
+            return None
+        return snapshot.allocation_source
+
     def get_allocation_source(self, instance):
-        snapshot = InstanceAllocationSourceSnapshot.objects.filter(
-            instance=instance
-        ).first()
-        if not snapshot:
+        allocation_source = self._get_allocation_source(instance)
+        if not allocation_source:
             return None
         serializer = AllocationSourceSerializer(
-            snapshot.allocation_source, context=self.context
+            allocation_source, context=self.context
         )
         return serializer.data
 
     def get_usage(self, instance):
-        if not instance.allocation_source\
-                or not instance.allocation_source.snapshot:
+        allocation_source = self._get_allocation_source(instance)
+        if not allocation_source:
+            return -1
+        try:
+            return allocation_source.snapshot.compute_used
+        except AllocationSourceSnapshot.DoesNotExist:
             return -1
-        return instance.allocation_source.snapshot.compute_used
 
     def get_size(self, obj):
         size = obj.get_size()
@@ -71,8 +83,7 @@ class InstanceSerializer(serializers.HyperlinkedModelSerializer):
     def get_image(self, obj):
         if not obj.source.is_machine():
             return {}
-        image_uuid = obj.application_uuid()
-        image = Image.objects.get(uuid=image_uuid)
+        image = obj.source.providermachine.application_version.application
         serializer = ImageSuperSummarySerializer(image, context=self.context)
         return serializer.data
 
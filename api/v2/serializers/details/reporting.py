@@ -3,10 +3,36 @@ from rest_framework import serializers
 from api.v2.serializers.summaries import (
     SizeSummarySerializer,
 )
-from core.models import (Instance)
+from core.models import (Instance, Size)
+
+
+class InstanceReportingListSerializer(serializers.ListSerializer):
+    """
+    Loads the (annotated) last size of every instance with a single query
+    """
+
+    def to_representation(self, data):
+        instances = list(data.all() if hasattr(data, 'all') else data)
+        size_ids = set(
+            getattr(instance, 'report_last_size_id', None)
+            for instance in instances
+        )
+        size_ids.discard(None)
+        sizes = Size.objects.in_bulk(size_ids) if size_ids else {}
+        for instance in instances:
+            size_id = getattr(instance, 'report_last_size_id', None)
+            if size_id in sizes:
+                instance.report_last_size = sizes[size_id]
+        return super(InstanceReportingListSerializer,
+                     self).to_representation(instances)
 
 
 class InstanceReportingSerializer(serializers.ModelSerializer):
+    """
+    Reads the flags annotated by `ReportingViewSet.get_queryset`
+    (`has_active`, `has_deploy_error`, `has_error`, `has_featured_tag` and
+    `report_last_size_id`) and only queries for them when they are missing.
+    """
     instance_id = serializers.CharField(source="provider_alias", read_only=True)
     username = serializers.CharField(
         source="created_by.username", read_only=True
@@ -31,11 +57,13 @@ class InstanceReportingSerializer(serializers.ModelSerializer):
     hit_active_or_aborted_or_error = serializers.SerializerMethodField()
 
     def get_size(self, obj):
-        size = obj.get_size()
+        size = getattr(obj, 'report_last_size', None) or obj.get_size()
         serializer = SizeSummarySerializer(size, context=self.context)
         return serializer.data
 
     def get_is_featured_image(self, instance):
+        if hasattr(instance, 'has_featured_tag'):
+            return instance.has_featured_tag
         try:
             application = self.get_application(instance)
             return application.tags.filter(name__icontains='featured'
@@ -96,25 +124,30 @@ class InstanceReportingSerializer(serializers.ModelSerializer):
             and not self.get_hit_error(instance)
         )
 
+    def _has_status(self, instance, status_name):
+        annotation = 'has_%s' % status_name
+        if hasattr(instance, annotation):
+            return getattr(instance, annotation)
+        return instance.instancestatushistory_set.filter(
+            status__name=status_name
+        ).exists()
+
     def get_hit_active(self, instance):
-        return instance.instancestatushistory_set.filter(status__name='active'
-                                                        ).count() > 0
+        return self._has_status(instance, 'active')
 
     def get_hit_deploy_error(self, instance):
         if self.get_hit_active(instance):
             return False
-        return instance.instancestatushistory_set.filter(
-            status__name='deploy_error'
-        ).count() > 0
+        return self._has_status(instance, 'deploy_error')
 
     def get_hit_error(self, instance):
         if self.get_hit_active(instance):
             return False
-        return instance.instancestatushistory_set.filter(status__name='error'
-                                                        ).count() > 0
+        return self._has_status(instance, 'error')
 
     class Meta:
         model = Instance
+        list_serializer_class = InstanceReportingListSerializer
         fields = (
             'id',
             'instance_id',
@@ -1,13 +1,15 @@
 import django_filters
-from django.db.models import Q
+from django.db.models import Prefetch, Q
 
-from api.v2.serializers.details import InstanceSerializer, InstanceActionSerializer
+from api.v2.serializers.details import (
+    AllocationSourceSerializer, InstanceSerializer, InstanceActionSerializer
+)
 from api.v2.serializers.post import InstanceSerializer as POST_InstanceSerializer
 from api.v2.views.base import AuthModelViewSet
 from api.v2.views.mixins import MultipleFieldLookup
 
 from core.exceptions import ProviderNotActive
-from core.models import GroupMembership, Instance, Identity, UserAllocationSource, Project, AllocationSource
+from core.models import GroupMembership, Instance, Identity, UserAllocationSource, Project, AllocationSource, BootScript
 from core.models.boot_script import _save_scripts_to_instance
 from core.models.instance import find_instance
 from core.models.instance_action import InstanceAction
@@ -83,10 +85,26 @@ class InstanceViewSet(MultipleFieldLookup, AuthModelViewSet):
         if 'archived' not in self.request.query_params:
             qs = qs.filter(only_current_instances())
         # logger.info("DEBUG- User %s querying for instances, available IDs are:%s" % (user, qs.values_list('id',flat=True)))
-        qs = qs.select_related("created_by")\
-            .select_related('created_by_identity')\
-            .select_related('source')\
-            .select_related('project')
+        qs = qs.select_related("created_by", "last_size")\
+            .select_related('created_by_identity__provider')\
+            .select_related(
+                'source__providermachine__application_version__application')\
+            .select_related('project__created_by', 'project__owner')\
+            .select_related(
+                'instanceallocationsourcesnapshot__allocation_source__snapshot')\
+            .prefetch_related(
+                'created_by_identity__credential_set',
+                Prefetch(
+                    'scripts',
+                    queryset=BootScript.objects.select_related('script_type')
+                ),
+                Instance.prefetch_last_history(),
+                AllocationSourceSerializer.prefetch_user_snapshots(
+                    user,
+                    'instanceallocationsourcesnapshot__allocation_source'
+                    '__user_allocation_snapshots'
+                ),
+            )
         return qs
 
     @detail_route(methods=['post'])
@@ -2,6 +2,7 @@
  Instance metrics stored in graphite
 """
 
+from django.conf import settings
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
@@ -10,7 +11,9 @@ from api import permissions
 from api.v2.exceptions import failure_response
 
 from core.models import Instance
-from core.metrics.instance import get_instance_metrics
+from core.metrics.instance import (
+    get_instance_metrics, get_instance_metrics_many
+)
 from threepio import logger
 
 
@@ -42,3 +45,32 @@ class MetricViewSet(GenericViewSet):
             logger.exception("Failed to retrieve instance metrics")
             return failure_response(status.HTTP_409_CONFLICT, str(exc.message))
         return Response(instance_metrics)
+
+    def list(self, *args, **kwargs):
+        """
+        Metrics for many instances at once:
+        ?instances=<provider_alias>,<provider_alias>,...
+        """
+        params = self.request.query_params
+        aliases = [
+            alias for alias in params.get('instances', '').split(',') if alias
+        ]
+        if not aliases:
+            return failure_response(
+                status.HTTP_400_BAD_REQUEST,
+                "Provide a comma-separated list of 'instances'"
+            )
+        max_instances = getattr(settings, 'METRICS_MAX_INSTANCES', 100)
+        if len(aliases) > max_instances:
+            return failure_response(
+                status.HTTP_400_BAD_REQUEST,
+                "Metrics can be requested for at most %s instances" %
+                max_instances
+            )
+        instances = self.get_queryset().filter(provider_alias__in=aliases)
+        try:
+            instance_metrics = get_instance_metrics_many(instances, params)
+        except Exception as exc:
+            logger.exception("Failed to retrieve instance metrics")
+            return failure_response(status.HTTP_409_CONFLICT, str(exc.message))
+        return Response(instance_metrics)
@@ -1,20 +1,92 @@
 """
  RESTful Reporting API
 """
-import numpy as np
+import json
+import os
+import time
+import uuid
+from itertools import islice
+
 import pandas as pd
 import pytz
 from dateutil.parser import parse
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import Exists, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
 from rest_framework import exceptions
 from rest_framework import status
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
 
-from api.renderers import PandasExcelRenderer, CSVRenderer
+from api.renderers import (
+    PandasExcelRenderer, CSVRenderer, iter_csv, iter_file, write_dataframe
+)
 from api.v2.exceptions import failure_response
 from api.v2.serializers.details import InstanceReportingSerializer
 from api.v2.views.base import AuthModelViewSet
-from core.models import Instance
+from atmosphere.celery_init import app
+from core.metrics.reporting import create_datasets
+from core.models import Instance, InstanceStatusHistory, Tag
+
+HEADERS_ORDERING = [
+    "id", "instance_id", "username", "staff_user", "provider", "start_date",
+    "end_date", "image_name", "version_name", "size.active", "size.start_date",
+    "size.end_date", "size.name", "size.id", "size.uuid", "size.url",
+    "size.alias", "size.cpu", "size.mem", "size.disk", "is_featured_image",
+    "hit_active", "hit_deploy_error", "hit_error", "hit_aborted",
+    "hit_active_or_aborted", "hit_active_or_aborted_or_error"
+]
+
+EXPORT_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': PandasExcelRenderer.media_type,
+}
+
+
+def get_export_dir():
+    export_dir = getattr(
+        settings, 'REPORTING_EXPORT_DIR', '/tmp/atmosphere-reports'
+    )
+    if not os.path.isdir(export_dir):
+        os.makedirs(export_dir)
+    return export_dir
+
+
+def get_export_path(export_id, extension):
+    return os.path.join(get_export_dir(), "%s.%s" % (export_id, extension))
+
+
+def write_export_metadata(export_id, metadata):
+    """
+    Write the metadata of an export (its username, format, filename and
+    status) next to the export itself, so that it expires with it.
+    """
+    path = get_export_path(export_id, 'json')
+    with open(path + '.part', 'w') as metadata_file:
+        json.dump(metadata, metadata_file)
+    os.rename(path + '.part', path)
+
+
+def read_export_metadata(export_id):
+    """
+    Return the metadata of an export, or None if the export is unknown or
+    older than REPORTING_EXPORT_MAX_AGE.
+    """
+    try:
+        if str(uuid.UUID(export_id)) != export_id:
+            return None
+    except ValueError:
+        return None
+    path = get_export_path(export_id, 'json')
+    max_age = getattr(settings, 'REPORTING_EXPORT_MAX_AGE', 24 * 60 * 60)
+    try:
+        if os.path.getmtime(path) < time.time() - max_age:
+            return None
+        with open(path) as metadata_file:
+            return json.load(metadata_file)
+    except (IOError, OSError):
+        return None
 
 
 class ReportingViewSet(AuthModelViewSet):
@@ -43,33 +115,21 @@ class ReportingViewSet(AuthModelViewSet):
         else:
             filename = 'instance_reporting.xlsx'
         return {
-            'view':
-                self,
-            'args':
-                getattr(self, 'args', ()),
-            'kwargs':
-                getattr(self, 'kwargs', {}),
-            'request':
-                request,
-            'filename':
-                filename,
-            'excel_writer_hook':
-                self.create_excel_file,
-            'headers_ordering':
-                [
-                    "id", "instance_id", "username", "staff_user", "provider",
-                    "start_date", "end_date", "image_name", "version_name",
-                    "size.active", "size.start_date", "size.end_date",
-                    "size.name", "size.id", "size.uuid", "size.url",
-                    "size.alias", "size.cpu", "size.mem", "size.disk",
-                    "is_featured_image", "hit_active", "hit_deploy_error",
-                    "hit_error", "hit_aborted", "hit_active_or_aborted",
-                    "hit_active_or_aborted_or_error"
-                ],
+            'view': self,
+            'args': getattr(self, 'args', ()),
+            'kwargs': getattr(self, 'kwargs', {}),
+            'request': request,
+            'filename': filename,
+            'excel_writer_hook': self.create_excel_file,
+            'headers_ordering': HEADERS_ORDERING,
         }
 
     def set_frequency(self):
-        freq = self.request.query_params.get('frequency', 'MS').lower()
+        return self.get_frequency(self.request.query_params)
+
+    @staticmethod
+    def get_frequency(query_params):
+        freq = query_params.get('frequency', 'MS').lower()
         if freq in ['as', 'yearly']:
             return 'AS'
         elif freq in ['qs', 'quarterly']:
@@ -85,122 +145,34 @@ class ReportingViewSet(AuthModelViewSet):
         else:    # Invalid defaults: Monthly
             return 'MS'
 
-    def create_excel_file(self, raw_dataframe, writer):
+    def create_excel_file(self, raw_dataframe, workbook):
+        return self.write_excel_file(
+            raw_dataframe, workbook, self.set_frequency()
+        )
+
+    @classmethod
+    def write_excel_file(cls, raw_dataframe, workbook, frequency):
         # Return if dataframe is empty
         if len(raw_dataframe.index) <= 1:
             return None
-        frequency = self.set_frequency()
-        new_datasets = self._create_datasets(raw_dataframe, frequency)
-        writer = self._format_and_print_workbook(
-            writer, new_datasets, frequency
+        new_datasets = cls._create_datasets(raw_dataframe, frequency)
+        workbook = cls._format_and_print_workbook(
+            workbook, new_datasets, frequency
         )
-        return writer
+        return workbook
 
     @staticmethod
     def _create_datasets(raw_dataframe, frequency):
-        raw_dataframe['start_date'] = raw_dataframe['start_date'].apply(
-            pd.to_datetime
-        )
-        raw_dataframe['end_date'] = raw_dataframe['end_date'].apply(
-            pd.to_datetime
-        )
-
-        # Create some new tables
-        global_summary_data = raw_dataframe.set_index('start_date').query(
-            'is_featured_image == 1'
-        ).resample(frequency).aggregate([np.mean, np.sum])
-        user_summary_data = raw_dataframe.query('is_featured_image == 1'
-                                               ).set_index(
-                                                   ['start_date', 'username']
-                                               )
-        image_summary_data = raw_dataframe.query('is_featured_image == 1'
-                                                ).set_index(
-                                                    [
-                                                        'start_date',
-                                                        'image_name'
-                                                    ]
-                                                )
-
-        # Group things, filter things, drop unneeded columns, rename things
-        global_summary_data = global_summary_data.drop(
-            [
-                'is_featured_image', 'hit_active', 'hit_aborted',
-                'hit_deploy_error', 'hit_error', 'id', 'size.active',
-                'size.cpu', 'size.disk', 'size.id', 'size.mem'
-            ],
-            axis=1
-        )
-        global_summary_data.index.rename('Start Date', inplace=True)
-        global_summary_data.columns = [
-            'Average of Active/Aborted', 'Sum of Active/Aborted',
-            'Average of Active/Aborted/Error', 'Sum of Active/Aborted/Error'
-        ]
-
-        user_summary_data = user_summary_data.groupby(
-            [
-                pd.Grouper(freq=frequency, level=0),
-                user_summary_data.index.get_level_values(1)
-            ]
-        ).aggregate([np.mean, np.sum])
-        user_summary_data = user_summary_data.drop(
-            [
-                'is_featured_image', 'hit_error', 'id', 'size.active',
-                'size.cpu', 'size.disk', 'size.id', 'size.mem'
-            ],
-            axis=1
-        )
-        user_summary_data.index.rename(['Start Date', 'Username'], inplace=True)
-        user_summary_data.columns = [
-            'Average of Active', 'Sum of Active', 'Average of Deploy Error',
-            'Sum of Deploy Error', 'Average of Aborted', 'Sum of Aborted',
-            'Average of Active/Aborted', 'Sum of Active/Aborted',
-            'Average of Active/Aborted/Error', 'Sum of Active/Aborted/Error'
-        ]
-
-        image_summary_data = image_summary_data.groupby(
-            [
-                pd.Grouper(freq=frequency, level=0),
-                image_summary_data.index.get_level_values(1)
-            ]
-        ).aggregate([np.mean, np.sum])
-        image_summary_data = image_summary_data.drop(
-            [
-                'is_featured_image', 'hit_active', 'hit_aborted',
-                'hit_deploy_error', 'hit_error', 'id', 'size.active',
-                'size.cpu', 'size.disk', 'size.id', 'size.mem'
-            ],
-            axis=1
-        )
-        image_summary_data.index.rename(
-            ['Start Date', 'Image Name'], inplace=True
-        )
-        image_summary_data.columns = [
-            'Average of Active/Aborted', 'Sum of Active/Aborted',
-            'Average of Active/Aborted/Error', 'Sum of Active/Aborted/Error'
-        ]
-        raw_dataframe = raw_dataframe.drop(
-            [
-                'size.id', 'size.uuid', 'size.alias', 'size.active',
-                'size.start_date', 'size.end_date', 'size.url'
-            ],
-            axis=1
-        )
-
-        return {
-            'User Summary': user_summary_data,
-            'Image Summary': image_summary_data,
-            'Global Summary': global_summary_data,
-            'Raw Data': raw_dataframe
-        }
+        return create_datasets(raw_dataframe, frequency)
 
     @staticmethod
-    def _format_and_print_workbook(writer, new_datasets, frequency):
+    def _format_and_print_workbook(workbook, new_datasets, frequency):
         raw_dataframe = new_datasets['Raw Data']
         user_summary_data = new_datasets['User Summary']
         image_summary_data = new_datasets['Image Summary']
         global_summary_data = new_datasets['Global Summary']
 
-        # Write summary data to the writer
+        # Write summary data to the workbook
         if frequency in ['AS']:
             summary_format = 'yyyy'
         elif frequency in ['MS', 'QS']:
@@ -210,27 +182,28 @@ class ReportingViewSet(AuthModelViewSet):
         else:
             summary_format = 'mmm d yyyy hh:mm:ss'
 
-        writer.datetime_format = summary_format
-        global_summary_data.to_excel(writer, 'Monthly Summary')
-        image_summary_data.to_excel(writer, 'Image Summary')
-        user_summary_data.to_excel(writer, 'User Summary')
-
-        writer.datetime_format = 'mmm d yyyy hh:mm:ss'
-        raw_dataframe.to_excel(writer, sheet_name='Raw Data')
+        # The workbook is in constant_memory mode, sheets are written row by
+        # row (see write_dataframe)
+        global_summary_ws = write_dataframe(
+            workbook, 'Monthly Summary', global_summary_data, summary_format
+        )
+        image_summary_ws = write_dataframe(
+            workbook, 'Image Summary', image_summary_data, summary_format
+        )
+        user_summary_ws = write_dataframe(
+            workbook, 'User Summary', user_summary_data, summary_format
+        )
+        raw_ws = write_dataframe(
+            workbook, 'Raw Data', raw_dataframe, 'mmm d yyyy hh:mm:ss'
+        )
 
         # FORMAT content:
-        workbook = writer.book
         pct_format = workbook.add_format({'num_format': '0.00%'})
         name_format = workbook.add_format()
         name_format.set_align('left')
 
-        raw_ws = writer.sheets['Raw Data']
-        global_summary_ws = writer.sheets['Monthly Summary']
-        image_summary_ws = writer.sheets['Image Summary']
-        user_summary_ws = writer.sheets['User Summary']
-
         # Add sort/filter around the raw data
-        row_total = len(raw_dataframe.values)
+        row_total = len(raw_dataframe.index)
         col_total = len(raw_dataframe.columns)
         raw_ws.autofilter(0, 0, row_total, col_total)
 
@@ -265,26 +238,62 @@ class ReportingViewSet(AuthModelViewSet):
         user_summary_ws.set_column('I:I', 21, pct_format)
         user_summary_ws.set_column('K:K', 26, pct_format)
 
-        # "Print" the writer to complete the StringIO Buffer
-        writer.save()
-
-        return writer
+        return workbook
 
     def get_queryset(self):
-        request_user = self.request.user
+        return self.get_report_queryset(
+            self.request.user, self.request.query_params
+        )
+
+    @classmethod
+    def get_report_queryset(cls, request_user, query_params):
         if request_user.is_staff or request_user.is_superuser:
             instances_qs = Instance.objects.all()
         elif request_user.is_authenticated():
             instances_qs = Instance.shared_with_user(request_user)
         else:
             raise exceptions.NotAuthenticated()
-        query_params = self.request.query_params
-        query = self.get_filter_query(query_params)
+        query = cls.get_filter_query(query_params)
 
-        queryset = instances_qs.select_related('source').prefetch_related(
+        queryset = instances_qs.select_related(
+            'created_by',
+            'created_by_identity__provider',
             'source__providermachine__application_version__application',
         ).filter(query)
-        return queryset
+        return cls.annotate_reporting(queryset)
+
+    @staticmethod
+    def annotate_reporting(queryset):
+        """
+        Annotate everything read by InstanceReportingSerializer, so that
+        serializing an instance does not query its history or tags.
+        """
+        histories = InstanceStatusHistory.objects.filter(
+            instance=OuterRef('pk')
+        )
+        featured_tags = Tag.objects.filter(
+            application=OuterRef(
+                'source__providermachine__application_version__application'
+            ),
+            name__icontains='featured'
+        )
+        # The last size is the projected one, or the size of the newest
+        # history for instances that have not been projected yet.
+        return queryset.annotate(
+            has_active=Exists(histories.filter(status__name='active')),
+            has_deploy_error=Exists(
+                histories.filter(status__name='deploy_error')
+            ),
+            has_error=Exists(histories.filter(status__name='error')),
+            has_featured_tag=Exists(featured_tags),
+            report_last_size_id=Coalesce(
+                'last_size',
+                Subquery(
+                    histories.order_by('-start_date').values('size_id')[:1]
+                ),
+                output_field=IntegerField()
+            ),
+        )
 
     @staticmethod
     def get_filter_query(query_params):
@@ -319,6 +328,162 @@ class ReportingViewSet(AuthModelViewSet):
 
         return query
 
+    @staticmethod
+    def iter_report_rows(queryset, serializer_context):
+        """
+        Yield the header (HEADERS_ORDERING), then one row per instance.
+        Instances are read with a server-side cursor and serialized
+        REPORTING_EXPORT_CHUNK_SIZE at a time.
+        """
+        chunk_size = getattr(settings, 'REPORTING_EXPORT_CHUNK_SIZE', 2000)
+
+        def serialized_instances():
+            instances = queryset.iterator()
+            while True:
+                chunk = list(islice(instances, chunk_size))
+                if not chunk:
+                    return
+                serializer = InstanceReportingSerializer(
+                    chunk, many=True, context=serializer_context
+                )
+                for item in serializer.data:
+                    yield item
+
+        return CSVRenderer().tablize(
+            serialized_instances(), header=HEADERS_ORDERING
+        )
+
+    @classmethod
+    def write_report(
+        cls, queryset, export_format, file_obj, frequency, serializer_context
+    ):
+        """
+        Write the report of `queryset` to `file_obj`, as CSV or XLSX
+        """
+        rows = cls.iter_report_rows(queryset, serializer_context)
+        if export_format == 'csv':
+            for line in iter_csv(rows):
+                file_obj.write(line)
+            return file_obj
+        header = next(rows)
+        raw_dataframe = pd.DataFrame.from_records(rows, columns=header)
+        return PandasExcelRenderer.write_workbook(
+            raw_dataframe, {
+                'excel_writer_hook':
+                    lambda dataframe, workbook:
+                    cls.write_excel_file(dataframe, workbook, frequency)
+            }, file_obj
+        )
+
+    def get_export_filename(self, export_format):
+        return self.request.query_params.get(
+            'filename', 'instance_reporting.%s' % export_format
+        )
+
+    def stream_report(self, export_format):
+        """
+        Stream the report: CSV rows are sent as they are serialized, the XLSX
+        workbook is written to a temporary file first.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer_context = self.get_serializer_context()
+        if export_format == 'csv':
+            content = iter_csv(
+                self.iter_report_rows(queryset, serializer_context)
+            )
+        else:
+            workbook_file = self.write_report(
+                queryset, export_format, None, self.set_frequency(),
+                serializer_context
+            )
+            content = iter_file(workbook_file)
+        response = StreamingHttpResponse(
+            content, content_type=EXPORT_CONTENT_TYPES[export_format]
+        )
+        response['Content-Disposition'] = 'attachment; filename="%s"' % (
+            self.get_export_filename(export_format),
+        )
+        return response
+
+    def start_export(self, export_format):
+        """
+        Write the report with the `export_instance_report` task, the export
+        is downloaded with `?export_id=<export_id>` once it is ready.
+        """
+        if export_format not in EXPORT_CONTENT_TYPES:
+            return failure_response(
+                status.HTTP_400_BAD_REQUEST, "Reports can be exported as: %s" %
+                sorted(EXPORT_CONTENT_TYPES.keys())
+            )
+        # Validate the query parameters before queueing the export
+        self.get_queryset()
+        export_id = str(uuid.uuid4())
+        write_export_metadata(
+            export_id, {
+                'username': self.request.user.username,
+                'format': export_format,
+                'filename': self.get_export_filename(export_format),
+                'status': 'PENDING'
+            }
+        )
+        app.send_task(
+            "export_instance_report",
+            args=(
+                export_id, self.request.user.username,
+                dict(self.request.query_params.lists()), export_format
+            ),
+            task_id=export_id
+        )
+        return Response(
+            {
+                'export_id': export_id,
+                'status': 'PENDING'
+            },
+            status=status.HTTP_202_ACCEPTED
+        )
+
+    def download_export(self, export_id):
+        export = read_export_metadata(export_id)
+        if not export:
+            return failure_response(
+                status.HTTP_404_NOT_FOUND,
+                "The export %s does not exist or has expired" % export_id
+            )
+        request_user = self.request.user
+        if export['username'] != request_user.username and not (
+            request_user.is_staff or request_user.is_superuser
+        ):
+            return failure_response(
+                status.HTTP_403_FORBIDDEN,
+                "The export %s was requested by another user" % export_id
+            )
+        if export['status'] == 'FAILURE':
+            return failure_response(
+                status.HTTP_500_INTERNAL_SERVER_ERROR,
+                "The export %s failed" % export_id
+            )
+        if export['status'] != 'SUCCESS':
+            return Response(
+                {
+                    'export_id': export_id,
+                    'status': export['status']
+                },
+                status=status.HTTP_202_ACCEPTED
+            )
+        path = get_export_path(export_id, export['format'])
+        if not os.path.exists(path):
+            return failure_response(
+                status.HTTP_404_NOT_FOUND,
+                "The export %s does not exist or has expired" % export_id
+            )
+        response = StreamingHttpResponse(
+            iter_file(open(path, 'rb')),
+            content_type=EXPORT_CONTENT_TYPES[export['format']]
+        )
+        response['Content-Disposition'
+                ] = 'attachment; filename="%s"' % (export['filename'], )
+        return response
+
     def get(self, request, pk=None):
         """
         Force an abnormal behavior for 'details' calls (force a list call)
@@ -336,7 +501,14 @@ class ReportingViewSet(AuthModelViewSet):
                 "The reporting API should be accessed via the query parameters:"
                 " ['start_date', 'end_date', 'provider_id']"
             )
+        if 'export_id' in query_params:
+            return self.download_export(query_params['export_id'])
+        export_format = request.accepted_renderer.format
         try:
+            if 'export' in query_params:
+                return self.start_export(query_params['export'])
+            if export_format in EXPORT_CONTENT_TYPES:
+                return self.stream_report(export_format)
             results = super(ReportingViewSet,
                             self).list(request, *args, **kwargs)
         except ValueError:
@@ -69,6 +69,7 @@ PERIODIC_TASKS = [
     "clear_empty_ips_for",
     "remove_empty_networks",
     "remove_empty_networks_for",
+    "precompute_application_metrics_task",
     #JETSTREAM_SPECIFIC PERIODIC TASKS
     "report_allocations_to_tas",
     "update_snapshot",
@@ -76,6 +77,8 @@ PERIODIC_TASKS = [
     #ALLOCATION SOURCES - PERIODIC TASKS
     "update_snapshot_cyverse",
     "update_snapshot_cyverse_for",
+    "compute_snapshot_usage_cyverse",
+    "save_snapshots_cyverse",
     "allocation_threshold_check",
 ]
 SHORT_TASKS = [
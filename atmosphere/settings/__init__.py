@@ -18,6 +18,66 @@ DEBUG = True
 
 # Enforcing mode -- False, unless set otherwise. (ONLY ONE Production server should be set to 'ENFORCING'.)
 ENFORCING = False
+# Over-allocation enforcement runs at most ENFORCEMENT_CONCURRENCY provider
+# actions at once (per provider). After each action the instance is polled every
+# ENFORCEMENT_POLL_INTERVAL seconds, for up to ENFORCEMENT_TIMEOUT seconds,
+# until it leaves the active state.
+ENFORCEMENT_CONCURRENCY = 4
+ENFORCEMENT_POLL_INTERVAL = 2
+ENFORCEMENT_TIMEOUT = 120
+# monitor_instances_for reads the identities, instances and histories of every
+# tenant up front and only writes the instances that changed. Set to False to
+# fall back to converting each tenant's instances one at a time.
+MONITOR_INSTANCES_BULK_RECONCILE = True
+# monitor_machines_for loads every machine of the provider up front, and writes
+# MONITOR_MACHINES_BATCH_SIZE machines per transaction. Set to False to sync
+# one machine at a time.
+MONITOR_MACHINES_BULK_SYNC = True
+MONITOR_MACHINES_BATCH_SIZE = 500
+# In bulk mode, image members are fetched MONITOR_MACHINES_MEMBER_CONCURRENCY
+# images at a time. Memberships are only ever added, unless
+# MONITOR_MACHINES_REMOVE_MEMBERSHIP also removes the groups that are no
+# longer in an image's access list.
+MONITOR_MACHINES_MEMBER_CONCURRENCY = 8
+MONITOR_MACHINES_REMOVE_MEMBERSHIP = False
+# Sizes that the cloud does not list are looked up
+# MONITOR_SIZES_LOOKUP_CONCURRENCY at a time. A size that is not found is not
+# looked up again for MONITOR_SIZES_MISSING_BACKOFF seconds, doubling after
+# every miss up to MONITOR_SIZES_MISSING_MAX_BACKOFF.
+MONITOR_SIZES_LOOKUP_CONCURRENCY = 4
+MONITOR_SIZES_MISSING_BACKOFF = 60 * 60
+MONITOR_SIZES_MISSING_MAX_BACKOFF = 7 * 24 * 60 * 60
+# At most TAS_API_CONCURRENCY requests are made to the TAS API at a time, while
+# resolving TACC usernames and sending allocation reports.
+TAS_API_CONCURRENCY = 4
+# EventTable payload lookups use the payload expression indexes, unless
+# EVENT_TABLE_USE_PROJECTION reads the projection columns instead (Fill those
+# with `./manage.py backfill_event_projection` before setting it).
+EVENT_TABLE_USE_PROJECTION = False
+
+# service.cache keeps cloud instance listings fresh for INSTANCE_CACHE_TTL
+# seconds. For INSTANCE_CACHE_STALE_TTL seconds after that, reads return the
+# stale listing while it is refreshed in the background. One worker at a time
+# refreshes a listing, holding a lock for at most INSTANCE_CACHE_LOCK_TIMEOUT.
+INSTANCE_CACHE_TTL = 30
+INSTANCE_CACHE_STALE_TTL = 300
+INSTANCE_CACHE_LOCK_TIMEOUT = 120
+
+# Instance metrics (graphite, see METRIC_SERVER) are requested
+# METRICS_BATCH_SIZE instances per call, up to METRICS_CONCURRENCY calls at
+# once. The API accepts at most METRICS_MAX_INSTANCES instances per request.
+METRICS_BATCH_SIZE = 25
+METRICS_CONCURRENCY = 4
+METRICS_REQUEST_TIMEOUT = 30
+METRICS_MAX_INSTANCES = 100
+
+# The reporting API streams CSV/XLSX exports, serializing
+# REPORTING_EXPORT_CHUNK_SIZE instances at a time. Exports requested with
+# `?export=<format>` are written to REPORTING_EXPORT_DIR (which the API and the
+# celery workers must share) and removed after REPORTING_EXPORT_MAX_AGE seconds.
+REPORTING_EXPORT_CHUNK_SIZE = 2000
+REPORTING_EXPORT_DIR = '/tmp/atmosphere-reports'
+REPORTING_EXPORT_MAX_AGE = 24 * 60 * 60
 
 CHECK_THRESHOLD = False
 
@@ -420,6 +480,13 @@ CELERY_EVENT_SERIALIZER = "pickle"
 
 # Related to Broker and ResultBackend
 REDIS_CONNECT_RETRY = True
+
+# Shared redis client (core.redis_client) for caches and metrics.
+# Each process keeps a pool of at most REDIS_MAX_CONNECTIONS connections, and
+# waits up to REDIS_POOL_TIMEOUT seconds for a free one.
+REDIS_URL = 'redis://localhost:6379/0'
+REDIS_MAX_CONNECTIONS = 50
+REDIS_POOL_TIMEOUT = 20
 # General Celery Settings
 #
 CELERY_ROUTES = ('atmosphere.celery_router.CloudRouter', )
@@ -505,6 +572,15 @@ CELERYBEAT_SCHEDULE = {
                 "expires": 60 * 60
             }
         },
+    "precompute_application_metrics":
+        {
+            "task": "precompute_application_metrics_task",
+            "schedule": timedelta(minutes=60),
+            "options": {
+                "expires": 10 * 60,
+                "time_limit": 10 * 60
+            }
+        },
 }
 
 #     # Django-Celery Development settings
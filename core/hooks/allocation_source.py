@@ -33,20 +33,13 @@ def listen_before_allocation_snapshot_changes(sender, instance, raw, **kwargs):
     event = instance
     if event.name != 'allocation_source_snapshot':
         return None
-    # Circular dep...
-    from core.models import EventTable
-
     payload = event.payload
     allocation_source_name = payload['allocation_source_name']
-    new_compute_used = payload['compute_used']
-    threshold_values = getattr(settings, "ALLOCATION_SOURCE_WARNINGS", [])
-    source = AllocationSource.objects.filter(name=allocation_source_name).last()
-    if new_compute_used == 0:
+    if payload['compute_used'] == 0:
         return
+    source = AllocationSource.objects.filter(name=allocation_source_name).last()
     if not source:
         return
-    if source.compute_allowed in [None, 0]:
-        return
     prev_snapshot = AllocationSourceSnapshot.objects.filter(
         allocation_source=source
     ).first()
@@ -56,6 +49,57 @@ def listen_before_allocation_snapshot_changes(sender, instance, raw, **kwargs):
         prev_compute_used = 0
     else:
         prev_compute_used = float(prev_snapshot.compute_used)
+    _check_allocation_threshold(
+        source, allocation_source_name, prev_compute_used,
+        payload['compute_used']
+    )
+
+
+def listen_before_allocation_snapshot_changes_batch(sender, events):
+    """
+    Batch form of `listen_before_allocation_snapshot_changes`:
+    Events are checked in order, each against the usage of the previous event
+    of its allocation source in the batch (or, for the first one, the saved
+    snapshot) -- as if they had been saved one at a time.
+    """
+    names = set(event.payload['allocation_source_name'] for event in events)
+    sources = dict(
+        (source.name, source) for source in AllocationSource.objects.
+        filter(name__in=names).order_by('id')
+    )
+    compute_used = dict(
+        (name, float(used))
+        for name, used in AllocationSourceSnapshot.objects.filter(
+            allocation_source__name__in=sources.keys()
+        ).values_list('allocation_source__name', 'compute_used')
+    )
+    for event in events:
+        payload = event.payload
+        allocation_source_name = payload['allocation_source_name']
+        new_compute_used = payload['compute_used']
+        source = sources.get(allocation_source_name)
+        if source and new_compute_used != 0:
+            _check_allocation_threshold(
+                source, allocation_source_name,
+                compute_used.get(allocation_source_name, 0), new_compute_used
+            )
+        compute_used[allocation_source_name] = new_compute_used
+
+
+def _check_allocation_threshold(
+    source, allocation_source_name, prev_compute_used, new_compute_used
+):
+    """
+    Fire `allocation_source_threshold_met` (once per threshold) when the usage
+    of `source` crosses one of the settings.ALLOCATION_SOURCE_WARNINGS
+    percentages going from `prev_compute_used` to `new_compute_used`.
+    """
+    # Circular dep...
+    from core.models import EventTable
+
+    threshold_values = getattr(settings, "ALLOCATION_SOURCE_WARNINGS", [])
+    if source.compute_allowed in [None, 0]:
+        return
     prev_percentage = int(100.0 * prev_compute_used / source.compute_allowed)
     current_percentage = int(100.0 * new_compute_used / source.compute_allowed)
     print "Souce: %s (%s) Previous:%s - New:%s" % (
@@ -247,6 +291,66 @@ def listen_for_user_snapshot_changes(sender, instance, created, **kwargs):
     return snapshot
 
 
+def listen_for_allocation_snapshot_changes_batch(sender, events):
+    """
+    Batch form of `listen_for_allocation_snapshot_changes`:
+    Only the last snapshot of each allocation source is applied.
+    """
+    payloads = {}
+    for event in events:
+        payloads[event.payload['allocation_source_name']] = event.payload
+    # Like `.last()`, prefer the newest source for a name
+    sources = dict(
+        (source.name, source) for source in AllocationSource.objects.
+        filter(name__in=payloads.keys()).order_by('id')
+    )
+    for allocation_source_name, payload in payloads.items():
+        allocation_source = sources.get(allocation_source_name)
+        if not allocation_source:
+            continue
+        AllocationSourceSnapshot.objects.update_or_create(
+            allocation_source=allocation_source,
+            defaults={
+                'compute_used': payload['compute_used'],
+                'global_burn_rate': payload['global_burn_rate']
+            }
+        )
+
+
+def listen_for_user_snapshot_changes_batch(sender, events):
+    """
+    Batch form of `listen_for_user_snapshot_changes`:
+    Only the last snapshot of each User+AllocationSource is applied.
+    """
+    payloads = {}
+    for event in events:
+        payload = event.payload
+        payloads[(payload['allocation_source_name'],
+                  payload['username'])] = payload
+    sources = dict(
+        (source.name, source) for source in AllocationSource.objects.
+        filter(name__in=set(name
+                            for name, _ in payloads.keys())).order_by('id')
+    )
+    users = dict(
+        (user.username, user) for user in AtmosphereUser.objects.
+        filter(username__in=set(username for _, username in payloads.keys()))
+    )
+    for (allocation_source_name, username), payload in payloads.items():
+        allocation_source = sources.get(allocation_source_name)
+        user = users.get(username)
+        if not allocation_source or not user:
+            continue
+        UserAllocationSnapshot.objects.update_or_create(
+            allocation_source=allocation_source,
+            user=user,
+            defaults={
+                'burn_rate': payload['burn_rate'],
+                'compute_used': payload['compute_used']
+            }
+        )
+
+
 ## EVENT FIRED WHEN USER IS REMOVED FROM AN ALLOCATION SOURCE
 
 
@@ -276,6 +380,9 @@ def listen_for_instance_allocation_changes(sender, instance, created, **kwargs):
     if event.name != 'instance_allocation_source_changed':
         return None
     logger.info("Instance allocation changed event: %s" % event.__dict__)
+    # Usage recorded after this event is now billed to a different source
+    from service.allocation_ledger import invalidate_ledger
+    invalidate_ledger(event.timestamp, username=event.entity_id)
     payload = event.payload
     assert 'allocation_source_name' in payload    # TODO: Standardize? And a schema?
 
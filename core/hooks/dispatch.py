@@ -0,0 +1,115 @@
+"""
+Dispatch EventTable signals to the hooks subscribed to the event name.
+
+Hooks are registered with `register_event_hook` (see the bottom of
+`core.models.event_table`). Saving an event only calls the hooks registered
+for `event.name`, and the number of calls and time spent in each hook are
+counted per event name (see `get_hook_timings`).
+"""
+import threading
+import time
+from collections import defaultdict, OrderedDict
+
+PRE_SAVE = 'pre_save'
+POST_SAVE = 'post_save'
+
+# signal -> event name -> [(hook, batch_hook), ...]
+_event_hooks = {
+    PRE_SAVE: defaultdict(list),
+    POST_SAVE: defaultdict(list),
+}
+# event name -> hook name -> [number of calls, total seconds]
+_hook_timings = defaultdict(lambda: defaultdict(lambda: [0, 0.0]))
+_hook_timings_lock = threading.Lock()
+
+
+def register_event_hook(event_name, hook, signal=POST_SAVE, batch_hook=None):
+    """
+    Subscribe `hook` to the `signal` of events named `event_name`.
+
+    hook: Called like a django signal receiver, for a single event.
+    batch_hook: (Optional) Called as `batch_hook(sender, events)` once for all
+                the events of that name in a batch (See `dispatch_events`).
+    """
+    _event_hooks[signal][event_name].append((hook, batch_hook))
+
+
+def _timed_call(event_name, hook, *args, **kwargs):
+    started = time.time()
+    try:
+        return hook(*args, **kwargs)
+    finally:
+        elapsed = time.time() - started
+        hook_name = getattr(hook, '__name__', repr(hook))
+        with _hook_timings_lock:
+            timing = _hook_timings[event_name][hook_name]
+            timing[0] += 1
+            timing[1] += elapsed
+
+
+def dispatch_pre_save(sender, instance, raw, **kwargs):
+    for hook, _ in _event_hooks[PRE_SAVE].get(instance.name, []):
+        _timed_call(
+            instance.name, hook, sender, instance=instance, raw=raw, **kwargs
+        )
+
+
+def dispatch_post_save(sender, instance, created, **kwargs):
+    for hook, _ in _event_hooks[POST_SAVE].get(instance.name, []):
+        _timed_call(
+            instance.name,
+            hook,
+            sender,
+            instance=instance,
+            created=created,
+            **kwargs
+        )
+
+
+def dispatch_events(sender, events, signal):
+    """
+    Fire the `signal` hooks for a batch of events (created with `bulk_create`).
+
+    Events are grouped by name, in the order each name first appears.
+    A hook with a `batch_hook` is called once per group, any other hook is
+    called once per event of the group.
+    """
+    events_by_name = OrderedDict()
+    for event in events:
+        events_by_name.setdefault(event.name, []).append(event)
+    for event_name, named_events in events_by_name.items():
+        for hook, batch_hook in _event_hooks[signal].get(event_name, []):
+            if batch_hook:
+                _timed_call(event_name, batch_hook, sender, named_events)
+                continue
+            for event in named_events:
+                if signal == PRE_SAVE:
+                    _timed_call(
+                        event_name, hook, sender, instance=event, raw=False
+                    )
+                else:
+                    _timed_call(
+                        event_name, hook, sender, instance=event, created=True
+                    )
+
+
+def get_hook_timings():
+    """
+    Return a dict of event name -> hook name -> (number of calls, total
+    seconds), counted since the process started (or `reset_hook_timings`).
+    """
+    with _hook_timings_lock:
+        return dict(
+            (
+                event_name,
+                dict(
+                    (hook_name, tuple(timing))
+                    for hook_name, timing in timings.items()
+                )
+            ) for event_name, timings in _hook_timings.items()
+        )
+
+
+def reset_hook_timings():
+    with _hook_timings_lock:
+        _hook_timings.clear()
@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+
+from core.models import EventTable
+from core.models.event_table import PROJECTED_PAYLOAD_KEYS
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the payload projection columns of existing events. "
+        "Afterwards, set EVENT_TABLE_USE_PROJECTION = True to query them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50000,
+            help="Number of event IDs updated per transaction"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_id = EventTable.objects.aggregate(Max('id'))['id__max'] or 0
+        qn = connection.ops.quote_name
+        assignments = ', '.join(
+            "%s = LEFT(payload ->> %%s, 255)" % qn(key)
+            for key in PROJECTED_PAYLOAD_KEYS
+        )
+        sql = "UPDATE %s SET %s WHERE id >= %%s AND id < %%s" % (
+            qn(EventTable._meta.db_table), assignments
+        )
+        updated = 0
+        started = time.time()
+        for first_id in range(0, max_id + 1, batch_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    sql,
+                    list(PROJECTED_PAYLOAD_KEYS) +
+                    [first_id, first_id + batch_size]
+                )
+                updated += cursor.rowcount
+            self.stdout.write(
+                "Updated events up to ID %s (%s rows)" %
+                (min(first_id + batch_size, max_id), updated)
+            )
+        self.stdout.write(
+            "Filled the projection of %s events in %.1f seconds" %
+            (updated, time.time() - started)
+        )
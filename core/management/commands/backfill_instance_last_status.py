@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max
+
+from core.models import Instance
+
+BACKFILL_SQL = """
+UPDATE instance
+SET last_status = newest.status_name,
+    last_activity = newest.activity,
+    last_size_id = newest.size_id,
+    last_status_date = newest.start_date
+FROM (
+    SELECT DISTINCT ON (history.instance_id)
+           history.instance_id, status.name AS status_name, history.activity,
+           history.size_id, history.start_date
+    FROM instance_status_history history
+    JOIN instance_status status ON status.id = history.status_id
+    WHERE history.instance_id >= %(first_id)s
+      AND history.instance_id < %(last_id)s
+    ORDER BY history.instance_id, history.start_date DESC
+) AS newest
+WHERE instance.id = newest.instance_id
+  AND (%(reset)s OR instance.last_status_date IS NULL
+       OR instance.last_status_date <= newest.start_date)
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the last status projection (last_status, last_activity, "
+        "last_size and last_status_date) of existing instances from their "
+        "newest InstanceStatusHistory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Number of instance IDs updated per transaction"
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Also overwrite projections newer than the newest history "
+            "(e.g. after histories were deleted)"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_id = Instance.objects.aggregate(Max('id'))['id__max'] or 0
+        updated = 0
+        started = time.time()
+        for first_id in range(0, max_id + 1, batch_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    BACKFILL_SQL, {
+                        'first_id': first_id,
+                        'last_id': first_id + batch_size,
+                        'reset': options['reset'],
+                    }
+                )
+                updated += cursor.rowcount
+            self.stdout.write(
+                "Updated instances up to ID %s (%s rows)" %
+                (min(first_id + batch_size, max_id), updated)
+            )
+        self.stdout.write(
+            "Filled the last status of %s instances in %.1f seconds" %
+            (updated, time.time() - started)
+        )
@@ -0,0 +1,169 @@
+"""
+Bounded, expiring memoization for long-running (celery) processes.
+
+A `Memo` holds at most `max_size` entries (least recently used are evicted
+first), each of which expires `ttl` seconds after it was stored, and counts
+its hits and misses. Use `Memo.scope()` (or `memo_scope`) to drop everything
+a task has memoized once that task completes:
+
+    @memoize(max_size=256, ttl=600, key=lambda driver, machine: machine.id)
+    def get_image(driver, machine):
+        ...
+
+    with get_image.memo.scope():
+        for machine in machines:
+            get_image(driver, machine)
+
+Memos created with `memoize(task_scoped=True)` are also cleared after every
+celery task that runs in the process.
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+from celery.signals import task_postrun
+from threepio import logger
+
+_MISSING = object()
+# Memos cleared after every celery task (See `clear_task_scoped_memos`)
+_task_scoped_memos = []
+
+
+class Memo(object):
+    def __init__(self, name, max_size=1024, ttl=None):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()    # key -> (expires_at, value)
+        self._lock = threading.RLock()
+        self._scope_depth = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.time():
+                    # Re-insert as the most recently used
+                    self._entries[key] = entry
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires_at, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key, compute, cache_none=False):
+        """
+        Return the memoized value of `key`, or store and return `compute()`.
+        Falsy results are not memoized, unless `cache_none` is set.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = compute()
+        if value or cache_none:
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key=_MISSING):
+        """
+        Forget `key` (or every entry, if no key is given).
+        """
+        with self._lock:
+            if key is _MISSING:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    @contextmanager
+    def scope(self):
+        """
+        Forget every entry when the (outermost) scope exits.
+        """
+        with self._lock:
+            self._scope_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._scope_depth -= 1
+                if self._scope_depth == 0:
+                    self._entries.clear()
+
+
+@contextmanager
+def memo_scope(*memos):
+    """
+    Scope several memos at once (See `Memo.scope`)
+    """
+    if not memos:
+        yield
+        return
+    with memos[0].scope():
+        with memo_scope(*memos[1:]):
+            yield
+
+
+def memoize(
+    max_size=1024, ttl=None, key=None, cache_none=False, task_scoped=False
+):
+    """
+    Decorate a function with a `Memo` (available as `function.memo`).
+
+    key - Called with the function's arguments to build the memo key.
+          Defaults to the positional arguments themselves.
+    task_scoped - Forget every entry after each celery task.
+    """
+
+    def decorator(func):
+        memo = Memo(func.__name__, max_size=max_size, ttl=ttl)
+        if task_scoped:
+            _task_scoped_memos.append(memo)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            memo_key = key(*args, **kwargs) if key else args
+            return memo.get_or_set(
+                memo_key, lambda: func(*args, **kwargs), cache_none=cache_none
+            )
+
+        wrapper.memo = memo
+        return wrapper
+
+    return decorator
+
+
+def clear_task_scoped_memos(**kwargs):
+    for memo in _task_scoped_memos:
+        if len(memo):
+            logger.debug("Clearing memo %s" % memo.stats())
+        memo.invalidate()
+
+
+task_postrun.connect(clear_task_scoped_memos, weak=False)
@@ -1,28 +1,60 @@
 import pickle
 import collections
-import redis
 
+from django.db.models import Count
+from django.utils import timezone
 from threepio import logger
+
 from core.models import Instance
+from core.redis_client import get_many, set_many
 
 METRICS_CACHE_DURATION = 4 * 24 * 60 * 60    # 4 days (persist over the weekend)
+# Refresh every application well before the untouched metrics expire
+METRICS_FULL_REFRESH_INTERVAL = METRICS_CACHE_DURATION / 2
+# When `precompute_application_metrics` last ran, and last refreshed every
+# application (both expire with the metrics)
+METRICS_LAST_RUN_KEY = "metrics-application-summary-last-run"
+METRICS_LAST_FULL_RUN_KEY = "metrics-application-summary-last-full-run"
+
+
+def _application_metrics_key(application_id):
+    return "metrics-application-summary-%s" % (application_id)
 
 
 def _get_summarized_application_metrics(
     application, force=False, read_only=False
 ):
-    metrics = collections.OrderedDict()
-    redis_cache = redis.StrictRedis()
-    key = "metrics-application-summary-%s" % (application.id)
+    return get_summarized_application_metrics_many(
+        [application], force=force, read_only=read_only
+    ).get(application.id, collections.OrderedDict())
+
+
+def get_summarized_application_metrics_many(
+    applications, force=False, read_only=False
+):
+    """
+    Return a dict of application ID -> summarized metrics.
+    Cached metrics are read (and missing metrics written) in one round trip.
+    """
+    metrics = {}
     try:
-        if redis_cache.exists(key) and not force:
-            pickled_object = redis_cache.get(key)
-            metrics = pickle.loads(pickled_object)
-        elif not read_only:
-            metrics = calculate_summarized_application_metrics(application)
-            pickled_object = pickle.dumps(metrics)
-            redis_cache.set(key, pickled_object)
-            redis_cache.expire(key, METRICS_CACHE_DURATION)
+        keys = [
+            _application_metrics_key(application.id)
+            for application in applications
+        ]
+        cached_metrics = [None] * len(keys) if force else get_many(keys)
+        missing_metrics = {}
+        for application, key, pickled_object in zip(
+            applications, keys, cached_metrics
+        ):
+            if pickled_object:
+                metrics[application.id] = pickle.loads(pickled_object)
+            elif not read_only:
+                metrics[
+                    application.id
+                ] = calculate_summarized_application_metrics(application)
+                missing_metrics[key] = pickle.dumps(metrics[application.id])
+        set_many(missing_metrics, expire=METRICS_CACHE_DURATION)
     except:
         logger.exception("Unexpected errror in application metrics")
     return metrics
@@ -49,6 +81,15 @@ def calculate_summarized_application_metrics(app):
     total_successful = app_instances.filter(
         instancestatushistory__status__name='active'
     ).distinct().count()
+    return _to_application_metrics(
+        num_forks, num_bookmarked, num_in_projects, total_launched,
+        total_successful
+    )
+
+
+def _to_application_metrics(
+    num_forks, num_bookmarked, num_in_projects, total_launched, total_successful
+):
     success_pct = 0.0
     if total_launched != 0:
         success_pct = total_successful / float(total_launched) * 100
@@ -65,3 +106,111 @@ def calculate_summarized_application_metrics(app):
             }
     }
     return application_metrics
+
+
+def _count_by(queryset, application_field, application_ids, distinct=False):
+    """
+    Return a dict of application ID -> # of rows in `queryset`
+    """
+    if application_ids is not None:
+        queryset = queryset.filter(
+            **{"%s__in" % application_field: application_ids}
+        )
+    return dict(
+        queryset.order_by().values_list(application_field).annotate(
+            count=Count('id', distinct=distinct)
+        )
+    )
+
+
+def calculate_summarized_application_metrics_many(application_ids=None):
+    """
+    Bulk form of `calculate_summarized_application_metrics`
+    Returns a dict of application ID -> metrics, for `application_ids`
+    (or every application), using one grouped query per metric.
+    """
+    from core.models import (
+        Application, ApplicationBookmark, MachineRequest, Project
+    )
+    app_field = 'source__providermachine__application_version__application_id'
+    forks = _count_by(
+        MachineRequest.objects.filter(
+            status__name='completed', new_version_forked=True
+        ), 'instance__' + app_field, application_ids
+    )
+    bookmarks = _count_by(
+        ApplicationBookmark.objects.all(), 'application_id', application_ids
+    )
+    projects = _count_by(
+        Project.applications.through.objects.all(), 'application_id',
+        application_ids
+    )
+    launched = _count_by(Instance.objects.all(), app_field, application_ids)
+    successful = _count_by(
+        Instance.objects.filter(instancestatushistory__status__name='active'),
+        app_field,
+        application_ids,
+        distinct=True
+    )
+    if application_ids is None:
+        application_ids = Application.objects.values_list('id', flat=True)
+    return dict(
+        (
+            application_id,
+            _to_application_metrics(
+                forks.get(application_id, 0), bookmarks.get(application_id, 0),
+                projects.get(application_id, 0), launched.
+                get(application_id, 0), successful.get(application_id, 0)
+            )
+        ) for application_id in application_ids
+    )
+
+
+def applications_with_new_instances(since):
+    """
+    Return the IDs of the applications launched, or that became active,
+    since `since`.
+    """
+    app_field = 'source__providermachine__application_version__application_id'
+    launched = Instance.objects.filter(start_date__gte=since)
+    activated = Instance.objects.filter(
+        instancestatushistory__status__name='active',
+        instancestatushistory__start_date__gte=since
+    )
+    application_ids = set(launched.values_list(app_field, flat=True))
+    application_ids.update(activated.values_list(app_field, flat=True))
+    application_ids.discard(None)
+    return application_ids
+
+
+def precompute_application_metrics(incremental=True):
+    """
+    Calculate and cache the summarized metrics of many applications at once.
+
+    incremental - Only refresh the applications with new instances since the
+                  last run. The first run, a run after the cache has been
+                  flushed, and the first run METRICS_FULL_REFRESH_INTERVAL
+                  after the last full run refresh every application.
+    Returns the number of applications refreshed.
+    """
+    started = timezone.now()
+    last_run, last_full_run = get_many(
+        [METRICS_LAST_RUN_KEY, METRICS_LAST_FULL_RUN_KEY]
+    )
+    application_ids = None
+    if incremental and last_run and last_full_run and (
+        started - pickle.loads(last_full_run)
+    ).total_seconds() < METRICS_FULL_REFRESH_INTERVAL:
+        application_ids = applications_with_new_instances(
+            pickle.loads(last_run)
+        )
+    all_metrics = calculate_summarized_application_metrics_many(application_ids)
+    cached_metrics = dict(
+        (_application_metrics_key(application_id), pickle.dumps(metrics))
+        for application_id, metrics in all_metrics.items()
+    )
+    cached_metrics[METRICS_LAST_RUN_KEY] = pickle.dumps(started)
+    if application_ids is None:
+        cached_metrics[METRICS_LAST_FULL_RUN_KEY] = pickle.dumps(started)
+    set_many(cached_metrics, expire=METRICS_CACHE_DURATION)
+    return len(all_metrics)
@@ -2,15 +2,18 @@
  Instance metrics stored in graphite
 """
 import json
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from django.conf import settings
-import redis
 import requests
 
 from rest_framework.exceptions import NotFound
 
 from threepio import logger
 
+from core.redis_client import get_many, set_many
+
 # The hyper-stats service fetches metrics every minute
 CACHE_DURATION = 60
 
@@ -22,17 +25,89 @@ DEFAULT_RESOLUTION = 1
 #: Maximum time period is only two weeks
 MAXIMUM_TIME_PERIOD = 1209600
 
+# Pooled HTTP session for graphite, and the requests in-flight (by URI)
+_session = None
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _in_flight_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_maxsize=_metrics_concurrency()
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def _metrics_concurrency():
+    return getattr(settings, 'METRICS_CONCURRENCY', 4)
+
+
+def _coalesced_get(uri):
+    """
+    GET the JSON at `uri`. Identical requests that are already in-flight
+    (in this process) are not repeated, they wait for the same response.
+    """
+    with _in_flight_lock:
+        future = _in_flight.get(uri)
+        is_owner = future is None
+        if is_owner:
+            future = _in_flight[uri] = Future()
+    if not is_owner:
+        return future.result()
+    try:
+        r = _get_session().get(
+            uri, timeout=getattr(settings, 'METRICS_REQUEST_TIMEOUT', 30)
+        )
+        if r.status_code != 200:
+            raise NotFound()
+        result = r.json()
+    except Exception as exc:
+        future.set_exception(exc)
+        raise
+    else:
+        future.set_result(result)
+        return result
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(uri, None)
+
 
 def request_instance_metrics(uuid, params):
     uri = create_request_uri(uuid, params)
-    r = requests.get(uri)
-    if r.status_code != 200:
-        raise NotFound()
-    return r.json()
+    return _coalesced_get(uri)
+
+
+def request_instance_metrics_many(uuids, params):
+    """
+    Request the metrics of many instances with a single graphite call.
+    Returns a dict of uuid -> list of series (like `request_instance_metrics`)
+    """
+    uri = create_batch_request_uri(uuids, params)
+    if len(uuids) == 1:
+        return {uuids[0]: _coalesced_get(uri)}
+    metrics = dict((uuid, []) for uuid in uuids)
+    for series in _coalesced_get(uri):
+        # The series are named after their target, which includes the uuid
+        for uuid in uuids:
+            if uuid in series.get("target", ""):
+                metrics[uuid].append(series)
+                break
+    return metrics
 
 
 def create_request_uri(uuid, params):
-    endpoint = "{server}/render/?target={target}&format={format}"
+    return create_batch_request_uri([uuid], params)
+
+
+def _create_target(uuid, params):
     query = "stats.*.{uuid}.{field}"
     summarize = "summarize({metric}, {resolution}, 'avg')"
     metric = query.format(uuid=uuid, field=params.get("field"))
@@ -51,11 +126,22 @@ def create_request_uri(uuid, params):
         target = summarize.format(metric=metric, resolution=res)
     else:
         target = metric
+    return target
+
+
+def create_batch_request_uri(uuids, params):
+    endpoint = "{server}/render/?{targets}&format={format}"
 
     fields = {
-        "server": settings.METRIC_SERVER,
-        "target": target,
-        "format": "json"
+        "server":
+            settings.METRIC_SERVER,
+        "targets":
+            "&".join(
+                "target={}".format(_create_target(uuid, params))
+                for uuid in uuids
+            ),
+        "format":
+            "json"
     }
 
     request_uri = endpoint.format(**fields)
@@ -102,24 +188,81 @@ def params_to_fields(params):
 
 
 def _to_instance_key(instance, fields):
-    inputs = [instance.provider_alias] + fields.values()
+    # Sorted, so that the key does not depend on the order of the dict
+    inputs = [instance.provider_alias] + [
+        "{}={}".format(name, fields[name]) for name in sorted(fields)
+    ]
     return ":".join(map(str, inputs))
 
 
 def get_instance_metrics(instance, params=None):
+    return get_instance_metrics_many([instance],
+                                     params)[instance.provider_alias]
+
+
+def get_instance_metrics_many(instances, params=None):
+    """
+    Return a dict of instance provider_alias -> metrics.
+
+    Cached metrics are read from redis in one round trip. The rest are
+    requested from graphite METRICS_BATCH_SIZE instances at a time, with up
+    to METRICS_CONCURRENCY requests in parallel.
+    """
     fields = params_to_fields(params)
-    key = _to_instance_key(instance, fields)
-    redis_cache = redis.StrictRedis()
-    instance_metrics = {}
+    if params is None:
+        params = {}
+    keys = dict(
+        (instance.provider_alias, _to_instance_key(instance, fields))
+        for instance in instances
+    )
+    instance_metrics = dict((uuid, {}) for uuid in keys)
     try:
-        if redis_cache.exists(key):
-            instance_metrics = json.loads(redis_cache.get(key))
-        else:
-            instance_metrics = request_instance_metrics(
-                instance.provider_alias, params=params
-            )
-            redis_cache.set(key, json.dumps(instance_metrics))
-            redis_cache.expire(key, CACHE_DURATION)
+        uuids = keys.keys()
+        missing_uuids = []
+        for uuid, cached_metrics in zip(
+            uuids, get_many([keys[uuid] for uuid in uuids])
+        ):
+            if cached_metrics:
+                instance_metrics[uuid] = json.loads(cached_metrics)
+            else:
+                missing_uuids.append(uuid)
+    except Exception:
+        logger.exception("Failed to retrieve cached metrics")
+        missing_uuids = keys.keys()
+    if not missing_uuids:
+        return instance_metrics
+
+    batch_size = getattr(settings, 'METRICS_BATCH_SIZE', 25)
+    batches = [
+        missing_uuids[idx:idx + batch_size]
+        for idx in range(0, len(missing_uuids), batch_size)
+    ]
+
+    def _request_batch(uuids):
+        try:
+            return request_instance_metrics_many(uuids, params)
+        except Exception:
+            logger.exception("Failed to retrieve metrics")
+            return {}
+
+    new_metrics = {}
+    if len(batches) == 1:
+        new_metrics.update(_request_batch(batches[0]))
+    else:
+        with ThreadPoolExecutor(
+            max_workers=min(_metrics_concurrency(), len(batches))
+        ) as executor:
+            for batch_metrics in executor.map(_request_batch, batches):
+                new_metrics.update(batch_metrics)
+    instance_metrics.update(new_metrics)
+    try:
+        set_many(
+            dict(
+                (keys[uuid], json.dumps(metrics))
+                for uuid, metrics in new_metrics.items()
+            ),
+            expire=CACHE_DURATION
+        )
     except Exception:
-        logger.exception("Failed to retrieve metrics")
+        logger.exception("Failed to cache metrics")
     return instance_metrics
@@ -0,0 +1,106 @@
+"""
+Summaries of the instance reports (see api.v2.views.reporting), computed with
+vectorized pandas operations.
+"""
+import numpy as np
+import pandas as pd
+
+# The columns averaged and summed by each summary, with their label
+GLOBAL_SUMMARY_COLUMNS = [
+    ('hit_active_or_aborted', 'Active/Aborted'),
+    ('hit_active_or_aborted_or_error', 'Active/Aborted/Error'),
+]
+IMAGE_SUMMARY_COLUMNS = GLOBAL_SUMMARY_COLUMNS
+USER_SUMMARY_COLUMNS = [
+    ('hit_active', 'Active'),
+    ('hit_deploy_error', 'Deploy Error'),
+    ('hit_aborted', 'Aborted'),
+] + GLOBAL_SUMMARY_COLUMNS
+# Columns of the report which are not part of the 'Raw Data'
+RAW_DATA_EXCLUDED_COLUMNS = [
+    'size.id', 'size.uuid', 'size.alias', 'size.active', 'size.start_date',
+    'size.end_date', 'size.url'
+]
+CATEGORICAL_COLUMNS = ['username', 'image_name']
+
+
+def prepare_report(raw_dataframe):
+    """
+    Parse the report dates (with a single vectorized call per column) and
+    store usernames and image names as categories.
+    """
+    for column in ['start_date', 'end_date']:
+        raw_dataframe[column] = pd.to_datetime(
+            raw_dataframe[column], infer_datetime_format=True
+        )
+    for column in CATEGORICAL_COLUMNS:
+        raw_dataframe[column] = raw_dataframe[column].astype('category')
+    return raw_dataframe
+
+
+def _summarize(grouped, columns):
+    """
+    Average and sum `columns` of each group, labelled as
+    'Average of <label>' and 'Sum of <label>'
+    """
+    summary = grouped[[column
+                       for column, _ in columns]].aggregate([np.mean, np.sum])
+    summary.columns = [
+        '%s of %s' % (aggregate, label) for _, label in columns
+        for aggregate in ['Average', 'Sum']
+    ]
+    return summary
+
+
+def _summarize_by(featured, frequency, column, columns, name):
+    """
+    Summarize `columns` for every value of `column`, per period
+    """
+    summary = _summarize(
+        featured.groupby(
+            [pd.Grouper(key='start_date', freq=frequency), column]
+        ), columns
+    )
+    # Categories are grouped by every period, drop the ones without instances
+    summary = summary.dropna(how='all')
+    summary.index.names = ['Start Date', name]
+    return summary
+
+
+def create_datasets(raw_dataframe, frequency):
+    """
+    Given the instance report as a DataFrame (one column per header of
+    the reporting API) returns its summaries of the featured images, for each
+    period of `frequency`, and its raw data:
+    {'User Summary': ..., 'Image Summary': ..., 'Global Summary': ...,
+     'Raw Data': ...}
+    """
+    raw_dataframe = prepare_report(raw_dataframe)
+    summary_columns = ['start_date'] + CATEGORICAL_COLUMNS + [
+        column for column, _ in USER_SUMMARY_COLUMNS
+    ]
+    featured = raw_dataframe.loc[raw_dataframe['is_featured_image'] ==
+                                 1, summary_columns].copy()
+    # The hit_* flags are booleans: summed (or averaged) as booleans, some
+    # groups would be summarized as True/False instead of numbers.
+    for column, _ in USER_SUMMARY_COLUMNS:
+        featured[column] = featured[column].astype(int)
+    for column in CATEGORICAL_COLUMNS:
+        featured[column] = featured[column].cat.remove_unused_categories()
+
+    global_summary_data = _summarize(
+        featured.resample(frequency, on='start_date'), GLOBAL_SUMMARY_COLUMNS
+    )
+    global_summary_data.index.rename('Start Date', inplace=True)
+    user_summary_data = _summarize_by(
+        featured, frequency, 'username', USER_SUMMARY_COLUMNS, 'Username'
+    )
+    image_summary_data = _summarize_by(
+        featured, frequency, 'image_name', IMAGE_SUMMARY_COLUMNS, 'Image Name'
+    )
+    return {
+        'User Summary': user_summary_data,
+        'Image Summary': image_summary_data,
+        'Global Summary': global_summary_data,
+        'Raw Data': raw_dataframe.drop(RAW_DATA_EXCLUDED_COLUMNS, axis=1)
+    }
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index the events of each name by their `payload->>'allocation_source_name'`
+    (Used to find the renewals and thresholds met of many allocation sources)
+
+    The index is built CONCURRENTLY, so that events can still be written
+    meanwhile. That can not run in a transaction.
+    """
+    atomic = False
+
+    dependencies = [
+        ('core', 'user_allocation_ledger'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+            "event_table_name_allocation_source_name_idx "
+            "ON event_table (name, (payload ->> 'allocation_source_name'));",
+            reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS "
+            "event_table_name_allocation_source_name_idx;"
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Add the (optional) projection columns of `payload->>'instance_id'`,
+    `payload->>'username'` and `payload->>'allocation_source_name'`.
+    Existing events are filled by `./manage.py backfill_event_projection`.
+    (Indexed by `event_table_payload_projection_indexes`)
+    """
+
+    dependencies = [
+        ('core', 'event_table_allocation_source_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventtable',
+            name='allocation_source_name',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='eventtable',
+            name='instance_id',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='eventtable',
+            name='username',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
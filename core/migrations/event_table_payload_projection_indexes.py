@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+PROJECTED_COLUMNS = ['allocation_source_name', 'instance_id', 'username']
+
+
+def _create_index(name, columns):
+    return migrations.RunSQL(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON event_table %s;" %
+        (name, columns),
+        reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS %s;" % name
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    - Index `payload->>'instance_id'` and `payload->>'username'` (by event name)
+    - Index the projection columns of the payload
+
+    The indexes are built CONCURRENTLY, so that events can still be written
+    meanwhile. That can not run in a transaction.
+
+    `instance_last_status_projection` depends on this migration (instead of
+    `event_table_payload_projection`), so that core keeps a single leaf.
+    """
+    atomic = False
+
+    dependencies = [
+        ('core', 'event_table_payload_projection'),
+    ]
+
+    operations = [
+        _create_index(
+            'event_table_name_instance_id_idx',
+            "(name, (payload ->> 'instance_id'))"
+        ),
+        _create_index(
+            'event_table_name_username_idx', "(name, (payload ->> 'username'))"
+        ),
+    ] + [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                _create_index('event_table_%s_idx' % column, '(%s)' % column)
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='eventtable',
+                    name=column,
+                    field=models.CharField(
+                        blank=True, db_index=True, max_length=255, null=True
+                    ),
+                )
+            ]
+        ) for column in PROJECTED_COLUMNS
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    """
+    Add the projection of the newest InstanceStatusHistory to Instance.
+    Existing instances are filled by `./manage.py backfill_instance_last_status`.
+    """
+
+    dependencies = [
+        ('core', 'event_table_payload_projection_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instance',
+            name='last_activity',
+            field=models.CharField(blank=True, max_length=36, null=True),
+        ),
+        migrations.AddField(
+            model_name='instance',
+            name='last_size',
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='+',
+                to='core.Size'
+            ),
+        ),
+        migrations.AddField(
+            model_name='instance',
+            name='last_status',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='instance',
+            name='last_status_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', 'remove-unused-applicationscore-model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAllocationLedger',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID'
+                    )
+                ),
+                ('allocation_source_name', models.CharField(max_length=255)),
+                ('day', models.DateField()),
+                (
+                    'compute_used',
+                    models.DecimalField(decimal_places=3, max_digits=19)
+                ),
+                ('updated', models.DateTimeField(auto_now=True)),
+                (
+                    'user',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='allocation_ledger',
+                        to=settings.AUTH_USER_MODEL
+                    )
+                ),
+            ],
+            options={
+                'db_table': 'user_allocation_ledger',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='userallocationledger',
+            unique_together=set([('user', 'allocation_source_name', 'day')]),
+        ),
+    ]
@@ -1,7 +1,6 @@
 import decimal
 
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
 from django.utils import timezone
 from threepio import logger
@@ -42,35 +41,70 @@ class AllocationSource(models.Model):
         :return: decimal.Decimal
         :rtype: decimal.Decimal
         """
-        # Handling the 'SPECIAL_ALLOCATION_SOURCES'
+        key = (self.id, user.id if user else None)
+        return AllocationSource.time_remaining_for([(self, user)])[key]
+
+    @classmethod
+    def time_remaining_for(cls, source_user_pairs):
+        """
+        Set-based form of `time_remaining(user)` for many
+        (AllocationSource, AtmosphereUser or None) pairs at once.
+
+        Returns a dict of (allocation_source.id, user.id or None) -> remaining
+        compute. Snapshots for all the pairs are read with (at most) two
+        queries. A source without a snapshot has not been used yet.
+        """
         time_shared_allocations = getattr(
             settings, 'SPECIAL_ALLOCATION_SOURCES', {}
         )
-        if user and self.name in time_shared_allocations.keys():
-            try:
-                compute_allowed = time_shared_allocations[self.name
-                                                         ]['compute_allowed']
-            except:
-                raise Exception(
-                    "The structure of settings.SPECIAL_ALLOCATION_SOURCES "
-                    "has changed! Verify your settings are correct and/or "
-                    "change the lines of code above."
-                )
-            try:
-                last_snapshot = self.user_allocation_snapshots.get(user=user)
-            except ObjectDoesNotExist:
-                logger.exception(
-                    'User allocation snapshot does not exist anymore (or yet), so returning -1'
-                )
-                return -1
-        else:
-            compute_allowed = self.compute_allowed
-            last_snapshot = self.snapshot
-        if compute_allowed < 0:
-            return decimal.Decimal('Infinity')
-        compute_used = last_snapshot.compute_used if last_snapshot else 0
-        remaining_compute = compute_allowed - compute_used
-        return remaining_compute
+        source_ids = set(source.id for source, _ in source_user_pairs)
+        source_compute_used = dict(
+            AllocationSourceSnapshot.objects.filter(
+                allocation_source_id__in=source_ids
+            ).values_list('allocation_source_id', 'compute_used')
+        )
+        special_source_ids = set(
+            source.id for source, user in source_user_pairs
+            if user and source.name in time_shared_allocations
+        )
+        user_compute_used = {}
+        if special_source_ids:
+            user_compute_used = dict(
+                ((source_id, user_id), compute_used)
+                for source_id, user_id, compute_used in UserAllocationSnapshot.
+                objects.filter(allocation_source_id__in=special_source_ids).
+                values_list('allocation_source_id', 'user_id', 'compute_used')
+            )
+
+        remaining = {}
+        for source, user in source_user_pairs:
+            key = (source.id, user.id if user else None)
+            if user and source.id in special_source_ids:
+                try:
+                    compute_allowed = time_shared_allocations[
+                        source.name]['compute_allowed']
+                except:
+                    raise Exception(
+                        "The structure of settings.SPECIAL_ALLOCATION_SOURCES "
+                        "has changed! Verify your settings are correct and/or "
+                        "change the lines of code above."
+                    )
+                if key not in user_compute_used:
+                    logger.info(
+                        'User allocation snapshot does not exist anymore (or yet) '
+                        'for %s, so returning -1', key
+                    )
+                    remaining[key] = -1
+                    continue
+                compute_used = user_compute_used[key]
+            else:
+                compute_allowed = source.compute_allowed
+                compute_used = source_compute_used.get(source.id, 0)
+            if compute_allowed < 0:
+                remaining[key] = decimal.Decimal('Infinity')
+            else:
+                remaining[key] = compute_allowed - compute_used
+        return remaining
 
     @property
     def compute_used_updated(self):
@@ -163,6 +197,33 @@ class UserAllocationSnapshot(models.Model):
         unique_together = ('user', 'allocation_source')
 
 
+class UserAllocationLedger(models.Model):
+    """
+    Materialized usage (in CPU-seconds) for a User+AllocationSource on a single (UTC) day.
+
+    Rows are keyed on the allocation source *name* reported by
+    `service.allocation_logic.create_report`, so un-attributed ('N/A') usage is
+    kept as well. Every materialized day has an 'N/A' row (possibly zero),
+    which lets a day without usage be told apart from a day never computed.
+
+    NOTE: This table is maintained by `service.allocation_ledger`, do not edit it directly.
+    """
+    user = models.ForeignKey("AtmosphereUser", related_name="allocation_ledger")
+    allocation_source_name = models.CharField(max_length=255)
+    day = models.DateField()
+    compute_used = models.DecimalField(max_digits=19, decimal_places=3)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __unicode__(self):
+        return "User %s + AllocationSource %s on %s: %s CPU-seconds" %\
+            (self.user, self.allocation_source_name, self.day, self.compute_used)
+
+    class Meta:
+        db_table = 'user_allocation_ledger'
+        app_label = 'core'
+        unique_together = ('user', 'allocation_source_name', 'day')
+
+
 class InstanceAllocationSourceSnapshot(models.Model):
     instance = models.OneToOneField("Instance")
     allocation_source = models.ForeignKey(AllocationSource)
@@ -210,22 +271,34 @@ def total_usage(
 ):
     """
         This function outputs the total allocation usage in hours
+
+        Completed days are read from the `UserAllocationLedger`, only the
+        partial days at either end of the window are computed from history.
     """
     from service.allocation_logic import create_report
+    from service.allocation_ledger import usage_by_allocation_source
     if not end_date:
         end_date = timezone.now()
-    user_allocation = create_report(
-        start_date,
-        end_date,
-        user_id=username,
-        allocation_source_name=allocation_source_name
-    )
     if email:
-        return user_allocation
-    total_allocation = 0.0
-    for data in user_allocation:
-        if not data['allocation_source'] == 'N/A':
-            total_allocation += data['applicable_duration']
+        return create_report(
+            start_date,
+            end_date,
+            user_id=username,
+            allocation_source_name=allocation_source_name
+        )
+    usage, user_allocation = usage_by_allocation_source(
+        username, start_date, end_date
+    )
+    if allocation_source_name:
+        total_allocation = usage.get(allocation_source_name, 0.0)
+        user_allocation = [
+            data for data in user_allocation
+            if data['allocation_source'] == allocation_source_name
+        ]
+    else:
+        total_allocation = sum(
+            duration for name, duration in usage.items() if name != 'N/A'
+        )
     compute_used_total = round(total_allocation / 3600.0, 2)
     if compute_used_total > 0:
         logger.info(
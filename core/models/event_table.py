@@ -1,13 +1,23 @@
 from uuid import uuid4
 
+from django.conf import settings
+from django.contrib.postgres.fields.jsonb import KeyTextTransform
 from django.db import models
+from django.db import transaction
 from django.db.models.signals import post_save, pre_save
 from django.utils import timezone
 from django.contrib.postgres.fields import JSONField
+from core.hooks.dispatch import (
+    POST_SAVE, PRE_SAVE, register_event_hook, dispatch_events,
+    dispatch_post_save, dispatch_pre_save
+)
 from core.hooks.quota import (listen_for_quota_assigned)
 from core.hooks.allocation_source import (
     listen_before_allocation_snapshot_changes,
-    listen_for_allocation_snapshot_changes, listen_for_user_snapshot_changes,
+    listen_before_allocation_snapshot_changes_batch,
+    listen_for_allocation_snapshot_changes,
+    listen_for_allocation_snapshot_changes_batch,
+    listen_for_user_snapshot_changes, listen_for_user_snapshot_changes_batch,
     listen_for_allocation_threshold_met, listen_for_instance_allocation_changes,
     listen_for_allocation_source_created_or_renewed,
     listen_for_user_allocation_source_deleted,
@@ -19,6 +29,32 @@ from core.hooks.allocation_source import (
 )
 from threepio import logger
 
+# Payload keys that are copied into (indexed) columns of the same name
+PROJECTED_PAYLOAD_KEYS = ('instance_id', 'username', 'allocation_source_name')
+
+
+class EventTableQuerySet(models.QuerySet):
+    def annotate_payload(self, *keys):
+        """
+        Annotate every event with `payload_<key>`: The text value of
+        `payload->>key` for each of `keys`.
+
+        Projected keys are read from their column instead when
+        settings.EVENT_TABLE_USE_PROJECTION is set (Only set it once the
+        columns are filled, see `./manage.py backfill_event_projection`).
+        Otherwise, the payload expression indexes are used.
+        """
+        use_projection = getattr(settings, 'EVENT_TABLE_USE_PROJECTION', False)
+        return self.annotate(
+            **dict(
+                (
+                    'payload_%s' % key, models.
+                    F(key) if use_projection and key in PROJECTED_PAYLOAD_KEYS
+                    else KeyTextTransform(key, 'payload')
+                ) for key in keys
+            )
+        )
+
 
 class EventTable(models.Model):
     """
@@ -32,6 +68,31 @@ class EventTable(models.Model):
     name = models.CharField(max_length=128, db_index=True)
     payload = JSONField()
     timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+    # Projection of PROJECTED_PAYLOAD_KEYS, filled on insert
+    instance_id = models.CharField(
+        max_length=255, null=True, blank=True, db_index=True
+    )
+    username = models.CharField(
+        max_length=255, null=True, blank=True, db_index=True
+    )
+    allocation_source_name = models.CharField(
+        max_length=255, null=True, blank=True, db_index=True
+    )
+
+    objects = EventTableQuerySet.as_manager()
+
+    def project_payload(self):
+        """
+        Copy the projected payload keys into their columns.
+        """
+        payload = self.payload if isinstance(self.payload, dict) else {}
+        for key in PROJECTED_PAYLOAD_KEYS:
+            value = payload.get(key)
+            setattr(self, key, None if value is None else unicode(value)[:255])
+
+    def save(self, *args, **kwargs):
+        self.project_payload()
+        return super(EventTable, self).save(*args, **kwargs)
 
     @classmethod
     def create_event(cls, name, payload, entity_id):
@@ -40,6 +101,24 @@ class EventTable(models.Model):
             name=name, entity_id=entity_id, payload=payload
         )
 
+    @classmethod
+    def create_events(cls, events, batch_size=None):
+        """
+        Save a batch of (unsaved) events with a single `bulk_create`.
+        The hooks for each event name are fired once per batch,
+        see `core.hooks.dispatch.dispatch_events`.
+        """
+        logger.info("Creating %s new events" % len(events))
+        with transaction.atomic():
+            dispatch_events(cls, events, PRE_SAVE)
+            for event in events:
+                event.project_payload()
+            created = EventTable.objects.bulk_create(
+                events, batch_size=batch_size
+            )
+        dispatch_events(cls, created, POST_SAVE)
+        return created
+
     def __str__(self):
         return "%s" % self.name
 
@@ -52,23 +131,55 @@ class EventTable(models.Model):
 
 
 # Instantiate the hooks:
-post_save.connect(listen_for_allocation_threshold_met, sender=EventTable)
-post_save.connect(listen_for_instance_allocation_changes, sender=EventTable)
-post_save.connect(
-    listen_for_allocation_source_created_or_renewed, sender=EventTable
+register_event_hook(
+    'allocation_source_threshold_met', listen_for_allocation_threshold_met
+)
+register_event_hook(
+    'instance_allocation_source_changed', listen_for_instance_allocation_changes
+)
+register_event_hook(
+    'allocation_source_created_or_renewed',
+    listen_for_allocation_source_created_or_renewed
+)
+register_event_hook(
+    'allocation_source_compute_allowed_changed',
+    listen_for_allocation_source_compute_allowed_changed
+)
+register_event_hook(
+    'user_allocation_source_created', listen_for_user_allocation_source_created
+)
+register_event_hook(
+    'user_allocation_source_deleted', listen_for_user_allocation_source_deleted
+)
+register_event_hook(
+    'allocation_source_snapshot',
+    listen_before_allocation_snapshot_changes,
+    signal=PRE_SAVE,
+    batch_hook=listen_before_allocation_snapshot_changes_batch
+)
+register_event_hook(
+    'instance_allocation_source_removed', listen_for_instance_allocation_removed
+)
+register_event_hook(
+    'allocation_source_snapshot',
+    listen_for_allocation_snapshot_changes,
+    batch_hook=listen_for_allocation_snapshot_changes_batch
+)
+register_event_hook(
+    'user_allocation_snapshot_changed',
+    listen_for_user_snapshot_changes,
+    batch_hook=listen_for_user_snapshot_changes_batch
+)
+register_event_hook(
+    'allocation_source_renewal_strategy_changed',
+    listen_for_allocation_source_renewal_strategy_changed
 )
-post_save.connect(
-    listen_for_allocation_source_compute_allowed_changed, sender=EventTable
+register_event_hook(
+    'allocation_source_name_changed', listen_for_allocation_source_name_changed
 )
-post_save.connect(listen_for_user_allocation_source_created, sender=EventTable)
-post_save.connect(listen_for_user_allocation_source_deleted, sender=EventTable)
-pre_save.connect(listen_before_allocation_snapshot_changes, sender=EventTable)
-post_save.connect(listen_for_instance_allocation_removed, sender=EventTable)
-post_save.connect(listen_for_allocation_snapshot_changes, sender=EventTable)
-post_save.connect(listen_for_user_snapshot_changes, sender=EventTable)
-post_save.connect(
-    listen_for_allocation_source_renewal_strategy_changed, sender=EventTable
+register_event_hook(
+    'allocation_source_removed', listen_for_allocation_source_removed
 )
-post_save.connect(listen_for_allocation_source_name_changed, sender=EventTable)
-post_save.connect(listen_for_allocation_source_removed, sender=EventTable)
-post_save.connect(listen_for_quota_assigned, sender=EventTable)
+register_event_hook('quota_assigned', listen_for_quota_assigned)
+pre_save.connect(dispatch_pre_save, sender=EventTable)
+post_save.connect(dispatch_post_save, sender=EventTable)
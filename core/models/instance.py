@@ -5,7 +5,7 @@ from hashlib import md5
 from datetime import datetime, timedelta
 
 from django.db import models
-from django.db.models import (Q, ObjectDoesNotExist)
+from django.db.models import (Q, ObjectDoesNotExist, Prefetch)
 from django.utils import timezone
 
 import pytz
@@ -65,11 +65,39 @@ class Instance(models.Model):
     # FIXME  Problems when setting a default, missing auto_now_add
     start_date = models.DateTimeField()
     end_date = models.DateTimeField(null=True, blank=True)
+    # Projection of the newest InstanceStatusHistory, kept up to date when
+    # histories are created. Existing instances are filled by
+    # `./manage.py backfill_instance_last_status`.
+    last_status = models.CharField(max_length=128, null=True, blank=True)
+    last_activity = models.CharField(max_length=36, null=True, blank=True)
+    last_size = models.ForeignKey(
+        "Size", models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    last_status_date = models.DateTimeField(null=True, blank=True)
+    LAST_STATUS_FIELDS = (
+        'last_status', 'last_activity', 'last_size', 'last_status_date'
+    )
 
     # Model Managers
     objects = models.Manager()    # The default manager.
     active_instances = ActiveInstancesManager()
 
+    def save(self, *args, **kwargs):
+        """
+        Saving an existing instance leaves out the `last_*` projection: it is
+        only written by `InstanceStatusHistory.project_to_instance`, and this
+        copy may have been loaded before a newer history was projected.
+        """
+        if not self._state.adding and not args \
+                and kwargs.get('update_fields') is None:
+            deferred_fields = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.
+                LAST_STATUS_FIELDS and field.attname not in deferred_fields
+            ]
+        return super(Instance, self).save(*args, **kwargs)
+
     @property
     def project_name(self):
         if not self.created_by_identity:
@@ -125,10 +153,28 @@ class Instance(models.Model):
         else:
             return None
 
+    @staticmethod
+    def prefetch_last_history():
+        """
+        Prefetch the newest InstanceStatusHistory (with its status and size)
+        of every instance, as returned by `get_last_history`
+        """
+        from core.models import InstanceStatusHistory
+        return Prefetch(
+            'instancestatushistory_set',
+            queryset=InstanceStatusHistory.objects.select_related(
+                'status', 'size'
+            ).order_by('instance_id', '-start_date').distinct('instance_id'),
+            to_attr='_last_histories'
+        )
+
     def get_last_history(self):
         """
         Returns the newest InstanceStatusHistory
         """
+        prefetched = getattr(self, '_last_histories', None)
+        if prefetched:
+            return prefetched[0]
         # FIXME: Clean up this implementation OR rename to `get_or_create`
         # TODO: Profile Option
         # except InstanceStatusHistory.DoesNotExist:
@@ -157,6 +203,17 @@ class Instance(models.Model):
             )
             return last_history
 
+    def get_last_status(self):
+        """
+        Returns the status name of the newest InstanceStatusHistory
+        """
+        if self.last_status is not None:
+            return self.last_status
+        last_history = self.get_last_history()
+        if not last_history:
+            return None
+        return last_history.status.name
+
     def _build_first_history(
         self,
         status_name,
@@ -210,6 +267,8 @@ class Instance(models.Model):
         # FIXME: Move this call so that it happens inside InstanceStatusHistory to avoid circ.dep.
         from core.models import InstanceStatusHistory
         import traceback
+        # The history is about to change, do not use a prefetched one
+        self.__dict__.pop('_last_histories', None)
         # 1. Get status name
         status_name = _get_status_name_for_provider(
             self.source.provider, status_name, task, tmp_status
@@ -378,10 +437,9 @@ class Instance(models.Model):
 
     def api_status(self):
         # Used by the v2 serializer - db only. no 'esh'
-        last_history = self.get_last_history()
-        if not last_history:
+        status_name = self.get_last_status()
+        if not status_name:
             return "Unknown"
-        status_name = last_history.status.name
         #NOTE: This handles the two 'atmosphere created' special-case status types, networking/deploying.
         # If the last history is one of these states, return active
         if status_name in ["networking", "deploy_error", "deploying"]:
@@ -390,10 +448,9 @@ class Instance(models.Model):
 
     def api_activity(self):
         # Used by the v2 serializer - db only. no 'esh'
-        last_history = self.get_last_history()
-        if not last_history:
+        status_name = self.get_last_status()
+        if not status_name:
             return ""
-        status_name = last_history.status.name
         #FIXME: Using this, for now, in place of a better solution.descripted in core/models/instance_history.py:InstanceStatus
         if status_name not in ["networking", "deploy_error", "deploying"]:
             return ""
@@ -402,11 +459,7 @@ class Instance(models.Model):
     def esh_status(self):
         if self.esh and type(self.esh) != MockInstance:
             return self.esh.get_status()
-        last_history = self.get_last_history()
-        if last_history:
-            return last_history.status.name
-        else:
-            return "Unknown"
+        return self.get_last_status() or "Unknown"
 
     def esh_activity(self):
         activity = None
@@ -434,10 +487,14 @@ class Instance(models.Model):
         return self.source.provider
 
     def get_size(self):
+        if self.last_size_id is not None:
+            return self.last_size
         return self.get_last_history().size
 
     def esh_size(self):
         if not self.esh or not hasattr(self.esh, 'extra'):
+            if self.last_size_id is not None:
+                return self.last_size.alias
             last_history = self.get_last_history()
             if last_history:
                 return last_history.size.alias
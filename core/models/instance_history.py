@@ -5,7 +5,8 @@ from uuid import uuid4
 from datetime import timedelta
 
 from django.db import models, transaction, DatabaseError
-from django.db.models import ObjectDoesNotExist
+from django.db.models import ObjectDoesNotExist, Q
+from django.db.models.signals import post_save
 from django.contrib.postgres.fields import JSONField
 
 from django.utils import timezone
@@ -58,6 +59,42 @@ class InstanceStatusHistory(models.Model):
     end_date = models.DateTimeField(null=True, blank=True)
     extra = JSONField(null=True, blank=True)
 
+    def save(self, *args, **kwargs):
+        """
+        Save the history, and project a new history onto its instance
+        (see `project_to_instance`) in the same transaction.
+        """
+        created = self.pk is None
+        with transaction.atomic():
+            super(InstanceStatusHistory, self).save(*args, **kwargs)
+            if created:
+                self.project_to_instance()
+
+    def project_to_instance(self):
+        """
+        Copy this history into the `last_*` fields of its instance, unless the
+        instance has projected a newer history.
+        """
+        from core.models.instance import Instance
+        projection = {
+            'last_status': self.status.name,
+            'last_activity': self.activity,
+            'last_size': self.size_id,
+            'last_status_date': self.start_date,
+        }
+        updated = Instance.objects.filter(id=self.instance_id).filter(
+            Q(last_status_date__isnull=True) |
+            Q(last_status_date__lte=self.start_date)
+        ).update(**projection)
+        if not updated:
+            return False
+        instance = self.instance
+        instance.last_status = self.status.name
+        instance.last_activity = self.activity
+        instance.last_size_id = self.size_id
+        instance.last_status_date = self.start_date
+        return True
+
     def previous(self):
         """
         Given that you are a node on a linked-list, traverse yourself backwards
@@ -283,3 +320,21 @@ class InstanceStatusHistory(models.Model):
     class Meta:
         db_table = "instance_status_history"
         app_label = "core"
+
+
+def listen_for_instance_history_changes(sender, instance, created, **kwargs):
+    """
+    Invalidate the allocation ledger of the instance owner when a history
+    is started or end-dated.
+    """
+    from service.allocation_ledger import invalidate_ledger
+    history = instance
+    since = history.start_date if created else history.end_date
+    if not since:
+        return
+    invalidate_ledger(since, instance_id=history.instance_id)
+
+
+post_save.connect(
+    listen_for_instance_history_changes, sender=InstanceStatusHistory
+)
@@ -90,10 +90,20 @@ def _update_from_cloud_size(core_size, rtwo_size):
     """
     Full scope replacement based on cloud(rtwo) size
     """
+    unchanged = (
+        rtwo_size.name, rtwo_size.disk, rtwo_size.ephemeral, rtwo_size.cpu,
+        rtwo_size.ram
+    ) == (
+        core_size.name, core_size.disk, core_size.root, core_size.cpu,
+        core_size.mem
+    )
     core_size.name = rtwo_size.name
     # Don't update to -1,-1 or 0,0
     if rtwo_size.cpu < 1 or rtwo_size.ram < 1:
         return core_size
+    if unchanged and core_size.pk:
+        # Nothing to write
+        return core_size
     core_size.disk = rtwo_size.disk
     core_size.root = rtwo_size.ephemeral
     core_size.cpu = rtwo_size.cpu
@@ -9,6 +9,9 @@ from core.models.provider import Provider
 from core.models.identity import Identity
 from core.query import only_current_source
 
+# Placeholder for a value that has not been looked up yet
+_LOOKUP = object()
+
 
 class ActiveVolumesManager(models.Manager):
     def get_queryset(self):
@@ -157,10 +160,15 @@ class Volume(BaseSource):
             or self.get_device() != last_history.device\
             or self.get_instance_alias() != last_history.instance_alias
 
-    def _update_history(self):
+    def _update_history(self, last_history=_LOOKUP):
+        """
+        last_history - (Optional) The last VolumeStatusHistory (or None),
+                       when it has already been loaded
+        """
         status = self.get_status()
         if status != VolumeStatus.UNKNOWN:
-            last_history = self._get_last_history()
+            if last_history is _LOOKUP:
+                last_history = self._get_last_history()
             # This is a living volume!
             if self.end_date:
                 self.end_date = None
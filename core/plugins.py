@@ -219,6 +219,42 @@ class AllocationSourcePluginManager(PluginListManager):
                 return _enforcement_override_choice
         return _enforcement_override_choice
 
+    @classmethod
+    def get_enforcement_overrides(cls, source_user_pairs, provider=None):
+        """Batch form of `get_enforcement_override`, for many (allocation source, user) pairs.
+
+        Each plugin is loaded once, and its `get_enforcement_override` called for every pair that no earlier plugin
+        has overridden. As with `get_enforcement_override`, the first value that is not
+        `EnforcementOverrideChoice.NO_OVERRIDE` is used.
+
+        :param source_user_pairs: The allocation sources and users to check
+        :type source_user_pairs: list of (core.models.AllocationSource, core.models.AtmosphereUser)
+        :param provider: The provider (optional, not used by any plugins yet)
+        :type provider: core.models.Provider
+        :return: The enforcement override behaviour for each pair
+        :rtype: dict
+        """
+        choices = dict(
+            ((source.id, user.id), EnforcementOverrideChoice.NO_OVERRIDE)
+            for source, user in source_user_pairs
+        )
+        undecided_pairs = list(source_user_pairs)
+        for AllocationSourcePlugin in cls.load_plugins(cls.list_of_classes):
+            if not undecided_pairs:
+                break
+            plugin = AllocationSourcePlugin()
+            remaining_pairs = []
+            for source, user in undecided_pairs:
+                choice = plugin.get_enforcement_override(
+                    user=user, allocation_source=source, provider=provider
+                )
+                if choice != EnforcementOverrideChoice.NO_OVERRIDE:
+                    choices[(source.id, user.id)] = choice
+                else:
+                    remaining_pairs.append((source, user))
+            undecided_pairs = remaining_pairs
+        return choices
+
 
 class AccountCreationPluginManager(PluginListManager):
     """
@@ -0,0 +1,63 @@
+"""
+Shared, connection-pooled redis client.
+
+Every cache and metrics call site should use `get_redis_client()` rather than
+creating its own `redis.StrictRedis()`, so that connections are re-used
+(one pool per process) instead of opened for every request.
+"""
+import threading
+
+import redis
+from django.conf import settings
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """
+    Return the connection pool for settings.REDIS_URL, creating it on first use.
+    At most settings.REDIS_MAX_CONNECTIONS connections are opened, after that
+    callers wait (up to settings.REDIS_POOL_TIMEOUT seconds) for a free one.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = redis.BlockingConnectionPool.from_url(
+                    getattr(settings, 'REDIS_URL', 'redis://localhost:6379/0'),
+                    max_connections=getattr(
+                        settings, 'REDIS_MAX_CONNECTIONS', 50
+                    ),
+                    timeout=getattr(settings, 'REDIS_POOL_TIMEOUT', 20)
+                )
+    return _pool
+
+
+def get_redis_client():
+    return redis.StrictRedis(connection_pool=get_connection_pool())
+
+
+def get_many(keys, client=None):
+    """
+    Return the values of `keys` (None for a missing key), in one round trip.
+    """
+    if not keys:
+        return []
+    pipe = (client or get_redis_client()).pipeline(transaction=False)
+    for key in keys:
+        pipe.get(key)
+    return pipe.execute()
+
+
+def set_many(mapping, expire=None, client=None):
+    """
+    Set every key -> value of `mapping` (expiring after `expire` seconds),
+    in one round trip.
+    """
+    if not mapping:
+        return
+    pipe = (client or get_redis_client()).pipeline(transaction=False)
+    for key, value in mapping.items():
+        pipe.set(key, value, ex=expire)
+    pipe.execute()
@@ -1,10 +1,12 @@
 from unittest import skip
 
+import mock
 from django.test import TestCase, override_settings
 
 from api.tests.factories import UserFactory
 from core.models import EventTable, AllocationSource
-from core.models import UserAllocationSource
+from core.models import UserAllocationSource, UserAllocationSnapshot
+from core.hooks import dispatch
 
 
 class EventTableTest(TestCase):
@@ -47,3 +49,160 @@ class EventTableTest(TestCase):
                 'threshold': 10
             }
         )
+
+
+class EventTableDispatchTest(TestCase):
+    def setUp(self):
+        dispatch.reset_hook_timings()
+        self.user = UserFactory.create()
+        self.allocation_source = AllocationSource.objects.create(
+            name='DefaultAllocation', compute_allowed=1000
+        )
+
+    def _spy_hooks(self, event_name, signal=dispatch.POST_SAVE, replace=False):
+        """
+        Replace the hooks registered for `event_name` with mocks, wrapping the
+        original hooks unless `replace` is set.
+        """
+
+        def spy(hook):
+            if not hook:
+                return None
+            return mock.Mock(wraps=None if replace else hook)
+
+        hooks = [
+            (spy(hook), spy(batch_hook))
+            for hook, batch_hook in dispatch._event_hooks[signal][event_name]
+        ]
+        patcher = mock.patch.dict(
+            dispatch._event_hooks[signal], {event_name: hooks}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return hooks[0]
+
+    def _user_snapshot_event(self, compute_used):
+        return EventTable(
+            name='user_allocation_snapshot_changed',
+            entity_id=self.user.username,
+            payload={
+                'allocation_source_name': self.allocation_source.name,
+                'username': self.user.username,
+                'compute_used': compute_used,
+                'burn_rate': 1.0
+            }
+        )
+
+    def _allocation_snapshot_event(self, compute_used):
+        return EventTable(
+            name='allocation_source_snapshot',
+            entity_id=self.allocation_source.name,
+            payload={
+                'allocation_source_name': self.allocation_source.name,
+                'compute_used': compute_used,
+                'global_burn_rate': 1.0
+            }
+        )
+
+    def test_only_subscribed_hooks_run(self):
+        snapshot_hook, _ = self._spy_hooks('user_allocation_snapshot_changed')
+        quota_hook, _ = self._spy_hooks('quota_assigned')
+        self._user_snapshot_event(10.0).save()
+        self.assertEqual(snapshot_hook.call_count, 1)
+        self.assertFalse(quota_hook.called)
+
+    def test_hook_timings(self):
+        self._user_snapshot_event(10.0).save()
+        EventTable.create_events(
+            [self._user_snapshot_event(used) for used in (20.0, 30.0)]
+        )
+
+        timings = dispatch.get_hook_timings()
+        snapshot_timings = timings['user_allocation_snapshot_changed']
+        self.assertEqual(
+            sorted(snapshot_timings), [
+                'listen_for_user_snapshot_changes',
+                'listen_for_user_snapshot_changes_batch'
+            ]
+        )
+        for hook_name, (calls, seconds) in snapshot_timings.items():
+            self.assertEqual(calls, 1, hook_name)
+            self.assertGreaterEqual(seconds, 0)
+        self.assertNotIn('quota_assigned', timings)
+
+        dispatch.reset_hook_timings()
+        self.assertEqual(dispatch.get_hook_timings(), {})
+
+    def test_create_events_fires_batch_hook_once(self):
+        hook, batch_hook = self._spy_hooks('user_allocation_snapshot_changed')
+        EventTable.create_events(
+            [self._user_snapshot_event(used) for used in (10.0, 20.0, 30.0)]
+        )
+        self.assertEqual(EventTable.objects.count(), 3)
+        self.assertEqual(batch_hook.call_count, 1)
+        self.assertFalse(hook.called)
+        snapshot = UserAllocationSnapshot.objects.get(
+            user=self.user, allocation_source=self.allocation_source
+        )
+        self.assertEqual(snapshot.compute_used, 30)
+
+    @override_settings(ALLOCATION_SOURCE_WARNINGS=[50, 75])
+    def test_create_events_checks_thresholds_in_order(self):
+        # (The emails sent for each threshold are not under test)
+        self._spy_hooks('allocation_source_threshold_met', replace=True)
+        # Saved one at a time, 80% crosses the 75% threshold and going back
+        # to 60% crosses nothing: the batch must not fire 50% either.
+        EventTable.create_events(
+            [
+                self._allocation_snapshot_event(used)
+                for used in (400.0, 800.0, 600.0)
+            ]
+        )
+        self.assertEqual(
+            [
+                event.payload['threshold'] for event in EventTable.objects.
+                filter(name='allocation_source_threshold_met')
+            ], [75]
+        )
+
+
+class EventTableProjectionTest(TestCase):
+    def _event(self, instance_id):
+        # (No hooks are subscribed to this event name)
+        return EventTable(
+            name='projection_test',
+            entity_id='test-user',
+            payload={
+                'instance_id': instance_id,
+                'username': 'test-user',
+                'allocation_source_name': 'DefaultAllocation'
+            }
+        )
+
+    def test_projection_is_filled_on_insert(self):
+        self._event('instance-1').save()
+        EventTable.create_events([self._event('instance-2')])
+
+        for event in EventTable.objects.order_by('instance_id'):
+            self.assertEqual(event.username, 'test-user')
+            self.assertEqual(event.allocation_source_name, 'DefaultAllocation')
+        self.assertEqual(
+            list(
+                EventTable.objects.order_by('instance_id').values_list(
+                    'instance_id', flat=True
+                )
+            ), ['instance-1', 'instance-2']
+        )
+
+    def test_annotate_payload(self):
+        self._event('instance-1').save()
+        self._event('instance-2').save()
+        for use_projection in (False, True):
+            with override_settings(EVENT_TABLE_USE_PROJECTION=use_projection):
+                events = EventTable.objects.annotate_payload(
+                    'instance_id'
+                ).filter(payload_instance_id__in=['instance-2', 'instance-3'])
+                self.assertEqual(
+                    [event.payload_instance_id for event in events],
+                    ['instance-2']
+                )
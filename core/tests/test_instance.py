@@ -6,6 +6,7 @@ from dateutil.relativedelta import relativedelta
 from django.utils.timezone import datetime
 import pytz
 
+from core.models import Instance
 from core.tests.helpers import CoreStatusHistoryHelper, CoreInstanceHelper
 
 # Create an instance
@@ -89,3 +90,59 @@ class TestInstanceStatusHistory(CoreInstanceTestCase):
             next_start = next_start + self.history_swap_every
         self.instance_1.end_date_all(self.terminate_time)
         self.assertNoActiveHistory(self.instance_1)
+
+    def test_last_status_projection(self):
+        """
+        Verify that the instance projects its newest history, whatever the
+        order in which histories are saved.
+        """
+        instance = self.instance_helper.to_core_instance()
+        history_helper = CoreStatusHistoryHelper(instance, self.begin_history)
+        history_helper.first_transaction()
+        self.assertEquals(instance.last_status, 'active')
+        self.assertEquals(instance.last_status_date, self.begin_history)
+
+        next_start = self.begin_history + self.history_swap_every
+        history_helper.set_start_date(next_start)
+        history_helper.set_size('large')
+        history_helper.status_name = 'suspended'
+        history_helper.new_transaction()
+        instance.refresh_from_db()
+        self.assertEquals(instance.last_status, 'suspended')
+        self.assertEquals(instance.last_activity, 'dummy-activity')
+        self.assertEquals(instance.last_size_id, history_helper.size.id)
+        self.assertEquals(instance.last_status_date, next_start)
+        self.assertEquals(instance.api_status(), 'suspended')
+        self.assertEquals(instance.get_size(), history_helper.size)
+
+        # An older history does not replace the projection
+        history_helper.set_start_date(
+            self.begin_history - relativedelta(days=1)
+        )
+        history_helper.status_name = 'build'
+        history_helper.first_transaction()
+        instance.refresh_from_db()
+        self.assertEquals(instance.last_status, 'suspended')
+
+    def test_stale_instance_save_keeps_projection(self):
+        """
+        Verify that saving an instance loaded before a newer history was
+        created does not replace the projection with its stale values.
+        """
+        instance = self.instance_helper.to_core_instance()
+        history_helper = CoreStatusHistoryHelper(instance, self.begin_history)
+        history_helper.first_transaction()
+        stale_instance = Instance.objects.get(id=instance.id)
+
+        next_start = self.begin_history + self.history_swap_every
+        history_helper.set_start_date(next_start)
+        history_helper.status_name = 'suspended'
+        history_helper.new_transaction()
+        self.assertEquals(stale_instance.last_status, 'active')
+
+        stale_instance.name = 'renamed-instance'
+        stale_instance.save()
+        instance.refresh_from_db()
+        self.assertEquals(instance.name, 'renamed-instance')
+        self.assertEquals(instance.last_status, 'suspended')
+        self.assertEquals(instance.last_status_date, next_start)
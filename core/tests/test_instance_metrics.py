@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+import urlparse
+import uuid
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import mock
+from django.test import TestCase, override_settings
+
+from core.metrics import instance as instance_metrics
+
+
+class StubGraphiteServer(ThreadingMixIn, HTTPServer):
+    """
+    Answers `/render/` with one series per target, after `delay` seconds.
+    """
+    daemon_threads = True
+
+    def __init__(self, delay=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubGraphiteHandler)
+        self.delay = delay
+        self.requests = []
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%s" % self.server_address[1]
+
+
+class StubGraphiteHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        time.sleep(self.server.delay)
+        query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+        series = [
+            {
+                'target': target,
+                'datapoints': [[1.0, 1500000000]]
+            } for target in query.get('target', [])
+        ]
+        body = json.dumps(series)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class InstanceMetricsTest(TestCase):
+    def setUp(self):
+        self.server = StubGraphiteServer(delay=0.2)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.settings = override_settings(
+            METRIC_SERVER=self.server.url, METRICS_BATCH_SIZE=3
+        )
+        self.settings.enable()
+        self.instances = [
+            mock.Mock(provider_alias=str(uuid.uuid4())) for _ in range(7)
+        ]
+
+    def tearDown(self):
+        self.settings.disable()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_cache_key_does_not_depend_on_dict_order(self):
+        fields = {'field': 'cpu', 'res': 5, 'from': '-3600s'}
+        reordered = dict(reversed(fields.items()))
+
+        self.assertEqual(
+            instance_metrics._to_instance_key(self.instances[0], fields),
+            instance_metrics._to_instance_key(self.instances[0], reordered)
+        )
+
+    def test_instances_are_requested_in_batches(self):
+        metrics = instance_metrics.get_instance_metrics_many(self.instances)
+
+        # 7 instances, 3 per batch
+        self.assertEqual(len(self.server.requests), 3)
+        for instance in self.instances:
+            series = metrics[instance.provider_alias]
+            self.assertEqual(len(series), 1)
+            self.assertIn(instance.provider_alias, series[0]['target'])
+
+        # Served from the cache the second time around
+        instance_metrics.get_instance_metrics_many(self.instances)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_identical_requests_are_coalesced(self):
+        instance = self.instances[0]
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(
+                    instance_metrics.request_instance_metrics(
+                        instance.provider_alias, {'field': '*'}
+                    )
+                )
+            ) for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result == results[0] for result in results))
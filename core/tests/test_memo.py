@@ -0,0 +1,76 @@
+import unittest
+
+import mock
+
+from core.memo import Memo, clear_task_scoped_memos, memo_scope, memoize
+
+
+class MemoTest(unittest.TestCase):
+    def test_least_recently_used_entries_are_evicted(self):
+        memo = Memo('test', max_size=2)
+        memo.set('a', 1)
+        memo.set('b', 2)
+        memo.get('a')
+        memo.set('c', 3)
+
+        self.assertEqual(memo.get('a'), 1)
+        self.assertIsNone(memo.get('b'))
+        self.assertEqual(memo.get('c'), 3)
+        self.assertEqual(memo.evictions, 1)
+
+    def test_entries_expire(self):
+        memo = Memo('test', ttl=60)
+        with mock.patch('core.memo.time.time', return_value=1000):
+            memo.set('a', 1)
+        with mock.patch('core.memo.time.time', return_value=1059):
+            self.assertEqual(memo.get('a'), 1)
+        with mock.patch('core.memo.time.time', return_value=1061):
+            self.assertIsNone(memo.get('a'))
+        self.assertEqual(len(memo), 0)
+
+    def test_hits_and_misses_are_counted(self):
+        compute = mock.Mock(return_value='value')
+        memo = Memo('test')
+
+        memo.get_or_set('a', compute)
+        memo.get_or_set('a', compute)
+        memo.get_or_set('a', compute)
+
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(memo.stats()['hits'], 2)
+        self.assertEqual(memo.stats()['misses'], 1)
+
+    def test_falsy_results_are_not_memoized(self):
+        compute = mock.Mock(return_value=None)
+        memo = Memo('test')
+
+        memo.get_or_set('a', compute)
+        memo.get_or_set('a', compute)
+
+        self.assertEqual(compute.call_count, 2)
+
+    def test_scope_clears_entries_on_exit(self):
+        first, second = Memo('first'), Memo('second')
+        with memo_scope(first, second):
+            first.set('a', 1)
+            with first.scope():
+                second.set('b', 2)
+            # Still inside the outer scope
+            self.assertEqual(len(first), 1)
+        self.assertEqual(len(first), 0)
+        self.assertEqual(len(second), 0)
+
+    def test_memoize(self):
+        func = mock.Mock(side_effect=lambda driver, machine: machine * 2)
+        func.__name__ = 'func'
+        memoized = memoize(
+            key=lambda driver, machine: machine, task_scoped=True
+        )(func)
+
+        self.assertEqual(memoized('driver', 2), 4)
+        self.assertEqual(memoized('other-driver', 2), 4)
+        self.assertEqual(func.call_count, 1)
+
+        clear_task_scoped_memos()
+        memoized('driver', 2)
+        self.assertEqual(func.call_count, 2)
@@ -0,0 +1,33 @@
+import uuid
+
+from django.test import TestCase
+
+from core.redis_client import (
+    get_connection_pool, get_many, get_redis_client, set_many
+)
+
+
+class RedisClientTest(TestCase):
+    def setUp(self):
+        prefix = "test.redis_client.%s" % uuid.uuid4()
+        self.keys = ["%s.%s" % (prefix, idx) for idx in range(3)]
+
+    def tearDown(self):
+        get_redis_client().delete(*self.keys)
+
+    def test_clients_share_one_pool(self):
+        self.assertIs(
+            get_redis_client().connection_pool,
+            get_redis_client().connection_pool
+        )
+        self.assertIs(get_connection_pool(), get_connection_pool())
+
+    def test_set_many_and_get_many(self):
+        set_many({self.keys[0]: 'zero', self.keys[2]: 'two'}, expire=60)
+
+        self.assertEqual(get_many(self.keys), ['zero', None, 'two'])
+        self.assertTrue(0 < get_redis_client().ttl(self.keys[0]) <= 60)
+
+    def test_empty_keys(self):
+        self.assertEqual(get_many([]), [])
+        set_many({})
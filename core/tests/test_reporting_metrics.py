@@ -0,0 +1,130 @@
+import pandas as pd
+from django.test import SimpleTestCase
+
+from core.metrics.reporting import create_datasets
+
+
+class CreateDatasetsTest(SimpleTestCase):
+    def _report(self, rows=None):
+        # username, image_name, start_date, featured, active, aborted,
+        # deploy_error
+        rows = rows or [
+            ('alice', 'Ubuntu', '01/05/17 10:00:00', True, True, False, False),
+            ('alice', 'Ubuntu', '01/20/17 10:00:00', True, False, True, False),
+            ('bob', 'CentOS', '01/07/17 10:00:00', True, False, False, False),
+            ('bob', 'Ubuntu', '02/03/17 10:00:00', True, True, False, False),
+            (
+                'carol', 'Private', '01/09/17 10:00:00', False, True, False,
+                False
+            ),
+        ]
+        return pd.DataFrame(
+            [
+                {
+                    'id': idx,
+                    'username': username,
+                    'image_name': image_name,
+                    'start_date': start_date,
+                    'end_date': None,
+                    'is_featured_image': featured,
+                    'hit_active': active,
+                    'hit_deploy_error': deploy_error,
+                    'hit_error': not (active or aborted),
+                    'hit_aborted': aborted,
+                    'hit_active_or_aborted': int(active or aborted),
+                    'hit_active_or_aborted_or_error': 1,
+                    'size.id': 1,
+                    'size.uuid': 'uuid',
+                    'size.alias': '1',
+                    'size.active': True,
+                    'size.start_date': None,
+                    'size.end_date': None,
+                    'size.url': '',
+                } for idx,
+                (
+                    username, image_name, start_date, featured, active, aborted,
+                    deploy_error
+                ) in enumerate(rows)
+            ]
+        )
+
+    def test_summaries_of_featured_images(self):
+        datasets = create_datasets(self._report(), 'MS')
+
+        global_summary = datasets['Global Summary']
+        self.assertEquals(
+            list(global_summary.columns), [
+                'Average of Active/Aborted', 'Sum of Active/Aborted',
+                'Average of Active/Aborted/Error', 'Sum of Active/Aborted/Error'
+            ]
+        )
+        self.assertEquals(list(global_summary['Sum of Active/Aborted']), [2, 1])
+        self.assertEquals(
+            list(global_summary['Sum of Active/Aborted/Error']), [3, 1]
+        )
+
+        user_summary = datasets['User Summary']
+        self.assertEquals(
+            [
+                (start_date.month, username)
+                for start_date, username in user_summary.index
+            ], [(1, 'alice'), (1, 'bob'), (2, 'bob')]
+        )
+        self.assertEquals(list(user_summary['Sum of Active']), [1, 0, 1])
+        self.assertEquals(list(user_summary['Sum of Aborted']), [1, 0, 0])
+
+        image_summary = datasets['Image Summary']
+        self.assertEquals(
+            [
+                (start_date.month, image_name)
+                for start_date, image_name in image_summary.index
+            ], [(1, 'CentOS'), (1, 'Ubuntu'), (2, 'Ubuntu')]
+        )
+        self.assertEquals(
+            list(image_summary['Average of Active/Aborted']), [0, 1, 1]
+        )
+
+        raw_data = datasets['Raw Data']
+        self.assertEquals(len(raw_data.index), 5)
+        self.assertNotIn('size.url', raw_data.columns)
+        self.assertEquals(
+            raw_data['start_date'][0], pd.Timestamp('2017-01-05 10:00')
+        )
+
+    def test_summaries_are_numeric(self):
+        datasets = create_datasets(
+            self._report(
+                [
+                    (
+                        'alice', 'Ubuntu', '01/05/17 10:00:00', True, False,
+                        True, True
+                    ),
+                    (
+                        'alice', 'Ubuntu', '01/06/17 10:00:00', True, False,
+                        True, True
+                    ),
+                    (
+                        'alice', 'Ubuntu', '01/07/17 10:00:00', True, True,
+                        False, False
+                    ),
+                    (
+                        'bob', 'Ubuntu', '01/08/17 10:00:00', True, False, True,
+                        False
+                    ),
+                ]
+            ), 'MS'
+        )
+
+        user_summary = datasets['User Summary']
+        for column in user_summary.columns:
+            self.assertIn(user_summary[column].dtype.kind, 'if', column)
+        self.assertEquals(list(user_summary['Sum of Aborted']), [2, 1])
+        self.assertEquals(list(user_summary['Sum of Deploy Error']), [2, 0])
+        self.assertEquals(
+            list(user_summary['Average of Deploy Error']), [2 / 3.0, 0]
+        )
+        for summary in ['Image Summary', 'Global Summary']:
+            for column in datasets[summary].columns:
+                self.assertIn(
+                    datasets[summary][column].dtype.kind, 'if', column
+                )
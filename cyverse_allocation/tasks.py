@@ -1,6 +1,7 @@
 import pprint
 
 from business_rules import run_all
+from celery import chord
 from celery.decorators import task
 from django.conf import settings
 from django.utils import timezone
@@ -8,34 +9,46 @@ from django.utils.timezone import datetime
 from threepio import celery_logger as logger
 
 from core.models import EventTable
-from core.models.allocation_source import AllocationSourceSnapshot, AllocationSource, UserAllocationSnapshot, \
-    total_usage
+from core.models.allocation_source import AllocationSourceSnapshot, AllocationSource, UserAllocationSource
+from service.allocation_snapshot import compute_usage, get_renewal_dates, merge_usage, save_snapshots
 from cyverse_allocation.cyverse_rules_engine_setup import CyverseTestRenewalVariables, CyverseTestRenewalActions, \
     cyverse_rules, renewal_strategies
 
+# Usage percentages that fire an 'allocation_source_threshold_met' event
+THRESHOLD = [50.0, 90.0]
+
 
 @task(name="update_snapshot_cyverse")
 def update_snapshot_cyverse(start_date=None, end_date=None):
+    end_date = timezone.now().replace(
+        microsecond=0
+    ) if not end_date else end_date
     all_sources = AllocationSource.objects.order_by('name')
+    user_ids = list(
+        UserAllocationSource.objects.order_by('user_id').values_list(
+            'user_id', flat=True
+        ).distinct()
+    )
     n = settings.ALLOC_SNAPSHOT_SIZE
-    num_sources = len(all_sources)
-    if num_sources > n:
-        for i in range(0, len(all_sources), n):
-            logger.debug(
-                "Updating {} of {} allocation sources ".format(n, num_sources)
-            )
-            update_snapshot_cyverse_for.apply_async(
-                args=(all_sources[i:i + n], ),
-                kwargs={
-                    'start_date': start_date,
-                    'end_date': end_date
-                },
-                expires=15 * 60
+    num_users = len(user_ids)
+    if num_users > n:
+        # Compute the usage of each chunk of users in parallel, then merge
+        # and save the results (and check the rules) once every chunk has
+        # finished.
+        logger.debug(
+            "Updating {} allocation sources, for {} users at a time".format(
+                len(all_sources), n
             )
+        )
+        chord(
+            compute_snapshot_usage_cyverse.s(
+                user_ids[i:i + n], start_date=start_date, end_date=end_date
+            ).set(expires=15 * 60) for i in range(0, num_users, n)
+        )(save_snapshots_cyverse.s(end_date=end_date))
     else:
         logger.debug(
             "Updating all {} allocation sources (snapshot size is {})".format(
-                num_sources, n
+                len(all_sources), n
             )
         )
         update_snapshot_cyverse_for(
@@ -43,69 +56,48 @@ def update_snapshot_cyverse(start_date=None, end_date=None):
         )
 
 
+@task(name="compute_snapshot_usage_cyverse")
+def compute_snapshot_usage_cyverse(user_ids, start_date=None, end_date=None):
+    return compute_usage(
+        AllocationSource.objects.all(),
+        end_date,
+        start_date=start_date,
+        user_ids=user_ids
+    )
+
+
+@task(name="save_snapshots_cyverse")
+def save_snapshots_cyverse(results, end_date=None):
+    _save_and_check_snapshots(merge_usage(results), end_date)
+
+
 @task(name="update_snapshot_cyverse_for")
 def update_snapshot_cyverse_for(
     allocation_sources, start_date=None, end_date=None
 ):
-    logger.debug("update_snapshot_cyverse task started at %s." % datetime.now())
     end_date = timezone.now().replace(
         microsecond=0
     ) if not end_date else end_date
+    _save_and_check_snapshots(
+        compute_usage(allocation_sources, end_date, start_date=start_date),
+        end_date
+    )
 
-    for allocation_source in allocation_sources:
-        # calculate and save snapshots here
-        allocation_source_name = allocation_source.name
-        last_renewal_event = EventTable.objects.filter(
-            name='allocation_source_created_or_renewed',
-            payload__allocation_source_name__exact=str(allocation_source_name)
-        ).order_by('timestamp')
-
-        if not last_renewal_event:
-            logger.info(
-                'Allocation Source %s Create/Renewal event missing',
-                allocation_source_name
-            )
-            continue
-
-        start_date = last_renewal_event.last().timestamp.replace(
-            microsecond=0
-        ) if not start_date else start_date
-
-        total_compute_used = 0
-        total_burn_rate = 0
-        for user in allocation_source.all_users:
-            compute_used, burn_rate = total_usage(
-                user.username,
-                start_date=start_date,
-                end_date=end_date,
-                allocation_source_name=allocation_source_name,
-                burn_rate=True
-            )
 
-            UserAllocationSnapshot.objects.update_or_create(
-                allocation_source=allocation_source,
-                user=user,
-                defaults={
-                    'compute_used': compute_used,
-                    'burn_rate': burn_rate
-                }
-            )
-            total_compute_used += compute_used
-            total_burn_rate += burn_rate
-        AllocationSourceSnapshot.objects.update_or_create(
-            allocation_source=allocation_source,
-            defaults={
-                'compute_used': total_compute_used,
-                'global_burn_rate': total_burn_rate
-            }
-        )
+def _save_and_check_snapshots(usage, end_date):
+    logger.debug("update_snapshot_cyverse task started at %s." % datetime.now())
+    save_snapshots(usage)
 
+    for allocation_source in AllocationSource.objects.filter(
+        id__in=usage.keys()
+    ).order_by('name'):
         run_all(
             rule_list=cyverse_rules,
             defined_variables=CyverseTestRenewalVariables(
                 allocation_source,
                 current_time=end_date,
-                last_renewal_event_date=start_date
+                last_renewal_event_date=usage[allocation_source.id]
+                ['start_date']
             ),
             defined_actions=CyverseTestRenewalActions(
                 allocation_source, current_time=end_date
@@ -130,42 +122,76 @@ def allocation_threshold_check():
         )
         return
 
-    for allocation_source in AllocationSource.objects.filter(
+    allocation_sources = AllocationSource.objects.filter(
         compute_allowed__gte=0
-    ).all():
-        snapshot = allocation_source.snapshot
-        percentage_used = (
-            snapshot.compute_used / snapshot.compute_allowed
-        ) * 100
-        # check if percentage more than threshold
-        THRESHOLD = [50.0, 90.0]
-        for threshold in THRESHOLD:
-            if percentage_used > threshold:
-                allocation_source_name = allocation_source.name
+    ).select_related('snapshot')
+    new_events = _get_threshold_met_events(allocation_sources)
+    if new_events:
+        EventTable.create_events(new_events)
+    logger.debug(
+        "allocation_threshold_check task finished at %s." % datetime.now()
+    )
 
-                # check if event has been fired
-                prev_event = EventTable.objects.filter(
-                    name='allocation_source_threshold_met',
-                    payload__allocation_source_name=allocation_source_name,
-                    payload__threshold=threshold
-                ).last()
-                if prev_event:
-                    continue
-
-                payload = {}
-                payload['allocation_source_name'] = allocation_source_name
-                payload['threshold'] = threshold
-                payload['usage_percentage'] = float(percentage_used)
-
-                EventTable.objects.create(
+
+def _get_threshold_met_events(allocation_sources):
+    """
+    Return the (unsaved) 'allocation_source_threshold_met' events for every
+    allocation source that has crossed a threshold which was not already met
+    since the allocation source was last created/renewed.
+    """
+    usage_percentages = {}
+    for allocation_source in allocation_sources:
+        try:
+            snapshot = allocation_source.snapshot
+        except AllocationSourceSnapshot.DoesNotExist:
+            continue
+        if snapshot.compute_allowed <= 0:
+            continue
+        usage_percentages[
+            allocation_source.name
+        ] = (snapshot.compute_used / snapshot.compute_allowed) * 100
+    if not usage_percentages:
+        return []
+
+    renewal_dates = get_renewal_dates(allocation_sources)
+    thresholds_met = set()
+    for allocation_source_name, payload, timestamp in EventTable.objects.filter(
+        name='allocation_source_threshold_met'
+    ).annotate_payload('allocation_source_name').filter(
+        payload_allocation_source_name__in=usage_percentages.keys()
+    ).values_list('payload_allocation_source_name', 'payload', 'timestamp'):
+        renewal_date = renewal_dates.get(allocation_source_name)
+        if renewal_date and timestamp < renewal_date:
+            # Met during a previous allocation period
+            continue
+        thresholds_met.add(
+            (allocation_source_name, float(payload.get('threshold', 0)))
+        )
+
+    new_events = []
+    for allocation_source_name, percentage_used in sorted(
+        usage_percentages.items()
+    ):
+        for threshold in THRESHOLD:
+            if percentage_used <= threshold:
+                continue
+            # check if event has been fired
+            if (allocation_source_name, threshold) in thresholds_met:
+                continue
+            payload = {
+                'allocation_source_name': allocation_source_name,
+                'threshold': threshold,
+                'usage_percentage': float(percentage_used)
+            }
+            new_events.append(
+                EventTable(
                     name='allocation_source_threshold_met',
                     payload=payload,
-                    entity_id=payload['allocation_source_name']
+                    entity_id=allocation_source_name
                 )
-                break
-    logger.debug(
-        "allocation_threshold_check task finished at %s." % datetime.now()
-    )
+            )
+            break
+    return new_events
 
 
 # Renew all allocation sources or a specific renewal strategy without waiting for rules engine
@@ -42,23 +42,6 @@ def we_clear_the_local_cache(context):
     context.test.assertListEqual(context.driver.project_list, [])
     context.test.assertListEqual(context.driver.allocation_list, [])
 
-    jetstream_allocation.TASAPIDriver.username_map = {}
-    jetstream_allocation.TASAPIDriver.user_project_list = []
-    jetstream_allocation.TASAPIDriver.project_list = []
-    jetstream_allocation.TASAPIDriver.allocation_list = []
-    context.test.assertDictEqual(
-        jetstream_allocation.TASAPIDriver.username_map, {}
-    )
-    context.test.assertListEqual(
-        jetstream_allocation.TASAPIDriver.user_project_list, []
-    )
-    context.test.assertListEqual(
-        jetstream_allocation.TASAPIDriver.project_list, []
-    )
-    context.test.assertListEqual(
-        jetstream_allocation.TASAPIDriver.allocation_list, []
-    )
-
     reset_mock_tas_fixtures(context)
 
 
@@ -145,15 +128,24 @@ def we_fill_user_allocation_sources_from_tas(context):
         mock_methods['tacc_api_get'].side_effect = _make_mock_tacc_api_get(
             context
         )
-        jetstream_allocation.fill_user_allocation_sources()
-    pass
+        # Keep the driver that was used: its caches are not shared
+        driver_class = jetstream_allocation.TASAPIDriver
+
+        def _create_driver(*args, **kwargs):
+            context.fill_driver = driver_class(*args, **kwargs)
+            return context.fill_driver
+
+        with mock.patch(
+            'jetstream.allocation.TASAPIDriver', side_effect=_create_driver
+        ):
+            jetstream_allocation.fill_user_allocation_sources()
 
 
 @then(u'we should have the following local username mappings')
 def we_should_have_the_following_local_username_mappings(context):
     expected_username_map = dict(row.cells for row in context.table)
     context.test.assertDictEqual(
-        expected_username_map, jetstream_allocation.TASAPIDriver.username_map
+        expected_username_map, context.fill_driver.username_map
     )
 
 
@@ -1,4 +1,5 @@
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 from django.db import IntegrityError
 from django.utils import timezone
@@ -14,14 +15,14 @@ from threepio import logger
 
 
 class TASAPIDriver(object):
+    """
+    Project, allocation and username lookups are cached for the lifetime of
+    the driver: Share one driver for the duration of a (reporting) run.
+    """
     tacc_api = None
     tacc_username = None
     tacc_password = None
     timeout = None
-    allocation_list = []
-    project_list = []
-    user_project_list = []
-    username_map = {}
 
     def __init__(
         self,
@@ -42,6 +43,7 @@ class TASAPIDriver(object):
         self.tacc_password = tacc_password
         self.resource_name = resource_name
         self.timeout = timeout
+        self.clear_cache()
 
     def _tacc_api_get(self, url):
         return tacc_api_get(
@@ -62,6 +64,24 @@ class TASAPIDriver(object):
         self.project_list = []
         self.allocation_list = []
         self.username_map = {}
+        # username -> the exception raised when resolving its TACC username
+        self.unresolved_usernames = {}
+        self._indexes = {}
+
+    def _index(self, name, items, keys):
+        """
+        Return a dict of key -> list of the `items` with that key, for every
+        key in `keys(item)`. The index is re-built whenever `items` is
+        replaced (i.e. when the list is refreshed).
+        """
+        indexed_items, index = self._indexes.get(name, (None, None))
+        if indexed_items is not items:
+            index = {}
+            for item in items:
+                for key in keys(item):
+                    index.setdefault(key, []).append(item)
+            self._indexes[name] = (items, index)
+        return index
 
     def get_all_allocations(self):
         if not self.allocation_list:
@@ -74,35 +94,68 @@ class TASAPIDriver(object):
         return self.project_list
 
     def get_tacc_username(self, user, raise_exception=False):
+        """
+        Users that could not be resolved are not looked up again by this
+        driver (see `clear_cache`).
+        """
         if self.username_map.get(user.username):
             return self.username_map[user.username]
+        if user.username in self.unresolved_usernames:
+            if raise_exception:
+                raise self.unresolved_usernames[user.username]
+            return None
         tacc_user = None
         try:
             tacc_user = self._xsede_to_tacc_username(user.username)
-        except NoTaccUserForXsedeException:
+        except NoTaccUserForXsedeException as exc:
             logger.exception('User: %s has no TACC username', user.username)
+            self.unresolved_usernames[user.username] = exc
             if raise_exception:
                 raise
-        except TASAPIException:
+        except TASAPIException as exc:
             logger.exception(
                 'Some exception happened while getting TACC username for user: %s',
                 user.username
             )
+            self.unresolved_usernames[user.username] = exc
             if raise_exception:
                 raise
         else:
             self.username_map[user.username] = tacc_user
         return tacc_user
 
+    def get_tacc_usernames(self, users):
+        """
+        Resolve the TACC username of every user (at most
+        settings.TAS_API_CONCURRENCY at a time).
+        Returns a dict of username -> TACC username (None if unresolved)
+        """
+        users = dict((user.username, user) for user in users)
+        unresolved = [
+            user for username, user in users.items()
+            if username not in self.username_map
+            and username not in self.unresolved_usernames
+        ]
+        if unresolved:
+            max_workers = getattr(settings, 'TAS_API_CONCURRENCY', 4)
+            with ThreadPoolExecutor(
+                max_workers=min(max_workers, len(unresolved))
+            ) as executor:
+                list(executor.map(self.get_tacc_username, unresolved))
+        return dict(
+            (username, self.username_map.get(username)) for username in users
+        )
+
     def find_projects_for(self, tacc_username):
         if not self.user_project_list:
             self.user_project_list = self.get_all_project_users()
         if not tacc_username:
             return self.user_project_list
-        filtered_user_list = [
-            p for p in self.user_project_list if tacc_username in p['users']
-        ]
-        return filtered_user_list
+        projects_by_user = self._index(
+            'projects_by_user', self.user_project_list,
+            lambda p: set(p['users'])
+        )
+        return list(projects_by_user.get(tacc_username, []))
 
     def find_allocations_for(self, tacc_username):
         api_projects = self.find_projects_for(tacc_username)
@@ -209,10 +262,10 @@ class TASAPIDriver(object):
         return allocation['project']
 
     def get_project(self, project_id):
-        filtered_list = [
-            p
-            for p in self.get_all_projects() if str(p['id']) == str(project_id)
-        ]
+        projects_by_id = self._index(
+            'projects_by_id', self.get_all_projects(), lambda p: [str(p['id'])]
+        )
+        filtered_list = projects_by_id.get(str(project_id), [])
         if len(filtered_list) > 1:
             logger.error(">1 value found for project %s" % project_id)
         if filtered_list:
@@ -220,10 +273,11 @@ class TASAPIDriver(object):
         return None
 
     def get_allocation(self, allocation_name):
-        filtered_list = [
-            a for a in self.get_all_allocations()
-            if str(a['project']) == str(allocation_name)
-        ]
+        allocations_by_name = self._index(
+            'allocations_by_name', self.get_all_allocations(),
+            lambda a: [str(a['project'])]
+        )
+        filtered_list = allocations_by_name.get(str(allocation_name), [])
         if len(filtered_list) > 1:
             logger.error(">1 value found for allocation %s" % allocation_name)
         if filtered_list:
@@ -36,7 +36,7 @@ class TASAllocationReport(models.Model):
     class Meta:
         app_label = 'jetstream'
 
-    def send(self, use_beta=False):
+    def send(self, use_beta=False, driver=None):
         if not self.id:
             raise Exception(
                 "ERROR -- This report should be *saved* before you send it!"
@@ -51,7 +51,7 @@ class TASAllocationReport(models.Model):
                 driver = TASAPIDriver(
                     BETA_TACC_API_URL, BETA_TACC_API_USER, BETA_TACC_API_PASS
                 )
-            else:
+            elif not driver:
                 driver = TASAPIDriver()
             success = driver.report_project_allocation(
                 self.id, self.username, self.project_name,
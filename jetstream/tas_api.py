@@ -1,3 +1,5 @@
+import threading
+
 import requests
 
 from django.conf import settings
@@ -7,6 +9,28 @@ from .exceptions import TASAPIException
 
 from threepio import logger
 
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session():
+    """
+    Return the (process-wide) session used to talk to the TAS API, so that
+    connections are re-used between requests.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_maxsize=getattr(settings, 'TAS_API_CONCURRENCY', 4)
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
 
 def tacc_api_post(url, post_data, username=None, password=None, timeout=None):
     if not username:
@@ -15,7 +39,7 @@ def tacc_api_post(url, post_data, username=None, password=None, timeout=None):
         password = settings.TACC_API_PASS
     logger.debug('url: %s', url)
     # logger.debug("REQ BODY: %s" % post_data)
-    resp = requests.post(
+    resp = _get_session().post(
         url, post_data, auth=(username, password), timeout=timeout
     )
     logger.debug('resp.status_code: %s', resp.status_code)
@@ -30,7 +54,7 @@ def tacc_api_get(url, username=None, password=None, timeout=None):
     if not password:
         password = settings.TACC_API_PASS
     logger.debug('url: %s', url)
-    resp = requests.get(url, auth=(username, password), timeout=timeout)
+    resp = _get_session().get(url, auth=(username, password), timeout=timeout)
     logger.debug('resp.status_code: %s', resp.status_code)
     # logger.debug('resp.__dict__: %s', resp.__dict__)
     if resp.status_code != 200:
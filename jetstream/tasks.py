@@ -1,6 +1,10 @@
+from collections import OrderedDict
+
+from concurrent.futures import ThreadPoolExecutor
 from celery.decorators import task
 from django.conf import settings
 from django.utils import timezone
+from django.db import connection
 from django.db.models import Q, Max
 
 from core.models import EventTable, AtmosphereUser
@@ -35,7 +39,9 @@ def create_reports():
     if 'TACC username' includes a jetstream resource, create a report
     """
     logger.debug('create_reports - START')
-    user_allocation_list = UserAllocationSource.objects.all()
+    user_allocation_list = UserAllocationSource.objects.select_related(
+        'user', 'allocation_source'
+    )
     all_reports = []
     end_date = timezone.now()
     logger.debug('create_reports - end_date: %s', end_date)
@@ -49,39 +55,58 @@ def create_reports():
         last_report_date = max_report_end_date['end_date__max']
     logger.info('create_reports - last_report_date: %s', last_report_date)
 
+    # filter user_allocation_source_removed events which are created after the last report date
+    deleted_events = list(
+        EventTable.objects.filter(
+            name="user_allocation_source_deleted",
+            timestamp__gte=last_report_date
+        ).order_by('timestamp')
+    )
+    deleted_users = AtmosphereUser.objects.in_bulk(
+        set(event.entity_id for event in deleted_events), field_name='username'
+    )
+
+    # One driver (and so, one download of the TAS projects and allocations)
+    # for the whole run. TACC usernames are resolved up front.
+    driver = TASAPIDriver()
+    driver.get_tacc_usernames(
+        [item.user for item in user_allocation_list] + deleted_users.values()
+    )
+
     for item in user_allocation_list:
         allocation_name = item.allocation_source.name
         logger.debug('create_reports - allocation_name: %s', allocation_name)
         logger.debug('create_reports - item.user: %s', item.user)
         project_report = _create_reports_for(
-            item.user, allocation_name, end_date
+            item.user, allocation_name, end_date, driver=driver
         )
         if project_report:
             all_reports.append(project_report)
 
     # Take care of Deleted Users
-
-    # filter user_allocation_source_removed events which are created after the last report date
-
-    for event in EventTable.objects.filter(
-        name="user_allocation_source_deleted", timestamp__gte=last_report_date
-    ).order_by('timestamp'):
-
-        user = AtmosphereUser.objects.get(username=event.entity_id)
+    for event in deleted_events:
+        user = deleted_users.get(event.entity_id)
+        if not user:
+            raise AtmosphereUser.DoesNotExist(
+                "User '%s' does not exist" % event.entity_id
+            )
         allocation_name = event.payload['allocation_source_name']
         end_date = event.timestamp
-        project_report = _create_reports_for(user, allocation_name, end_date)
+        project_report = _create_reports_for(
+            user, allocation_name, end_date, driver=driver
+        )
         if project_report:
             all_reports.append(project_report)
     return all_reports
 
 
-def _create_reports_for(user, allocation_name, end_date):
+def _create_reports_for(user, allocation_name, end_date, driver=None):
     logger.debug(
         '_create_reports_for - user: %s, allocation_name: %s, end_date: %s',
         user, allocation_name, end_date
     )
-    driver = TASAPIDriver()
+    if not driver:
+        driver = TASAPIDriver()
     tacc_username = driver.get_tacc_username(user)
     if not tacc_username:
         logger.error(
@@ -158,24 +183,43 @@ def report_allocations_to_tas():
 
 
 def send_reports():
-    failed_reports = 0
+    """
+    Send every unsent report, at most settings.TAS_API_CONCURRENCY users at a
+    time. The reports of each user are sent in order.
+    """
     reports_to_send = TASAllocationReport.objects.filter(
         Q(compute_used__gt=0, success=False)
     ).order_by('user__username', 'start_date')
-    count = reports_to_send.count()
+    reports_by_user = OrderedDict()
+    for tas_report in reports_to_send:
+        reports_by_user.setdefault(tas_report.user_id, []).append(tas_report)
+    count = sum(len(reports) for reports in reports_by_user.values())
     logger.info('send_reports - count: %d', count)
-    for current_report_index, tas_report in enumerate(reports_to_send):
-        logger.debug(
-            'send_reports - current_report_index: %d', current_report_index
-        )
+    if not count:
+        return
+    driver = TASAPIDriver()
+
+    def _send_all(user_reports):
+        failed_reports = 0
         try:
-            tas_report.send()
-        except TASPluginException:
-            logger.exception(
-                "Could not send the report because of the error below"
-            )
-            failed_reports += 1
-            continue
+            for tas_report in user_reports:
+                logger.debug('send_reports - report: %s', tas_report.id)
+                try:
+                    tas_report.send(driver=driver)
+                except TASPluginException:
+                    logger.exception(
+                        "Could not send the report because of the error below"
+                    )
+                    failed_reports += 1
+        finally:
+            # Each worker thread has its own database connection
+            connection.close()
+        return failed_reports
+
+    max_workers = getattr(settings, 'TAS_API_CONCURRENCY', 4)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(reports_by_user))
+                           ) as executor:
+        failed_reports = sum(executor.map(_send_all, reports_by_user.values()))
     if failed_reports != 0:
         raise Exception(
             "%s/%s reports failed to send to TAS" % (failed_reports, count)
@@ -203,8 +247,9 @@ def update_snapshot(start_date=None, end_date=None):
                 continue
 
             created_or_updated_event = EventTable.objects.filter(
-                name='allocation_source_created_or_renewed',
-                payload__allocation_source_name=allocation_source.name
+                name='allocation_source_created_or_renewed'
+            ).annotate_payload('allocation_source_name').filter(
+                payload_allocation_source_name=allocation_source.name
             ).order_by('timestamp').last()
 
             if created_or_updated_event:
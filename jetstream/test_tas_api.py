@@ -1,5 +1,6 @@
 import json
 import memoize
+import mock
 import freezegun
 import vcr
 from django.test import TestCase, override_settings, modify_settings
@@ -97,3 +98,73 @@ class TestJetstream(TestCase):
         self.assertIsNone(tacc_username)
         self.assertDictEqual(tas_driver.username_map, {})
         assert_cassette_playback_length(cassette, 1)
+
+    def test_get_tacc_usernames(self):
+        """Each user is resolved once, by a driver shared for the whole run"""
+        from jetstream.allocation import TASAPIDriver
+        from jetstream.exceptions import NoTaccUserForXsedeException
+
+        def _xsede_to_tacc_username(xsede_username):
+            if xsede_username == 'nobody':
+                raise NoTaccUserForXsedeException('No valid username')
+            return 'tacc_%s' % xsede_username
+
+        tas_driver = TASAPIDriver()
+        users = [
+            UserFactory.create(username=username)
+            for username in ('sgregory', 'jfischer', 'nobody')
+        ]
+        with mock.patch.object(
+            tas_driver,
+            '_xsede_to_tacc_username',
+            side_effect=_xsede_to_tacc_username
+        ) as lookup:
+            tacc_usernames = tas_driver.get_tacc_usernames(users)
+            tas_driver.get_tacc_usernames(users[:2])
+            self.assertEqual(
+                tas_driver.get_tacc_username(users[0]), 'tacc_sgregory'
+            )
+            # Unresolved users are not looked up again either
+            self.assertIsNone(tas_driver.get_tacc_username(users[2]))
+            with self.assertRaises(NoTaccUserForXsedeException):
+                tas_driver.get_tacc_username(users[2], raise_exception=True)
+
+        self.assertDictEqual(
+            tacc_usernames, {
+                'sgregory': 'tacc_sgregory',
+                'jfischer': 'tacc_jfischer',
+                'nobody': None
+            }
+        )
+        self.assertEqual(lookup.call_count, 3)
+
+    def test_indexed_lookups(self):
+        """Lookups use the latest lists, even when they are replaced"""
+        from jetstream.allocation import TASAPIDriver
+        tas_driver = TASAPIDriver()
+        tas_driver.user_project_list = [
+            {
+                'id': 1,
+                'users': ['alice', 'bob']
+            }, {
+                'id': 2,
+                'users': ['bob', 'bob']
+            }
+        ]
+        tas_driver.project_list = tas_driver.user_project_list
+        tas_driver.allocation_list = [{'id': 10, 'project': 'TG-1'}]
+
+        self.assertEqual(
+            [p['id'] for p in tas_driver.find_projects_for('bob')], [1, 2]
+        )
+        self.assertEqual(tas_driver.find_projects_for('carol'), [])
+        self.assertEqual(tas_driver.get_project('2')['id'], 2)
+        self.assertEqual(tas_driver.get_allocation('TG-1')['id'], 10)
+
+        tas_driver.allocation_list = [{'id': 11, 'project': 'TG-1'}]
+        self.assertEqual(tas_driver.get_allocation('TG-1')['id'], 11)
+        tas_driver.clear_cache()
+        tas_driver.user_project_list = [{'id': 3, 'users': ['carol']}]
+        self.assertEqual(
+            [p['id'] for p in tas_driver.find_projects_for('carol')], [3]
+        )
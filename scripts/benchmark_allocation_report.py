@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+"""
+Generate synthetic users, instances, status histories and
+'instance_allocation_source_changed' events, then time
+`service.allocation_logic.create_report` against them.
+
+This script *writes* to the database, only run it against a disposable one:
+
+    ./scripts/benchmark_allocation_report.py --histories 100000 --users 50
+
+Use --skip-fixtures to re-time the report against data generated by an earlier
+run, and --cleanup to remove everything created with the same --prefix.
+"""
+import argparse
+import datetime
+import random
+import time
+import uuid
+
+import django
+django.setup()
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api.tests.factories import (
+    IdentityFactory, ProviderMachineFactory, SizeFactory, UserFactory
+)
+from core.models import (
+    AllocationSource, AtmosphereUser, EventTable, Instance, InstanceStatus,
+    InstanceStatusHistory
+)
+from service.allocation_logic import create_report
+
+STATUS_NAMES = ['active', 'active', 'active', 'suspended', 'shutoff']
+SIZE_CPUS = [1, 2, 4, 8, 16]
+
+
+def generate_fixtures(
+    prefix, user_count, history_count, histories_per_instance, days,
+    event_ratio, image_count
+):
+    """
+    Create `history_count` InstanceStatusHistory rows spread over
+    `history_count / histories_per_instance` instances owned by `user_count`
+    users, starting within the last `days` days.
+    Instances, histories and events are created with `bulk_create`, so no
+    signal handlers are fired for them.
+    """
+    now = timezone.now()
+    window_start = now - datetime.timedelta(days=days)
+
+    users = [
+        UserFactory.create(username="%s%d" % (prefix, idx))
+        for idx in range(user_count)
+    ]
+    identities = [IdentityFactory.create(created_by=users[0])]
+    provider = identities[0].provider
+    identities.extend(
+        IdentityFactory.create(created_by=user, provider=provider)
+        for user in users[1:]
+    )
+    machines = [
+        ProviderMachineFactory.create_provider_machine(users[0], identities[0])
+        for _ in range(image_count)
+    ]
+    sizes = [
+        SizeFactory.create(provider=provider, cpu=cpu) for cpu in SIZE_CPUS
+    ]
+    statuses = dict(
+        (name, InstanceStatus.objects.get_or_create(name=name)[0])
+        for name in set(STATUS_NAMES)
+    )
+    allocation_sources = [
+        AllocationSource.objects.get_or_create(
+            name="%s-source-%d" % (prefix, idx),
+            defaults={'compute_allowed': 1000}
+        )[0] for idx in range(max(1, user_count / 2))
+    ]
+
+    instance_count = max(1, history_count / histories_per_instance)
+    # (In seconds) Histories average half of this, so each instance started
+    # in the first half of the window will usually end within it.
+    max_length = max(601, days * 86400 / histories_per_instance)
+    instances = []
+    for _ in range(instance_count):
+        owner_idx = random.randrange(user_count)
+        start_date = window_start + datetime.timedelta(
+            seconds=random.randrange(days * 86400 / 2)
+        )
+        instances.append(
+            Instance(
+                name="%s-instance" % prefix,
+                provider_alias="%s-%s" % (prefix, uuid.uuid4()),
+                source=random.choice(machines).instance_source,
+                created_by=users[owner_idx],
+                created_by_identity=identities[owner_idx],
+                start_date=start_date
+            )
+        )
+    with transaction.atomic():
+        Instance.objects.bulk_create(instances, batch_size=5000)
+
+    histories = []
+    events = []
+    for instance in instances:
+        start_date = instance.start_date
+        for idx in range(histories_per_instance):
+            end_date = start_date + datetime.timedelta(
+                seconds=random.randrange(600, max_length)
+            )
+            is_last = idx == histories_per_instance - 1
+            histories.append(
+                InstanceStatusHistory(
+                    instance=instance,
+                    size=random.choice(sizes),
+                    status=statuses[random.choice(STATUS_NAMES)],
+                    start_date=start_date,
+                    end_date=None if is_last and random.random() < 0.5 else
+                    min(end_date, now)
+                )
+            )
+            start_date = min(end_date, now)
+        if random.random() < event_ratio:
+            # Assign a source before the instance started, then switch it
+            # part-way through its lifetime.
+            for timestamp in (
+                instance.start_date - datetime.timedelta(minutes=1),
+                instance.start_date + (start_date - instance.start_date) / 2
+            ):
+                events.append(
+                    EventTable(
+                        name='instance_allocation_source_changed',
+                        entity_id=instance.created_by.username,
+                        payload={
+                            'instance_id':
+                                instance.provider_alias,
+                            'allocation_source_name':
+                                random.choice(allocation_sources).name
+                        },
+                        timestamp=timestamp
+                    )
+                )
+    with transaction.atomic():
+        InstanceStatusHistory.objects.bulk_create(histories, batch_size=5000)
+        EventTable.objects.bulk_create(events, batch_size=5000)
+    return len(instances), len(histories), len(events)
+
+
+def cleanup_fixtures(prefix):
+    with transaction.atomic():
+        EventTable.objects.filter(
+            name='instance_allocation_source_changed',
+            entity_id__startswith=prefix
+        ).delete()
+        # Cascades to the status histories
+        Instance.objects.filter(provider_alias__startswith=prefix).delete()
+        AllocationSource.objects.filter(name__startswith=prefix).delete()
+        AtmosphereUser.objects.filter(username__startswith=prefix).delete()
+
+
+def time_report(start_date, end_date, username=None):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.time()
+        rows = create_report(start_date, end_date, user_id=username)
+        elapsed = time.time() - started
+    print "create_report(user=%s): %d rows, %d queries, %.2f seconds" % (
+        username, len(rows), len(queries.captured_queries), elapsed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--prefix",
+        default="allocbench",
+        help="Prefix used to name (and clean up) all generated data"
+    )
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--histories", type=int, default=100000)
+    parser.add_argument("--histories-per-instance", type=int, default=20)
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=90,
+        help="Spread the generated histories over this many days"
+    )
+    parser.add_argument(
+        "--event-ratio",
+        type=float,
+        default=0.5,
+        help="Fraction of instances that change allocation source"
+    )
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--skip-fixtures",
+        action="store_true",
+        help="Time the report against previously generated data"
+    )
+    parser.add_argument(
+        "--cleanup",
+        action="store_true",
+        help="Delete all data generated with --prefix and exit"
+    )
+    args = parser.parse_args()
+
+    if args.cleanup:
+        cleanup_fixtures(args.prefix)
+        print "Removed benchmark data for prefix %s" % args.prefix
+        return
+
+    random.seed(args.seed)
+    if not args.skip_fixtures:
+        started = time.time()
+        counts = generate_fixtures(
+            args.prefix, args.users, args.histories,
+            args.histories_per_instance, args.days, args.event_ratio,
+            args.images
+        )
+        print "Generated %d instances, %d histories, %d events in %.2f seconds" % (
+            counts + (time.time() - started, )
+        )
+
+    end_date = timezone.now()
+    start_date = end_date - datetime.timedelta(days=args.days)
+    time_report(start_date, end_date)
+    time_report(start_date, end_date, username="%s0" % args.prefix)
+
+
+if __name__ == "__main__":
+    main()
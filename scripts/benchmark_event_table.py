@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+Seed a (large) number of events, then print the query plans and timings of
+the hot EventTable payload lookups:
+- without the payload indexes (dropped inside a transaction that is rolled
+  back, so nothing is lost)
+- with the payload expression indexes
+- reading the projection columns (EVENT_TABLE_USE_PROJECTION)
+
+This script *writes* to the database, only run it against a disposable one:
+
+    ./scripts/benchmark_event_table.py --events 1000000
+
+Use --skip-fixtures to re-run the queries against events seeded by an earlier
+run, and --cleanup to remove everything seeded with the same --prefix.
+"""
+import argparse
+import datetime
+import time
+
+import django
+django.setup()
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.models import EventTable
+
+EVENT_NAMES = [
+    'instance_allocation_source_changed',
+    'instance_allocation_source_changed',
+    'user_allocation_snapshot_changed',
+    'allocation_source_created_or_renewed',
+    'allocation_source_threshold_met',
+]
+
+SEED_SQL = """
+INSERT INTO event_table (uuid, entity_id, name, payload, timestamp,
+                         instance_id, username, allocation_source_name)
+SELECT md5(%(prefix)s || g)::uuid,
+       %(prefix)s || 'user' || (g %% %(users)s),
+       (%(names)s::text[])[1 + g %% %(name_count)s],
+       payload,
+       now() - (g %% 525600) * interval '1 minute',
+       payload ->> 'instance_id',
+       payload ->> 'username',
+       payload ->> 'allocation_source_name'
+FROM (
+    SELECT g, jsonb_build_object(
+        'instance_id', %(prefix)s || 'instance' || (g %% %(instances)s),
+        'username', %(prefix)s || 'user' || (g %% %(users)s),
+        'allocation_source_name', %(prefix)s || 'source' || (g %% %(sources)s),
+        'threshold', (ARRAY[50.0, 90.0])[1 + g %% 2]
+    ) AS payload
+    FROM generate_series(1, %(events)s) AS g
+) AS seed
+"""
+
+
+def seed_events(prefix, event_count, instance_count, user_count, source_count):
+    """
+    Insert `event_count` events (with a single INSERT ... SELECT) spread over
+    the last year, with their projection columns filled.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            SEED_SQL, {
+                'prefix': prefix,
+                'names': EVENT_NAMES,
+                'name_count': len(EVENT_NAMES),
+                'events': event_count,
+                'instances': instance_count,
+                'users': user_count,
+                'sources': source_count,
+            }
+        )
+        cursor.execute("ANALYZE event_table")
+
+
+def cleanup_events(prefix):
+    with transaction.atomic():
+        EventTable.objects.filter(entity_id__startswith=prefix).delete()
+
+
+def hot_queries(prefix):
+    """
+    The payload lookups made by the allocation reports, snapshots and threshold
+    checks. Built when called, so that EVENT_TABLE_USE_PROJECTION is honored.
+    """
+    username = "%suser1" % prefix
+    instance_ids = ["%sinstance%d" % (prefix, idx) for idx in range(200)]
+    source_names = ["%ssource%d" % (prefix, idx) for idx in range(100)]
+    return [
+        (
+            "instance_allocation_source_changed for 200 instances",
+            EventTable.objects.annotate_payload('instance_id').filter(
+                name='instance_allocation_source_changed',
+                payload_instance_id__in=instance_ids
+            )
+        ),
+        (
+            "instance_allocation_source_changed for one user (30 days)",
+            EventTable.objects.filter(
+                name='instance_allocation_source_changed',
+                timestamp__gte=timezone.now() - datetime.timedelta(days=30)
+            ).annotate_payload('username').
+            filter(Q(payload_username=username) | Q(entity_id=username))
+        ),
+        (
+            "allocation_source_created_or_renewed for 100 sources",
+            EventTable.objects.filter(
+                name='allocation_source_created_or_renewed'
+            ).annotate_payload('allocation_source_name').filter(
+                payload_allocation_source_name__in=source_names
+            )
+        ),
+        (
+            "allocation_source_threshold_met for 100 sources",
+            EventTable.objects.filter(
+                name='allocation_source_threshold_met'
+            ).annotate_payload('allocation_source_name').filter(
+                payload_allocation_source_name__in=source_names
+            )
+        ),
+    ]
+
+
+def explain(title, queryset, verbose):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        started = time.time()
+        cursor.execute("EXPLAIN ANALYZE " + sql, params)
+        plan = [row[0] for row in cursor.fetchall()]
+        elapsed = time.time() - started
+    print "  %s: %.1f ms" % (title, elapsed * 1000)
+    for line in plan if verbose else plan[:1]:
+        print "    %s" % line
+
+
+def drop_payload_indexes():
+    """
+    Drop (in the current transaction) every event_table index on a payload
+    expression or a projection column.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT indexname FROM pg_indexes WHERE tablename = 'event_table' "
+            "AND indexdef ~ '(payload|instance_id|username|allocation_source_name)'"
+        )
+        index_names = [row[0] for row in cursor.fetchall()]
+        for index_name in index_names:
+            cursor.execute(
+                "DROP INDEX %s" % connection.ops.quote_name(index_name)
+            )
+    return index_names
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--prefix",
+        default="eventbench",
+        help="Prefix used to name (and clean up) all seeded events"
+    )
+    parser.add_argument("--events", type=int, default=1000000)
+    parser.add_argument("--instances", type=int, default=50000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--sources", type=int, default=2000)
+    parser.add_argument(
+        "--verbose", action="store_true", help="Print the full query plans"
+    )
+    parser.add_argument(
+        "--skip-fixtures",
+        action="store_true",
+        help="Query the events seeded by an earlier run"
+    )
+    parser.add_argument(
+        "--cleanup",
+        action="store_true",
+        help="Delete all events seeded with --prefix and exit"
+    )
+    args = parser.parse_args()
+
+    if args.cleanup:
+        cleanup_events(args.prefix)
+        print "Removed benchmark events for prefix %s" % args.prefix
+        return
+
+    if not args.skip_fixtures:
+        started = time.time()
+        seed_events(
+            args.prefix, args.events, args.instances, args.users, args.sources
+        )
+        print "Seeded %d events in %.1f seconds" % (
+            args.events, time.time() - started
+        )
+
+    print "Without payload indexes:"
+    with transaction.atomic():
+        print "  (Dropped %s)" % ', '.join(drop_payload_indexes())
+        for title, queryset in hot_queries(args.prefix):
+            explain(title, queryset, args.verbose)
+        # Restore the indexes
+        transaction.set_rollback(True)
+
+    print "With payload expression indexes:"
+    with override_settings(EVENT_TABLE_USE_PROJECTION=False):
+        for title, queryset in hot_queries(args.prefix):
+            explain(title, queryset, args.verbose)
+
+    print "With projection columns:"
+    with override_settings(EVENT_TABLE_USE_PROJECTION=True):
+        for title, queryset in hot_queries(args.prefix):
+            explain(title, queryset, args.verbose)
+
+
+if __name__ == "__main__":
+    main()
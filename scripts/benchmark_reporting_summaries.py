@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""
+Time the summaries of the instance reports (`core.metrics.reporting`)
+against a synthetic report, and compare them with the per-cell and repeated
+set_index/query implementation they replaced:
+
+    ./scripts/benchmark_reporting_summaries.py --rows 500000
+
+No database access is made.
+"""
+import argparse
+import time
+
+import django
+django.setup()
+import numpy as np
+import pandas as pd
+
+from api.v2.views.reporting import HEADERS_ORDERING
+from core.metrics.reporting import create_datasets
+
+
+def generate_report(row_count, user_count, image_count, seed):
+    """
+    Returns a DataFrame shaped like the rows of the reporting API, starting
+    over the last year.
+    """
+    random = np.random.RandomState(seed)
+    start_dates = pd.Timestamp('2017-01-01') + pd.to_timedelta(
+        random.randint(0, 365 * 24 * 60, row_count), unit='m'
+    )
+    end_dates = start_dates + pd.to_timedelta(
+        random.randint(1, 30 * 24 * 60, row_count), unit='m'
+    )
+    hits = random.randint(0, 4, row_count)
+    hit_active = hits == 0
+    hit_deploy_error = hits == 1
+    hit_error = hits == 2
+    hit_aborted = hits == 3
+    columns = {
+        'id':
+            np.arange(row_count),
+        'instance_id': ['instance-%d' % idx for idx in range(row_count)],
+        'username':
+            np.array(['user%d' % idx for idx in range(user_count)])[
+                random.randint(0, user_count, row_count)],
+        'staff_user':
+            'False',
+        'provider':
+            'Benchmark Cloud',
+        'start_date':
+            start_dates.strftime('%x %X'),
+        'end_date':
+            end_dates.strftime('%x %X'),
+        'image_name':
+            np.array(['image%d' % idx for idx in range(image_count)])[
+                random.randint(0, image_count, row_count)],
+        'version_name':
+            '1.0',
+        'size.active':
+            True,
+        'size.start_date':
+            '2017-01-01T00:00:00Z',
+        'size.end_date':
+            None,
+        'size.name':
+            'm1.small',
+        'size.id':
+            1,
+        'size.uuid':
+            '00000000-0000-0000-0000-000000000000',
+        'size.url':
+            '/api/v2/sizes/00000000-0000-0000-0000-000000000000',
+        'size.alias':
+            '1',
+        'size.cpu':
+            1,
+        'size.mem':
+            2048,
+        'size.disk':
+            20,
+        'is_featured_image':
+            random.randint(0, 4, row_count) > 0,
+        'hit_active':
+            hit_active,
+        'hit_deploy_error':
+            hit_deploy_error,
+        'hit_error':
+            hit_error,
+        'hit_aborted':
+            hit_aborted,
+        'hit_active_or_aborted': (hit_active | hit_aborted).astype(int),
+        'hit_active_or_aborted_or_error':
+            (hit_active | hit_aborted | hit_error).astype(int),
+    }
+    return pd.DataFrame(columns, columns=HEADERS_ORDERING)
+
+
+def legacy_create_datasets(raw_dataframe, frequency):
+    """
+    The implementation replaced by `core.metrics.reporting.create_datasets`
+    """
+    raw_dataframe['start_date'] = raw_dataframe['start_date'].apply(
+        pd.to_datetime
+    )
+    raw_dataframe['end_date'] = raw_dataframe['end_date'].apply(pd.to_datetime)
+    global_summary_data = raw_dataframe.set_index('start_date').query(
+        'is_featured_image == 1'
+    ).resample(frequency).aggregate([np.mean, np.sum])
+    user_summary_data = raw_dataframe.query('is_featured_image == 1').set_index(
+        ['start_date', 'username']
+    )
+    image_summary_data = raw_dataframe.query('is_featured_image == 1'
+                                            ).set_index(
+                                                ['start_date', 'image_name']
+                                            )
+    global_summary_data = global_summary_data.drop(
+        [
+            'is_featured_image', 'hit_active', 'hit_aborted',
+            'hit_deploy_error', 'hit_error', 'id', 'size.active', 'size.cpu',
+            'size.disk', 'size.id', 'size.mem'
+        ],
+        axis=1
+    )
+    user_summary_data = user_summary_data.groupby(
+        [
+            pd.Grouper(freq=frequency, level=0),
+            user_summary_data.index.get_level_values(1)
+        ]
+    ).aggregate([np.mean, np.sum])
+    user_summary_data = user_summary_data.drop(
+        [
+            'is_featured_image', 'hit_error', 'id', 'size.active', 'size.cpu',
+            'size.disk', 'size.id', 'size.mem'
+        ],
+        axis=1
+    )
+    image_summary_data = image_summary_data.groupby(
+        [
+            pd.Grouper(freq=frequency, level=0),
+            image_summary_data.index.get_level_values(1)
+        ]
+    ).aggregate([np.mean, np.sum])
+    image_summary_data = image_summary_data.drop(
+        [
+            'is_featured_image', 'hit_active', 'hit_aborted',
+            'hit_deploy_error', 'hit_error', 'id', 'size.active', 'size.cpu',
+            'size.disk', 'size.id', 'size.mem'
+        ],
+        axis=1
+    )
+    return {
+        'User Summary': user_summary_data,
+        'Image Summary': image_summary_data,
+        'Global Summary': global_summary_data,
+    }
+
+
+def time_datasets(name, create, raw_dataframe, frequency):
+    raw_dataframe = raw_dataframe.copy()
+    started = time.time()
+    datasets = create(raw_dataframe, frequency)
+    print "%s: %.2f seconds" % (name, time.time() - started)
+    return datasets
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--frequency", default='MS')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--skip-legacy",
+        action="store_true",
+        help="Only time the vectorized summaries"
+    )
+    args = parser.parse_args()
+
+    started = time.time()
+    raw_dataframe = generate_report(
+        args.rows, args.users, args.images, args.seed
+    )
+    print "Generated %d rows in %.2f seconds" % (
+        args.rows, time.time() - started
+    )
+
+    datasets = time_datasets(
+        "create_datasets", create_datasets, raw_dataframe, args.frequency
+    )
+    if args.skip_legacy:
+        return
+    legacy_datasets = time_datasets(
+        "create_datasets (legacy)", legacy_create_datasets, raw_dataframe,
+        args.frequency
+    )
+    for name, legacy_summary in legacy_datasets.items():
+        summary = datasets[name]
+        same = (
+            summary.shape == legacy_summary.shape and
+            np.allclose(summary.values, legacy_summary.values, equal_nan=True)
+        )
+        print "%s: %s" % (name, "same values" if same else "DIFFERENT values")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Time the TASAPIDriver lookups (`find_projects_for`, `get_allocation` and
+`get_project`) against a synthetic TAS payload, and compare them with the
+linear scans they replaced:
+
+    ./scripts/benchmark_tas_driver.py --users 50000 --projects 5000
+
+No requests are made to the TAS API.
+"""
+import argparse
+import random
+import time
+
+import django
+django.setup()
+
+from jetstream.allocation import TASAPIDriver
+
+
+def generate_payload(user_count, project_count, members_per_project):
+    """
+    Returns (usernames, projects, allocations), shaped like the TAS API
+    results.
+    Every project has `members_per_project` (random) users, and one allocation.
+    """
+    usernames = ["tacc%d" % idx for idx in range(user_count)]
+    projects = []
+    allocations = []
+    for idx in range(project_count):
+        charge_code = "TG-BENCH%06d" % idx
+        allocation = {
+            'id': idx,
+            'project': charge_code,
+            'status': 'Active',
+            'resource': 'Jetstream',
+            'computeAllocated': 1000,
+            'start': '2017-01-01T05:00:00Z',
+            'end': '2027-01-01T05:00:00Z',
+        }
+        projects.append(
+            {
+                'id': idx,
+                'chargeCode': charge_code,
+                'allocations': [allocation],
+                'users': random.sample(usernames, members_per_project),
+            }
+        )
+        allocations.append(allocation)
+    return usernames, projects, allocations
+
+
+def linear_find_projects_for(projects, tacc_username):
+    return [p for p in projects if tacc_username in p['users']]
+
+
+def linear_get_allocation(allocations, allocation_name):
+    return [
+        a for a in allocations if str(a['project']) == str(allocation_name)
+    ][:1]
+
+
+def linear_get_project(projects, project_id):
+    return [p for p in projects if str(p['id']) == str(project_id)][:1]
+
+
+def time_lookups(name, lookup, keys):
+    started = time.time()
+    for key in keys:
+        lookup(key)
+    elapsed = time.time() - started
+    print "%s: %d lookups, %.3f seconds (%.1f us/lookup)" % (
+        name, len(keys), elapsed, elapsed / max(1, len(keys)) * 1e6
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--projects", type=int, default=5000)
+    parser.add_argument("--members-per-project", type=int, default=20)
+    parser.add_argument(
+        "--linear-lookups",
+        type=int,
+        default=500,
+        help="Only time this many (slow) linear scans"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    usernames, projects, allocations = generate_payload(
+        args.users, args.projects, args.members_per_project
+    )
+    driver = TASAPIDriver('http://localhost/not-used', 'user', 'pass')
+    driver.project_list = projects
+    driver.user_project_list = projects
+    driver.allocation_list = allocations
+
+    charge_codes = [a['project'] for a in allocations]
+    project_ids = [p['id'] for p in projects]
+    linear_users = random.sample(usernames, args.linear_lookups)
+    linear_codes = random.sample(charge_codes, args.linear_lookups)
+    linear_ids = random.sample(project_ids, args.linear_lookups)
+
+    started = time.time()
+    driver.find_projects_for(usernames[0])
+    driver.get_allocation(charge_codes[0])
+    driver.get_project(project_ids[0])
+    print "Built indexes in %.3f seconds" % (time.time() - started)
+
+    time_lookups(
+        "find_projects_for (linear)",
+        lambda key: linear_find_projects_for(projects, key), linear_users
+    )
+    time_lookups("find_projects_for", driver.find_projects_for, usernames)
+    time_lookups(
+        "get_allocation (linear)",
+        lambda key: linear_get_allocation(allocations, key), linear_codes
+    )
+    time_lookups("get_allocation", driver.get_allocation, charge_codes)
+    time_lookups(
+        "get_project (linear)", lambda key: linear_get_project(projects, key),
+        linear_ids
+    )
+    time_lookups("get_project", driver.get_project, project_ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+"""
+Time the TAS API calls of a Jetstream reporting run, replaying the responses
+recorded in the `jetstream/fixtures` cassettes from a local HTTP server.
+
+For `--pairs` (user, allocation source) pairs, compare:
+- per-row: A new TASAPIDriver per pair, and reports sent one at a time
+  (What `create_reports`/`send_reports` used to do)
+- shared: One TASAPIDriver for the run, TACC usernames resolved up front,
+  and reports sent settings.TAS_API_CONCURRENCY users at a time.
+
+    ./scripts/benchmark_tas_reporting.py --pairs 500 --users 200 --latency 0.05
+
+No database writes are made.
+"""
+import argparse
+import glob
+import json
+import threading
+import time
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+import django
+django.setup()
+import memoize
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.utils import timezone
+
+from jetstream.allocation import TASAPIDriver
+from jetstream.tas_api import tacc_api_get
+
+CASSETTE_DIR = 'jetstream/fixtures'
+API_PREFIX = '/api-test'
+XSEDE_PATH = '/v1/users/xsede/'
+
+
+def load_cassettes(cassette_dir):
+    """
+    Returns a dict of request path -> recorded response body, for every
+    (successful) GET recorded in the cassettes of `cassette_dir`.
+    """
+    responses = {}
+    for path in sorted(glob.glob('%s/*.yaml' % cassette_dir)):
+        with open(path) as cassette:
+            for interaction in yaml.load(cassette)['interactions']:
+                request = interaction['request']
+                response = interaction['response']
+                if request['method'] != 'GET' or response['status']['code'
+                                                                   ] != 200:
+                    continue
+                body = json.loads(response['body']['string'])
+                if body.get('status') != 'success':
+                    continue
+                uri_path = urlparse.urlparse(request['uri']).path
+                responses[uri_path[len(API_PREFIX):]] = body
+    return responses
+
+
+class CassetteServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, responses, latency):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), CassetteHandler)
+        self.responses = responses
+        self.latency = latency
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:%s%s" % (self.server_address[1], API_PREFIX)
+
+
+class CassetteHandler(BaseHTTPRequestHandler):
+    def _respond(self, body):
+        with self.server.lock:
+            self.server.request_count += 1
+        time.sleep(self.server.latency)
+        body = json.dumps(body)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse.urlparse(self.path).path[len(API_PREFIX):]
+        if path.startswith(XSEDE_PATH):
+            # Every XSEDE user maps to a TACC user of the same name
+            body = {
+                'status': 'success',
+                'message': None,
+                'result': path[len(XSEDE_PATH):]
+            }
+        else:
+            body = self.server.responses.get(path)
+        if body is None:
+            self.send_error(404)
+            return
+        self._respond(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+        self._respond({'status': 'success', 'message': None, 'result': None})
+
+    def log_message(self, *args):
+        pass
+
+
+class BenchmarkUser(object):
+    def __init__(self, username):
+        self.username = username
+
+
+def _send(driver, report):
+    user, project_name = report
+    now = timezone.now()
+    driver.report_project_allocation(
+        None, user.username, project_name, 1.0, now, now, 'Atmosphere',
+        'use.jetstream-cloud.org'
+    )
+
+
+def run_per_row(server, pairs):
+    for user, allocation_name in pairs:
+        driver = TASAPIDriver(server.url, 'user', 'pass')
+        driver.get_tacc_username(user)
+        driver.get_allocation_project_name(allocation_name)
+    for report in pairs:
+        _send(TASAPIDriver(server.url, 'user', 'pass'), report)
+
+
+def run_shared(server, pairs):
+    driver = TASAPIDriver(server.url, 'user', 'pass')
+    driver.get_tacc_usernames([user for user, _ in pairs])
+    for user, allocation_name in pairs:
+        driver.get_tacc_username(user)
+        driver.get_allocation_project_name(allocation_name)
+
+    reports_by_user = {}
+    for user, allocation_name in pairs:
+        reports_by_user.setdefault(user.username,
+                                   []).append((user, allocation_name))
+
+    def _send_all(reports):
+        for report in reports:
+            _send(driver, report)
+
+    with ThreadPoolExecutor(
+        max_workers=getattr(settings, 'TAS_API_CONCURRENCY', 4)
+    ) as executor:
+        list(executor.map(_send_all, reports_by_user.values()))
+
+
+def time_run(name, run, server, pairs):
+    # The GETs are memoized (across drivers), start each run from scratch
+    memoize.delete_memoized(tacc_api_get)
+    server.request_count = 0
+    started = time.time()
+    run(server, pairs)
+    elapsed = time.time() - started
+    print "%s: %d pairs, %d TAS requests, %.2f seconds" % (
+        name, len(pairs), server.request_count, elapsed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--pairs",
+        type=int,
+        default=500,
+        help="Number of (user, allocation source) pairs to report"
+    )
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="Seconds added to every response of the TAS API"
+    )
+    parser.add_argument("--cassettes", default=CASSETTE_DIR)
+    args = parser.parse_args()
+
+    responses = load_cassettes(args.cassettes)
+    allocation_names = [
+        allocation['project'] for allocation in
+        responses['/v1/allocations/resource/Jetstream']['result']
+    ]
+    users = [BenchmarkUser("benchuser%d" % idx) for idx in range(args.users)]
+    pairs = [
+        (
+            users[idx % len(users)],
+            allocation_names[idx % len(allocation_names)]
+        ) for idx in range(args.pairs)
+    ]
+
+    server = CassetteServer(responses, args.latency)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        time_run("per-row", run_per_row, server, pairs)
+        time_run("shared", run_shared, server, pairs)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
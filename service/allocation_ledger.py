@@ -0,0 +1,211 @@
+"""
+Materialized, per-day allocation usage ledger.
+
+`service.allocation_logic.create_report` re-reads every instance and status
+history in the window it is asked about. Completed (UTC) days are stored in
+`core.models.UserAllocationLedger` instead, so only the partial days at either
+end of a window -- including the interval that is still running -- are
+computed from InstanceStatusHistory.
+
+The ledger is kept correct by invalidation: whenever an InstanceStatusHistory
+is created or end-dated, or an 'instance_allocation_source_changed' event is
+recorded, the affected days for that user are dropped and re-materialized the
+next time they are read.
+"""
+import datetime
+from collections import defaultdict
+
+import pytz
+from dateutil.parser import parse
+from django.db import transaction
+from django.utils import timezone
+from threepio import logger
+
+from core.models.allocation_source import UserAllocationLedger
+from core.models.instance import Instance
+from core.models.user import AtmosphereUser
+from service.allocation_logic import create_report
+
+UNATTRIBUTED = 'N/A'
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def _as_utc_datetime(value):
+    if not isinstance(value, datetime.datetime):
+        value = parse(value)
+    if timezone.is_naive(value):
+        return value.replace(tzinfo=pytz.utc)
+    return value.astimezone(pytz.utc)
+
+
+def _start_of_day(value):
+    return datetime.datetime(
+        value.year, value.month, value.day, tzinfo=pytz.utc
+    )
+
+
+def _split_row_by_day(row, window_start, window_end):
+    """
+    Split the `applicable_duration` of a `create_report` row into
+    (day, CPU-seconds) pairs, using the same rules as `calculate_allocation`.
+    """
+    if row['instance_status'] != 'active':
+        return
+    start = max(row['instance_status_start_date'], window_start)
+    end = min(row['instance_status_end_date'], window_end)
+    day = _start_of_day(start)
+    while day < end:
+        next_day = day + ONE_DAY
+        duration = min(end, next_day) - max(start, day)
+        yield day.date(), duration.total_seconds() * row['cpu']
+        day = next_day
+
+
+def _materialize(user, first_day, last_day):
+    """
+    Compute (with a single report) and store the ledger for the days in [first_day, last_day)
+    Returns a dict of allocation source name -> CPU-seconds for those days.
+    """
+    window_start = _start_of_day(first_day)
+    window_end = _start_of_day(last_day)
+    rows = create_report(window_start, window_end, user_id=user.username)
+
+    buckets = defaultdict(float)
+    day = first_day
+    while day < last_day:
+        buckets[(day, UNATTRIBUTED)] += 0.0
+        day += ONE_DAY
+    for row in rows:
+        allocation_source_name = row['allocation_source'] or UNATTRIBUTED
+        for day, duration in _split_row_by_day(row, window_start, window_end):
+            buckets[(day, allocation_source_name)] += duration
+
+    with transaction.atomic():
+        # Serialize materializations for this user, so that concurrent calls
+        # do not insert the same (user, source, day) rows.
+        AtmosphereUser.objects.select_for_update().get(id=user.id)
+        UserAllocationLedger.objects.filter(
+            user=user, day__gte=first_day, day__lt=last_day
+        ).delete()
+        UserAllocationLedger.objects.bulk_create(
+            [
+                UserAllocationLedger(
+                    user=user,
+                    allocation_source_name=name,
+                    day=day,
+                    compute_used=duration
+                ) for (day, name), duration in buckets.items()
+            ]
+        )
+    logger.debug(
+        "Materialized allocation ledger for User %s from %s-%s (%s rows)" %
+        (user.username, first_day, last_day, len(buckets))
+    )
+
+    usage = defaultdict(float)
+    for (_, allocation_source_name), duration in buckets.items():
+        usage[allocation_source_name] += duration
+    return usage
+
+
+def _ledger_usage(user, first_day, last_day):
+    """
+    Return a dict of allocation source name -> CPU-seconds for the completed
+    days in [first_day, last_day), materializing any days that are missing.
+    """
+    usage = defaultdict(float)
+    known_days = set()
+    ledger_rows = UserAllocationLedger.objects.filter(
+        user=user, day__gte=first_day, day__lt=last_day
+    ).values_list('day', 'allocation_source_name', 'compute_used')
+    for day, allocation_source_name, compute_used in ledger_rows:
+        if allocation_source_name == UNATTRIBUTED:
+            known_days.add(day)
+        usage[allocation_source_name] += float(compute_used)
+
+    # Materialize each run of consecutive missing days with a single report
+    missing_start = None
+    day = first_day
+    while day <= last_day:
+        is_missing = day < last_day and day not in known_days
+        if is_missing and missing_start is None:
+            missing_start = day
+        elif not is_missing and missing_start is not None:
+            for allocation_source_name, duration in _materialize(
+                user, missing_start, day
+            ).items():
+                usage[allocation_source_name] += duration
+            missing_start = None
+        day += ONE_DAY
+    return usage
+
+
+def _add_report_usage(usage, rows):
+    for row in rows:
+        usage[row['allocation_source']] += row['applicable_duration']
+
+
+def usage_by_allocation_source(username, start_date, end_date):
+    """
+    Return `(usage, open_rows)` for the User over [start_date, end_date]:
+    - usage: A dict of allocation source name -> CPU-seconds ('N/A' included)
+    - open_rows: The `create_report` rows for the last, partial day of the
+      window. These include every currently running history, so callers can
+      read the burn rate from them.
+    """
+    user = AtmosphereUser.objects.filter(username=username).first()
+    if not user:
+        raise Exception("User '%s' does not exist" % (username))
+    start_date = _as_utc_datetime(start_date)
+    end_date = _as_utc_datetime(end_date)
+    usage = defaultdict(float)
+
+    first_full_day = _start_of_day(start_date)
+    if first_full_day < start_date:
+        first_full_day += ONE_DAY
+    # Only days that have completed can be materialized.
+    last_full_day = min(_start_of_day(end_date), _start_of_day(timezone.now()))
+    if last_full_day >= end_date:
+        last_full_day -= ONE_DAY
+
+    if first_full_day >= last_full_day:
+        open_rows = create_report(start_date, end_date, user_id=username)
+        _add_report_usage(usage, open_rows)
+        return usage, open_rows
+
+    if start_date < first_full_day:
+        _add_report_usage(
+            usage, create_report(start_date, first_full_day, user_id=username)
+        )
+    for allocation_source_name, duration in _ledger_usage(
+        user, first_full_day.date(), last_full_day.date()
+    ).items():
+        usage[allocation_source_name] += duration
+    open_rows = create_report(last_full_day, end_date, user_id=username)
+    _add_report_usage(usage, open_rows)
+    return usage, open_rows
+
+
+def invalidate_ledger(since, user_id=None, username=None, instance_id=None):
+    """
+    Drop the materialized days from `since` onwards for the user given by
+    `user_id`, `username` or as the owner of `instance_id`.
+    They will be re-computed the next time they are read.
+    """
+    if not since or not (user_id or username or instance_id):
+        return
+    since_day = _as_utc_datetime(since).date()
+    if since_day >= timezone.now().astimezone(pytz.utc).date():
+        # Today (and later) is never materialized
+        return
+    ledger = UserAllocationLedger.objects.filter(day__gte=since_day)
+    if user_id:
+        ledger = ledger.filter(user_id=user_id)
+    elif username:
+        ledger = ledger.filter(user__username=username)
+    else:
+        ledger = ledger.filter(
+            user__in=Instance.objects.filter(id=instance_id).
+            values('created_by_id')
+        )
+    ledger.delete()
@@ -1,4 +1,5 @@
 import datetime
+from uuid import UUID
 
 import pytz
 from dateutil.parser import parse
@@ -8,6 +9,8 @@ from threepio import logger
 from core.models import EventTable
 from core.models.allocation_source import AllocationSource
 from core.models.instance import Instance
+from core.models.instance_history import InstanceStatusHistory
+from core.models.machine import ProviderMachine
 
 
 def create_report(
@@ -90,8 +93,8 @@ def filter_events_and_instances(
             user_id_int = AtmosphereUser.objects.get(username=username)
         except:
             raise Exception("User '%s' does not exist" % (username))
-        events = events.filter(
-            Q(payload__username__exact=username) | Q(entity_id=username)
+        events = events.annotate_payload('username').filter(
+            Q(payload_username=username) | Q(entity_id=username)
         ).order_by('timestamp')
         instances = instances.filter(Q(created_by__exact=user_id_int))
     instance_ids = instances.values_list("id", flat=True)
@@ -113,18 +116,52 @@ def group_events_by_instances(events):
 def get_all_histories_for_instance(
     instances, report_start_date, report_end_date
 ):
+    """
+    Return a dict of provider_alias -> list of the instance's histories
+    overlapping the report, ordered by start_date.
+    All histories are fetched (with their instance, creator, size and status)
+    in a single query.
+    """
     histories = {}
+    alias_by_id = {}
     for instance in instances:
-        histories[
-            instance.provider_alias
-        ] = instance.instancestatushistory_set.filter(
-            ~Q(start_date__gte=report_end_date) &
-            ~Q(Q(end_date__isnull=False) & Q(end_date__lte=report_start_date))
-        ).order_by('start_date')
-
+        histories[instance.provider_alias] = []
+        alias_by_id[instance.id] = instance.provider_alias
+    if not alias_by_id:
+        return histories
+
+    history_qs = InstanceStatusHistory.objects.filter(
+        instance_id__in=alias_by_id.keys()
+    ).filter(
+        ~Q(start_date__gte=report_end_date) &
+        ~Q(Q(end_date__isnull=False) & Q(end_date__lte=report_start_date))
+    ).select_related('instance__created_by', 'size',
+                     'status').order_by('start_date')
+    for history in history_qs:
+        histories[alias_by_id[history.instance_id]].append(history)
     return histories
 
 
+def get_image_names_for_histories(filtered_instance_histories):
+    """
+    Return a dict of instance source ID -> application name, for
+    every (machine) source used by the histories. Uses a single query.
+    """
+    source_ids = set(
+        histories[0].instance.source_id
+        for histories in filtered_instance_histories.itervalues() if histories
+    )
+    if not source_ids:
+        return {}
+    return dict(
+        ProviderMachine.objects.filter(
+            instance_source_id__in=source_ids
+        ).values_list(
+            'instance_source_id', 'application_version__application__name'
+        )
+    )
+
+
 def map_events_to_histories(filtered_instance_histories, event_instance_dict):
     out_dic = {}
     for instance, events in event_instance_dict.iteritems():
@@ -140,30 +177,76 @@ def map_events_to_histories(filtered_instance_histories, event_instance_dict):
     return out_dic
 
 
-def get_allocation_source_name_from_event(
-    username, report_start_date, instance_id, instance_history_start_date
+def get_allocation_source_names_from_events(
+    filtered_instance_histories, report_start_date
 ):
-    events = EventTable.objects.filter(
-        Q(
-            Q(timestamp__lt=report_start_date) |
-            Q(timestamp__gte=report_start_date
-             ) & Q(timestamp__lt=instance_history_start_date)
-        ) & Q(name__exact="instance_allocation_source_changed") &
-        Q(Q(payload__username__exact=username) |
-          Q(entity_id=username)) & Q(payload__instance_id__exact=instance_id)
+    """
+    Return a dict of provider_alias -> the name of the allocation source that
+    was assigned to the instance (by the owner) before its first history in the
+    report started. Instances without a prior assignment are left out.
+
+    The events are fetched with a single query, and the allocation sources
+    they refer to with another.
+    """
+    cutoffs = {}
+    for provider_alias, histories in filtered_instance_histories.iteritems():
+        if not histories:
+            continue
+        first_history = histories[0]
+        cutoffs[provider_alias] = (
+            first_history.instance.created_by.username,
+            max(report_start_date, first_history.start_date)
+        )
+    if not cutoffs:
+        return {}
+
+    events = EventTable.objects.annotate_payload('instance_id').filter(
+        Q(name__exact="instance_allocation_source_changed") & Q(
+            payload_instance_id__in=cutoffs.keys()
+        ) & Q(timestamp__lt=max(cutoff for _, cutoff in cutoffs.values()))
     ).order_by('timestamp')
-    if not events:
-        return False
-    else:
-        try:
-            allocation_source_object = AllocationSource.objects.get(
-                name=events.last().payload['allocation_source_name']
-            )
-        except KeyError:
-            allocation_source_object = AllocationSource.objects.get(
-                uuid=events.last().payload['allocation_source_id']
-            )
-        return allocation_source_object.name
+    last_payloads = {}
+    for event in events:
+        username, cutoff = cutoffs[event.payload_instance_id]
+        if event.timestamp >= cutoff:
+            continue
+        if username not in (event.entity_id, event.payload.get('username')):
+            continue
+        last_payloads[event.payload_instance_id] = event.payload
+
+    source_names = set()
+    source_uuids = set()
+    for payload in last_payloads.values():
+        if 'allocation_source_name' in payload:
+            source_names.add(payload['allocation_source_name'])
+        else:
+            source_uuids.add(UUID(str(payload['allocation_source_id'])))
+    known_names = set()
+    names_by_uuid = {}
+    if source_names or source_uuids:
+        for name, source_uuid in AllocationSource.objects.filter(
+            Q(name__in=source_names) | Q(uuid__in=source_uuids)
+        ).values_list('name', 'uuid'):
+            known_names.add(name)
+            names_by_uuid[source_uuid] = name
+
+    allocation_source_names = {}
+    for provider_alias, payload in last_payloads.iteritems():
+        if 'allocation_source_name' in payload:
+            name = payload['allocation_source_name']
+            if name not in known_names:
+                raise AllocationSource.DoesNotExist(
+                    "AllocationSource %s does not exist" % name
+                )
+        else:
+            source_uuid = UUID(str(payload['allocation_source_id']))
+            if source_uuid not in names_by_uuid:
+                raise AllocationSource.DoesNotExist(
+                    "AllocationSource %s does not exist" % source_uuid
+                )
+            name = names_by_uuid[source_uuid]
+        allocation_source_names[provider_alias] = name
+    return allocation_source_names
 
 
 def create_rows(
@@ -178,6 +261,10 @@ def create_rows(
 
     still_running = _get_current_date_utc()
     total_burn_rate = 0
+    prior_allocation_source_names = get_allocation_source_names_from_events(
+        filtered_instance_histories, report_start_date
+    )
+    image_names = get_image_names_for_histories(filtered_instance_histories)
     for instance, histories in filtered_instance_histories.iteritems():
         for hist in histories:
             if current_user != hist.instance.created_by.username:
@@ -188,11 +275,9 @@ def create_rows(
                 current_user = hist.instance.created_by.username
 
             if current_instance_id != hist.instance.id:
-                current_as_name = get_allocation_source_name_from_event(
-                    current_user, report_start_date,
-                    hist.instance.provider_alias, hist.start_date
+                allocation_source_name = prior_allocation_source_names.get(
+                    hist.instance.provider_alias, 'N/A'
                 )
-                allocation_source_name = current_as_name if current_as_name else 'N/A'
                 current_instance_id = hist.instance.id
 
             empty_row = {
@@ -213,7 +298,10 @@ def create_rows(
                 'applicable_duration': '',
                 'burn_rate': ''
             }
-            filled_row = fill_data(empty_row, hist, allocation_source_name)
+            filled_row = fill_data(
+                empty_row, hist, allocation_source_name,
+                image_names.get(hist.instance.source_id)
+            )
             # check if instance is active and has no end date. If so, increment total burn rate
             if hist.status.name == 'active' and not hist.end_date:
                 total_burn_rate += 1
@@ -284,13 +372,12 @@ def _get_current_date_utc():
     return datetime.datetime.utcnow().replace(tzinfo=pytz.utc)
 
 
-def fill_data(row, history_obj, allocation_source):
+def fill_data(row, history_obj, allocation_source, image_name):
     still_running = _get_current_date_utc()
     row['username'] = history_obj.instance.created_by.username
     row['allocation_source'] = allocation_source
     row['instance_id'] = history_obj.instance_id
-    row['image_name'] = Instance.objects.get(id=history_obj.instance_id
-                                            ).application_name()
+    row['image_name'] = image_name
     row['provider_alias'] = history_obj.instance.provider_alias
     row['instance_status_history_id'] = history_obj.id
     row['cpu'] = history_obj.size.cpu
@@ -0,0 +1,207 @@
+"""
+Compute allocation source snapshots for many allocation sources at once.
+
+`core.models.allocation_source.total_usage` produces a report for every
+(user, allocation source) pair. Here, a single `create_report` pass per user
+(starting at the earliest window of the user's allocation sources) is grouped
+by allocation source instead, and the snapshots are written with one upsert
+statement per table.
+
+Usage is returned as a dict of allocation source ID ->
+    {'start_date': <start of the source's window>,
+     'users': {user ID: [CPU-seconds, burn rate], ...}}
+so that the usage computed for separate chunks of users can be merged (See
+`merge_usage`) before it is saved.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.utils import timezone
+from threepio import logger
+
+from core.models import EventTable
+from core.models.allocation_source import (
+    AllocationSourceSnapshot, UserAllocationSnapshot, UserAllocationSource
+)
+from service.allocation_logic import create_report
+
+UPSERT_BATCH_SIZE = 1000
+
+
+def get_renewal_dates(allocation_sources):
+    """
+    Return a dict of allocation source name -> the (second) the allocation
+    source was last created or renewed, using a single query.
+    """
+    renewal_events = EventTable.objects.filter(
+        name='allocation_source_created_or_renewed'
+    ).annotate_payload('allocation_source_name').filter(
+        payload_allocation_source_name__in=[
+            allocation_source.name for allocation_source in allocation_sources
+        ]
+    ).order_by('timestamp')
+    renewal_dates = {}
+    for name, timestamp in renewal_events.values_list(
+        'payload_allocation_source_name', 'timestamp'
+    ):
+        renewal_dates[name] = timestamp.replace(microsecond=0)
+    return renewal_dates
+
+
+def compute_usage(allocation_sources, end_date, start_date=None, user_ids=None):
+    """
+    Compute the usage of every user of `allocation_sources` (or only of the
+    users in `user_ids`), from `start_date` (or, by default, the last renewal
+    of each allocation source) to `end_date`.
+    Allocation sources that were never created/renewed are left out.
+    """
+    renewal_dates = {} if start_date else get_renewal_dates(allocation_sources)
+    windows = {}
+    for allocation_source in allocation_sources:
+        source_start = start_date or renewal_dates.get(allocation_source.name)
+        if not source_start:
+            logger.info(
+                'Allocation Source %s Create/Renewal event missing',
+                allocation_source.name
+            )
+            continue
+        windows[allocation_source.name] = (allocation_source.id, source_start)
+    if not windows:
+        return {}
+
+    usage = dict(
+        (source_id, {
+            'start_date': source_start,
+            'users': {}
+        }) for source_id, source_start in windows.values()
+    )
+    # username -> allocation source name -> [CPU-seconds, burn rate]
+    usage_by_user = defaultdict(dict)
+    user_allocation_sources = UserAllocationSource.objects.filter(
+        allocation_source__name__in=windows.keys()
+    )
+    if user_ids is not None:
+        user_allocation_sources = user_allocation_sources.filter(
+            user_id__in=user_ids
+        )
+    for source_name, user_id, username in user_allocation_sources.values_list(
+        'allocation_source__name', 'user_id', 'user__username'
+    ):
+        user_usage = [0.0, 0]
+        usage[windows[source_name][0]]['users'][user_id] = user_usage
+        usage_by_user[username][source_name] = user_usage
+
+    for username, usage_by_name in usage_by_user.items():
+        report_start = min(
+            windows[source_name][1] for source_name in usage_by_name
+        )
+        for row in create_report(report_start, end_date, user_id=username):
+            if row['instance_status'] != 'active':
+                continue
+            user_usage = usage_by_name.get(row['allocation_source'])
+            if user_usage is None:
+                continue
+            source_start = windows[row['allocation_source']][1]
+            row_start = row['instance_status_start_date']
+            row_end = row['instance_status_end_date']
+            duration = (min(row_end, end_date) -
+                        max(row_start, source_start)).total_seconds()
+            if duration > 0:
+                user_usage[0] += duration * row['cpu']
+            # Burn rate: The number of active histories that are still open.
+            # (The report ends open histories 'now', which may be end_date)
+            if row_end >= end_date or row_end == row['current_time']:
+                user_usage[1] += 1
+    return usage
+
+
+def merge_usage(results):
+    """
+    Merge the usage computed for separate chunks of users.
+    """
+    usage = {}
+    for result in results:
+        for source_id, source_usage in result.items():
+            if source_id not in usage:
+                usage[source_id] = {
+                    'start_date': source_usage['start_date'],
+                    'users': {}
+                }
+            merged_users = usage[source_id]['users']
+            for user_id, (compute_used,
+                          burn_rate) in source_usage['users'].items():
+                merged = merged_users.setdefault(user_id, [0.0, 0])
+                merged[0] += compute_used
+                merged[1] += burn_rate
+    return usage
+
+
+def _upsert(cursor, model, columns, conflict_columns, update_columns, rows):
+    """
+    INSERT `rows` (tuples of `columns`) into `model`'s table, or set the
+    `update_columns` of the rows that already exist.
+    """
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    updates = ', '.join(
+        '%s = EXCLUDED.%s' % (qn(column), qn(column))
+        for column in update_columns
+    )
+    row_sql = '(%s)' % ', '.join(['%s'] * len(columns))
+    for idx in range(0, len(rows), UPSERT_BATCH_SIZE):
+        batch = rows[idx:idx + UPSERT_BATCH_SIZE]
+        cursor.execute(
+            'INSERT INTO %s (%s) VALUES %s ON CONFLICT (%s) DO UPDATE SET %s' %
+            (
+                qn(model._meta.db_table), ', '.join(qn(c) for c in columns),
+                ', '.join([row_sql] * len(batch)
+                         ), ', '.join(qn(c) for c in conflict_columns), updates
+            ), [value for row in batch for value in row]
+        )
+
+
+def save_snapshots(usage):
+    """
+    Write the UserAllocationSnapshot of every (user, allocation source) pair
+    and the AllocationSourceSnapshot of every allocation source in `usage`.
+    """
+    now_time = timezone.now()
+    user_rows = []
+    source_rows = []
+    for source_id, source_usage in usage.items():
+        total_compute_used = 0
+        total_burn_rate = 0
+        for user_id, (compute_used, burn_rate) in source_usage['users'].items():
+            compute_used = round(compute_used / 3600.0, 2)
+            user_rows.append(
+                (user_id, source_id, compute_used, burn_rate, now_time)
+            )
+            total_compute_used += compute_used
+            total_burn_rate += burn_rate
+        source_rows.append(
+            (
+                source_id, total_compute_used, total_burn_rate, now_time,
+                now_time, 0
+            )
+        )
+    with transaction.atomic(), connection.cursor() as cursor:
+        _upsert(
+            cursor, UserAllocationSnapshot, (
+                'user_id', 'allocation_source_id', 'compute_used', 'burn_rate',
+                'updated'
+            ), ('user_id', 'allocation_source_id'),
+            ('compute_used', 'burn_rate', 'updated'), user_rows
+        )
+        # Existing snapshots keep their `last_renewed` and `compute_allowed`
+        _upsert(
+            cursor, AllocationSourceSnapshot, (
+                'allocation_source_id', 'compute_used', 'global_burn_rate',
+                'updated', 'last_renewed', 'compute_allowed'
+            ), ('allocation_source_id', ),
+            ('compute_used', 'global_burn_rate', 'updated'), source_rows
+        )
+    logger.debug(
+        "Saved %s user and %s allocation source snapshots" %
+        (len(user_rows), len(source_rows))
+    )
@@ -1,12 +1,18 @@
+import copy
 import cPickle as pickle
+import threading
+import time
+
 import redis
+from django.conf import settings
+from django.db import connection
 from threepio import logger
 
+from core.redis_client import get_redis_client
 from service.driver import get_esh_driver, get_admin_driver
 
 admin_drivers = {}
 drivers = {}
-connection = None
 
 INSTANCES_KEY_PROVIDER = "instances.{0}"
 INSTANCES_KEY_IDENTITY = "instances.{0}.{1}"
@@ -14,6 +20,13 @@ VOLUMES_KEY_PROVIDER = "volumes.{0}"
 VOLUMES_KEY_IDENTITY = "volumes.{0}.{1}"
 MACHINES_KEY_PROVIDER = "machines.{0}"
 MACHINES_KEY_IDENTITY = "machines.{0}.{1}"
+# Stored alongside the records of a cache hash, with the time of the refresh
+REFRESHED_FIELD = "__refreshed__"
+LOCK_SUFFIX = ".lock"
+
+# Keys with a background refresh in progress (in this process)
+_revalidating = set()
+_revalidating_lock = threading.Lock()
 
 
 def _get_cached_admin_driver(provider, force=True):
@@ -31,10 +44,15 @@ def _get_cached_driver(provider=None, identity=None, force=True):
 
 
 def redis_connection():
-    global connection
-    if not connection:
-        connection = redis.StrictRedis()
-    return connection
+    return get_redis_client()
+
+
+def _cache_ttl():
+    return getattr(settings, 'INSTANCE_CACHE_TTL', 30)
+
+
+def _cache_stale_ttl():
+    return getattr(settings, 'INSTANCE_CACHE_STALE_TTL', 300)
 
 
 def _invalidate(key):
@@ -43,31 +61,149 @@ def _invalidate(key):
         r.delete(key)
 
 
+def _load_records(r, key):
+    """
+    Returns (objects, refreshed) for a hash of object id -> pickled object.
+    (None, None) if the key does not exist (or is not a hash).
+    """
+    try:
+        records = r.hgetall(key)
+    except redis.exceptions.ResponseError:
+        # Written in the old (single pickled list) format
+        return None, None
+    refreshed = records.pop(REFRESHED_FIELD, None)
+    if refreshed is None:
+        return None, None
+    return [pickle.loads(record)
+            for record in records.values()], float(refreshed)
+
+
+def _store_records(r, key, objects):
+    records = dict(
+        (str(obj.id), pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+        for obj in objects
+    )
+    records[REFRESHED_FIELD] = repr(time.time())
+    pipe = r.pipeline()
+    pipe.delete(key)
+    pipe.hmset(key, records)
+    pipe.expire(key, _cache_ttl() + _cache_stale_ttl())
+    pipe.execute()
+
+
+def _refresh(r, key, data_method, scrub_method):
+    data = data_method()
+    scrub_method(data)
+    try:
+        _store_records(r, key, data)
+    except redis.exceptions.ConnectionError:
+        logger.error("Could not store redis(%s)" % key)
+        return data
+    logger.debug(
+        "Updated redis({0}) using {1} and {2}".format(
+            key, data_method, scrub_method
+        )
+    )
+    return data
+
+
+def _single_flight_refresh(r, key, data_method, scrub_method, not_before):
+    """
+    Refresh `key`, unless another worker holds the lock for it. Then wait for
+    that worker and use its result, if it was refreshed after `not_before`.
+    """
+    lock_timeout = getattr(settings, 'INSTANCE_CACHE_LOCK_TIMEOUT', 120)
+    lock = r.lock(
+        key + LOCK_SUFFIX, timeout=lock_timeout, blocking_timeout=lock_timeout
+    )
+    acquired = lock.acquire()
+    try:
+        data, refreshed = _load_records(r, key)
+        if data is not None and refreshed >= not_before:
+            return data
+        return _refresh(r, key, data_method, scrub_method)
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except redis.exceptions.LockError:
+                logger.warn("Lock on redis(%s) expired during refresh" % key)
+
+
+def _revalidate(key, data_method, scrub_method):
+    try:
+        r = redis_connection()
+        lock = r.lock(
+            key + LOCK_SUFFIX,
+            timeout=getattr(settings, 'INSTANCE_CACHE_LOCK_TIMEOUT', 120)
+        )
+        if not lock.acquire(blocking=False):
+            # Another worker is already refreshing this key
+            return
+        try:
+            _refresh(r, key, data_method, scrub_method)
+        finally:
+            try:
+                lock.release()
+            except redis.exceptions.LockError:
+                logger.warn("Lock on redis(%s) expired during refresh" % key)
+    except Exception:
+        logger.exception("Could not revalidate redis(%s)" % key)
+    finally:
+        with _revalidating_lock:
+            _revalidating.discard(key)
+        # The drivers are looked up with this thread's database connection
+        connection.close()
+
+
+def _revalidate_in_background(key, data_method, scrub_method):
+    with _revalidating_lock:
+        if key in _revalidating:
+            return
+        _revalidating.add(key)
+    thread = threading.Thread(
+        target=_revalidate, args=(key, data_method, scrub_method)
+    )
+    thread.daemon = True
+    thread.start()
+
+
 def _get_cached(key, data_method, scrub_method, force=False):
+    """
+    Return the objects cached in `key`, calling `data_method` to refresh it.
+
+    - Data younger than settings.INSTANCE_CACHE_TTL is returned as-is.
+    - Data up to settings.INSTANCE_CACHE_STALE_TTL seconds older than that is
+      returned as-is, and refreshed in a background thread.
+    - Otherwise (or with `force`) the caller waits for a refresh. Only one
+      worker refreshes a key at a time, the others wait for its result.
+    """
     try:
         r = redis_connection()
+        now = time.time()
         if force:
-            _invalidate(key)
-        data = r.get(key)
+            return _single_flight_refresh(
+                r, key, data_method, scrub_method, not_before=now
+            )
+        data, refreshed = _load_records(r, key)
+        if data is not None:
+            age = now - refreshed
+            if age < _cache_ttl():
+                return data
+            if age < _cache_ttl() + _cache_stale_ttl():
+                _revalidate_in_background(key, data_method, scrub_method)
+                return data
+        return _single_flight_refresh(
+            r, key, data_method, scrub_method, not_before=now - _cache_ttl()
+        )
     except redis.exceptions.ConnectionError:
         logger.error(
             "EXTERNAL SERVICE redis-server IS NOT RUNNING! "
             "Somebody should turn it on!"
         )
-        data = None
-    if not data:
-        data = data_method()
-        scrub_method(data)
-        logger.debug(
-            "Updated redis({0}) using {1} and {2}".format(
-                key, data_method, scrub_method
-            )
-        )
-        r.set(key, pickle.dumps(data))
-        r.expire(key, 30)
-        return data
-    logger.debug("Actual type {0}".format(type(data)))
-    return pickle.loads(data)
+    data = data_method()
+    scrub_method(data)
+    return data
 
 
 def _scrub(objects):
@@ -91,37 +227,100 @@ def get_cached_driver(provider=None, identity=None, force=True):
     return _get_cached_driver(provider=provider, identity=identity, force=force)
 
 
-def get_cached_instances(provider=None, identity=None, force=False):
-    _validate_parameters(provider, identity)
-    cached_driver = _get_cached_driver(
-        provider=provider, identity=identity, force=force
-    )
-    cached_driver.list_sizes()
+def _lists_all_instances(identity):
     #NOTE: THIS IS A HACK -- The 'admin' user should be able to see "All the things" -- HOWEVER
     # In the current implementation of liberty on jetstream, a call to 'list_all_tenants'
     # Made by a user with a single tenant will produce *IDENTICAL* results to that same call made by admin.
     # THIS IS CONSIDERED HARMFUL! So we have blocked all users except the admin accounts from making this call.
-    if identity and identity.created_by and identity.created_by.username in [
-        'atmoadmin', 'admin'
-    ]:
-        instances_method = cached_driver.list_all_instances
-    else:
-        instances_method = cached_driver.list_instances
+    return bool(
+        identity and identity.created_by
+        and identity.created_by.username in ['atmoadmin', 'admin']
+    )
+
+
+def get_cached_instances(provider=None, identity=None, force=False):
+    _validate_parameters(provider, identity)
 
+    def list_instances():
+        # A new driver for every listing: stale listings are refreshed in a
+        # background thread, and libcloud connections are not thread-safe.
+        if provider:
+            driver = get_admin_driver(provider)
+        else:
+            driver = get_esh_driver(identity)
+        driver.list_sizes()
+        if _lists_all_instances(identity):
+            return driver.list_all_instances()
+        return driver.list_instances()
+
+    key = _instances_key(provider=provider, identity=identity)
+    return _get_cached(key, list_instances, _scrub, force=force)
+
+
+def _instances_key(provider=None, identity=None):
     if provider:
-        key = INSTANCES_KEY_PROVIDER.format(provider.id)
-    else:
-        key = INSTANCES_KEY_IDENTITY.format(
-            identity.created_by.username, identity.id
-        )
-    return _get_cached(key, instances_method, _scrub, force=force)
+        return INSTANCES_KEY_PROVIDER.format(provider.id)
+    return INSTANCES_KEY_IDENTITY.format(
+        identity.created_by.username, identity.id
+    )
 
 
 def invalidate_cached_instances(provider=None, identity=None):
-    if provider:
-        key = INSTANCES_KEY_PROVIDER.format(provider.id)
-    else:
-        key = INSTANCES_KEY_IDENTITY.format(
-            identity.created_by.username, identity.id
+    _invalidate(_instances_key(provider=provider, identity=identity))
+
+
+def update_cached_instances(
+    instances, provider=None, identity=None, complete=False
+):
+    """
+    Replace the cached records of `instances` (e.g. after an instance action)
+    without listing every instance again.
+    complete - `instances` is a complete, current listing (e.g. a slice of the
+               provider listing made by the monitor): records of any other
+               instance are dropped, and the cache counts as refreshed.
+    Does nothing if there are no instances cached for the provider/identity.
+    """
+    _validate_parameters(provider, identity)
+    key = _instances_key(provider=provider, identity=identity)
+    # Leave the caller's instances connected to the cloud
+    instances = [copy.copy(instance) for instance in instances]
+    for instance in instances:
+        if hasattr(instance, "size"):
+            instance.size = copy.copy(instance.size)
+    _scrub(instances)
+    try:
+        r = redis_connection()
+        if not r.hexists(key, REFRESHED_FIELD):
+            return
+        if complete:
+            _store_records(r, key, instances)
+            return
+        r.hmset(
+            key,
+            dict(
+                (
+                    str(instance.id),
+                    pickle.dumps(instance, pickle.HIGHEST_PROTOCOL)
+                ) for instance in instances
+            )
+        )
+    except redis.exceptions.ConnectionError:
+        logger.error(
+            "EXTERNAL SERVICE redis-server IS NOT RUNNING! "
+            "Somebody should turn it on!"
+        )
+
+
+def remove_cached_instance(instance_id, provider=None, identity=None):
+    """
+    Remove a single (e.g. deleted) instance from the cached records.
+    """
+    _validate_parameters(provider, identity)
+    key = _instances_key(provider=provider, identity=identity)
+    try:
+        redis_connection().hdel(key, str(instance_id))
+    except redis.exceptions.ConnectionError:
+        logger.error(
+            "EXTERNAL SERVICE redis-server IS NOT RUNNING! "
+            "Somebody should turn it on!"
         )
-    _invalidate(key)
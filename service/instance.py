@@ -45,7 +45,9 @@ from core.exceptions import ProviderNotActive
 from django.conf import settings
 from atmosphere.settings import secrets
 
-from service.cache import get_cached_driver, invalidate_cached_instances
+from service.cache import (
+    get_cached_driver, remove_cached_instance, update_cached_instances
+)
 from service.driver import _retrieve_source, get_account_driver
 from service.licensing import _test_license
 from service.networking import get_topology_cls
@@ -162,12 +164,10 @@ def stop_instance(
     if reclaim_ip:
         remove_floating_ip(esh_driver, esh_instance, identity_uuid)
     esh_driver.stop_instance(esh_instance)
-    update_status(
+    updated_instance = update_status(
         esh_driver, esh_instance.id, provider_uuid, identity_uuid, user
     )
-    invalidate_cached_instances(
-        identity=CoreIdentity.objects.get(uuid=identity_uuid)
-    )
+    _update_cached_instance(updated_instance, esh_instance.id, identity_uuid)
 
 
 def start_instance(
@@ -209,12 +209,10 @@ def start_instance(
     esh_driver.start_instance(esh_instance)
     if restore_ip and type(esh_driver) != AtmosphereMockDriver:
         deploy_task.apply_async(countdown=10)
-    update_status(
+    updated_instance = update_status(
         esh_driver, esh_instance.id, provider_uuid, identity_uuid, user
     )
-    invalidate_cached_instances(
-        identity=CoreIdentity.objects.get(uuid=identity_uuid)
-    )
+    _update_cached_instance(updated_instance, esh_instance.id, identity_uuid)
 
 
 def suspend_instance(
@@ -233,12 +231,10 @@ def suspend_instance(
     if reclaim_ip:
         remove_floating_ip(esh_driver, esh_instance, identity_uuid)
     suspended = esh_driver.suspend_instance(esh_instance)
-    update_status(
+    updated_instance = update_status(
         esh_driver, esh_instance.id, provider_uuid, identity_uuid, user
     )
-    invalidate_cached_instances(
-        identity=CoreIdentity.objects.get(uuid=identity_uuid)
-    )
+    _update_cached_instance(updated_instance, esh_instance.id, identity_uuid)
     return suspended
 
 
@@ -509,12 +505,10 @@ def shelve_instance(
     if reclaim_ip:
         remove_floating_ip(esh_driver, esh_instance, identity_uuid)
     shelved = esh_driver._connection.ex_shelve_instance(esh_instance)
-    update_status(
+    updated_instance = update_status(
         esh_driver, esh_instance.id, provider_uuid, identity_uuid, user
     )
-    invalidate_cached_instances(
-        identity=CoreIdentity.objects.get(uuid=identity_uuid)
-    )
+    _update_cached_instance(updated_instance, esh_instance.id, identity_uuid)
     return shelved
 
 
@@ -569,12 +563,10 @@ def offload_instance(
     if reclaim_ip:
         remove_floating_ip(esh_driver, esh_instance, identity_uuid)
     offloaded = esh_driver._connection.ex_shelve_offload_instance(esh_instance)
-    update_status(
+    updated_instance = update_status(
         esh_driver, esh_instance.id, provider_uuid, identity_uuid, user
     )
-    invalidate_cached_instances(
-        identity=CoreIdentity.objects.get(uuid=identity_uuid)
-    )
+    _update_cached_instance(updated_instance, esh_instance.id, identity_uuid)
     return offloaded
 
 
@@ -589,6 +581,10 @@ def destroy_instance(user, core_identity_uuid, instance_alias):
     if not success and esh_instance:
         raise Exception("Instance could not be destroyed")
     os_cleanup_networking(core_identity_uuid)
+    remove_cached_instance(
+        instance_alias,
+        identity=CoreIdentity.objects.get(uuid=core_identity_uuid)
+    )
     core_instance = find_instance(instance_alias)
     if not core_instance:
         raise Exception("Instance %s not found" % instance_alias)
@@ -686,6 +682,7 @@ def update_status(esh_driver, instance_id, provider_uuid, identity_uuid, user):
     * call 'convert_esh_instance'
     Converting the instance internally updates the status history..
     But it makes more sense to call this function in the code..
+    Returns the new copy of the instance (None if it could not be found).
     """
     # Grab a new copy of the instance
 
@@ -696,11 +693,24 @@ def update_status(esh_driver, instance_id, provider_uuid, identity_uuid, user):
     if not esh_instance:
         return None
     if esh_driver.provider.location.lower() == 'mock':
-        return None
+        return esh_instance
     # Convert & Update based on new status change
     convert_esh_instance(
         esh_driver, esh_instance, provider_uuid, identity_uuid, user
     )
+    return esh_instance
+
+
+def _update_cached_instance(esh_instance, instance_id, identity_uuid):
+    """
+    Replace the cached record of an instance after acting on it, instead of
+    listing every instance of the identity again.
+    """
+    identity = CoreIdentity.objects.get(uuid=identity_uuid)
+    if not esh_instance:
+        remove_cached_instance(instance_id, identity=identity)
+        return
+    update_cached_instances([esh_instance], identity=identity)
 
 
 def _pre_launch_validation(
@@ -1253,8 +1263,7 @@ def _complete_launch_instance(
         token,
         deploy=deploy
     )
-    # Invalidate and return
-    invalidate_cached_instances(identity=identity)
+    update_cached_instances([instance], identity=identity)
     return core_instance
 
 
@@ -3,6 +3,7 @@ Driver factory (non-standard mock but useful for testing)
 """
 import collections
 import copy
+import time
 import uuid
 import random
 import warlock
@@ -218,6 +219,18 @@ class AtmosphereMockDriver(MockDriver):
     all_instances = ALL_INSTANCES
     all_machines = ALL_MACHINES
     all_sizes = ALL_SIZES
+    # Seconds each (simulated) call to the cloud takes
+    simulated_latency = 0
+
+    def _simulate_latency(self):
+        if self.simulated_latency:
+            time.sleep(self.simulated_latency)
+
+    def _set_instance_status(self, instance, status):
+        self._simulate_latency()
+        if instance is not None:
+            instance.extra['status'] = status
+        return True
 
     def is_valid(self):
         """
@@ -247,6 +260,7 @@ class AtmosphereMockDriver(MockDriver):
         """
         Return the InstanceClass representation of a libcloud node
         """
+        self._simulate_latency()
         instances = self.list_all_instances()
         instance = [inst for inst in instances if inst.id == instance_id]
         if not instance:
@@ -303,8 +317,8 @@ class AtmosphereMockDriver(MockDriver):
     def start_instance(self, *args, **kwargs):
         return True
 
-    def stop_instance(self, *args, **kwargs):
-        return True
+    def stop_instance(self, instance=None, *args, **kwargs):
+        return self._set_instance_status(instance, 'shutoff')
 
     def resume_instance(self, *args, **kwargs):
         return True
@@ -315,8 +329,11 @@ class AtmosphereMockDriver(MockDriver):
     def resize_instance(self, *args, **kwargs):
         return True
 
-    def suspend_instance(self, *args, **kwargs):
-        return True
+    def suspend_instance(self, instance=None, *args, **kwargs):
+        return self._set_instance_status(instance, 'suspended')
+
+    def shelve_instance(self, instance=None, *args, **kwargs):
+        return self._set_instance_status(instance, 'shelved')
 
     def destroy_instance(self, new_instance, *args, **kwargs):
         index = self.all_instances.index(new_instance)
@@ -1,8 +1,11 @@
-import random
+import Queue
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from django.core.exceptions import ObjectDoesNotExist
 import pytz
-from django.db.models import Q
+from django.db import connection, transaction
+from django.db.models import Count, Q
 from django.utils import timezone
 from threepio import logger
 from core.models import AccountProvider
@@ -10,9 +13,14 @@ from core.models.credential import Credential
 from core.models import InstanceStatusHistory
 from core.models.instance import Instance as CoreInstance
 from core.models.instance import (
-    convert_esh_instance, _esh_instance_size_to_core
+    convert_esh_instance, _esh_instance_size_to_core, _find_esh_ip,
+    _get_status_name_for_provider, _update_core_instance
 )
-from service.cache import get_cached_instances, get_cached_driver
+from service.cache import (
+    get_cached_instances, get_cached_driver, update_cached_instances,
+    _lists_all_instances
+)
+from service.driver import get_esh_driver
 from service.instance import suspend_instance, stop_instance, destroy_instance, shelve_instance, offload_instance
 from django.conf import settings
 from rtwo.exceptions import LibcloudInvalidCredsError
@@ -103,8 +111,11 @@ def _get_identity_from_tenant_name(provider, username):
         return None
 
 
-def _execute_provider_action(identity, user, instance, action_name):
-    driver = get_cached_driver(identity=identity)
+def _execute_provider_action(
+    identity, user, instance, action_name, driver=None
+):
+    if not driver:
+        driver = get_cached_driver(identity=identity)
 
     # NOTE: This if statement is a HACK! It will be removed when IP management is enabled in an upcoming version. -SG
     reclaim_ip = True if identity.provider.location != 'iPlant Cloud - Tucson' else False
@@ -218,6 +229,262 @@ def _cleanup_missing_instances(
     return instances
 
 
+def _get_identities_from_tenant_names(provider, tenant_names):
+    """
+    Bulk form of `_get_identity_from_tenant_name`
+    Returns a dict of tenant name -> Identity, with a single query.
+    """
+    identities = {}
+    credentials = Credential.objects.filter(
+        key='ex_project_name',
+        value__in=tenant_names,
+        identity__provider=provider
+    ).select_related('identity__created_by').order_by('id')
+    for credential in credentials:
+        if credential.value in identities:
+            logger.warn(
+                "%s has >1 Credentials on Provider %s" %
+                (credential.value, provider)
+            )
+            continue
+        identities[credential.value] = credential.identity
+    return identities
+
+
+def _core_instances_for_identities(identities, start_date=None):
+    """
+    Bulk form of `_core_instances_for`
+    Returns a dict of identity ID -> list of core instances.
+    """
+    if not start_date:
+        # Can't use 'None' as a query value
+        start_date = timezone.datetime(1970, 1, 1).replace(tzinfo=pytz.utc)
+    owners = dict(
+        (identity.id, identity.created_by_id) for identity in identities
+    )
+    instances_by_identity = dict((identity_id, []) for identity_id in owners)
+    core_instances = CoreInstance.objects.filter(
+        Q(instancestatushistory__end_date=None) |
+        Q(instancestatushistory__end_date__gt=start_date) | Q(end_date=None) |
+        Q(end_date__gt=start_date),
+        created_by_identity__in=owners.keys()
+    ).distinct()
+    for core_instance in core_instances:
+        identity_id = core_instance.created_by_identity_id
+        # NOTE: May need to remove this created_by line
+        # down-the-road as we share user/tenants.
+        if core_instance.created_by_id == owners[identity_id]:
+            instances_by_identity[identity_id].append(core_instance)
+    return instances_by_identity
+
+
+def _last_histories_for(instance_ids):
+    """
+    Returns a dict of instance ID -> (newest history, # of non end-dated histories)
+    """
+    last_histories = {}
+    if not instance_ids:
+        return last_histories
+    for history in InstanceStatusHistory.objects.filter(
+        instance_id__in=instance_ids
+    ).select_related('status').order_by('instance_id',
+                                        '-start_date').distinct('instance_id'):
+        last_histories[history.instance_id] = (history, 0)
+    open_counts = InstanceStatusHistory.objects.filter(
+        instance_id__in=instance_ids, end_date=None
+    ).values('instance_id').annotate(count=Count('id'))
+    for row in open_counts:
+        if row['instance_id'] in last_histories:
+            last_histories[
+                row['instance_id']
+            ] = (last_histories[row['instance_id']][0], row['count'])
+    return last_histories
+
+
+def _reconcile_running_instance(
+    driver, provider, identity, esh_instance, core_instance, last_history,
+    size_cache
+):
+    """
+    Fast path of `convert_esh_instance` for an instance that already exists,
+    has a history and has no conflicting histories.
+    Only writes to the DB when something has changed.
+    """
+    ip_address = _find_esh_ip(esh_instance)
+    if core_instance.ip_address != ip_address or core_instance.end_date:
+        _update_core_instance(core_instance, ip_address, None)
+    core_instance.esh = esh_instance
+    size_alias = esh_instance.size.id
+    core_size = size_cache.get(size_alias)
+    if not core_size:
+        core_size = _esh_instance_size_to_core(
+            driver, esh_instance, provider.uuid
+        )
+        size_cache[size_alias] = core_size
+    metadata = esh_instance.extra.get('metadata', {})
+    status_name = _get_status_name_for_provider(
+        provider, esh_instance.extra['status'], esh_instance.extra.get('task'),
+        metadata.get('tmp_status', "MISSING")
+    )
+    if last_history.status.name == status_name \
+            and last_history.size_id == core_size.id:
+        return core_instance
+    core_instance.update_history(
+        esh_instance.extra['status'],
+        core_size,
+        esh_instance.extra.get('task'),
+        metadata.get('tmp_status', "MISSING"),
+        fault=esh_instance.extra.get('fault', None),
+        deploy_fault_message=metadata.get('fault_message', None),
+        deploy_fault_trace=metadata.get('fault_trace', None)
+    )
+    return core_instance
+
+
+def _end_date_missing_instances(core_instances, end_date=None):
+    """
+    Bulk form of `Instance.end_date_all` for many instances.
+    """
+    if not core_instances:
+        return 0
+    if not end_date:
+        end_date = timezone.now()
+    instance_ids = [core_instance.id for core_instance in core_instances]
+    with transaction.atomic():
+        histories_ended = InstanceStatusHistory.objects.filter(
+            instance_id__in=instance_ids, end_date=None
+        ).update(end_date=end_date)
+        instances_ended = CoreInstance.objects.filter(
+            id__in=instance_ids, end_date=None
+        ).update(end_date=end_date)
+    if histories_ended or instances_ended:
+        logger.info(
+            "END DATED %s instances and %s instance histories: %s" %
+            (instances_ended, histories_ended, end_date)
+        )
+    return instances_ended
+
+
+def reconcile_provider_instances(provider, instance_map, start_date=None):
+    """
+    Bulk form of `convert_esh_instance` + `_cleanup_missing_instances` for
+    every tenant of the provider.
+
+    instance_map - tenant name -> list of (esh) instances running in the cloud
+                   (See `_get_instance_owner_map`)
+
+    Identities, core instances and their latest histories are all read up
+    front, in a few queries. The cloud listing is compared to them in memory,
+    so only instances that have changed are written to. New instances, and
+    instances with conflicting histories, go through the per-instance path.
+    The cached instances of each identity are replaced by its slice of the
+    listing.
+    Returns the list of core instances that are running.
+    """
+    identities = _get_identities_from_tenant_names(
+        provider, instance_map.keys()
+    )
+    instances_by_identity = _core_instances_for_identities(
+        identities.values(), start_date
+    )
+    core_instances_by_alias = {}
+    for core_instances in instances_by_identity.values():
+        for core_instance in core_instances:
+            core_instances_by_alias[core_instance.provider_alias
+                                   ] = core_instance
+    # Running instances can be owned by another identity
+    running_aliases = set(
+        esh_instance.id for running_instances in instance_map.values()
+        for esh_instance in running_instances
+    )
+    unknown_aliases = running_aliases - set(core_instances_by_alias.keys())
+    if unknown_aliases:
+        for core_instance in CoreInstance.objects.filter(
+            provider_alias__in=unknown_aliases
+        ):
+            core_instances_by_alias[core_instance.provider_alias
+                                   ] = core_instance
+    last_histories = _last_histories_for(
+        [
+            core_instances_by_alias[alias].id
+            for alias in running_aliases if alias in core_instances_by_alias
+        ]
+    )
+
+    seen_instances = []
+    size_cache = {}
+    missing_instances = []
+    for tenant_name in sorted(instance_map.keys()):
+        running_instances = instance_map[tenant_name]
+        identity = identities.get(tenant_name)
+        if not identity:
+            continue
+        core_running_ids = set()
+        if running_instances:
+            try:
+                driver = get_cached_driver(identity=identity)
+                for esh_instance in running_instances:
+                    core_instance = core_instances_by_alias.get(esh_instance.id)
+                    last_history, open_count = last_histories.get(
+                        core_instance.id, (None, 0)
+                    ) if core_instance else (None, 0)
+                    if last_history and open_count <= 1:
+                        core_instance = _reconcile_running_instance(
+                            driver, provider, identity, esh_instance,
+                            core_instance, last_history, size_cache
+                        )
+                    else:
+                        core_instance = convert_esh_instance(
+                            driver, esh_instance, provider.uuid, identity.uuid,
+                            identity.created_by
+                        )
+                        _cleanup_history_conflict(identity, core_instance)
+                    core_running_ids.add(core_instance.id)
+                    seen_instances.append(core_instance)
+            except Exception:
+                logger.exception(
+                    "Could not convert running instances for %s" % tenant_name
+                )
+                continue
+        if not _lists_all_instances(identity):
+            # This is all the identity can list, so refresh its cached
+            # instances as well (if it has any) instead of listing them again.
+            update_cached_instances(
+                running_instances, identity=identity, complete=True
+            )
+        missing_instances.extend(
+            core_instance
+            for core_instance in instances_by_identity.get(identity.id, [])
+            if core_instance.id not in core_running_ids
+        )
+    _end_date_missing_instances(missing_instances)
+    return seen_instances
+
+
+def _cleanup_history_conflict(identity, core_running_instance):
+    """
+    The 'running' half of `_cleanup_missing_instances` for a single instance.
+    """
+    non_end_dated_history = core_running_instance.instancestatushistory_set.filter(
+        end_date=None
+    )
+    count = len(non_end_dated_history)
+    if count <= 1:
+        return
+    history_names = [ish.status.name for ish in non_end_dated_history]
+    new_history = _resolve_history_conflict(
+        identity, core_running_instance, non_end_dated_history
+    )
+    logger.warn(
+        "Instance %s contained %s "
+        "NON END DATED history:%s. "
+        " New History: %s" % (
+            core_running_instance.provider_alias, count, history_names,
+            new_history
+        )
+    )
+
+
 def _resolve_history_conflict(
     identity, core_running_instance, bad_history, reset_time=None
 ):
@@ -343,15 +610,133 @@ def allocation_source_overage_enforcement_for(
     filtered_instances = filter_allocation_source_instances(
         allocation_source, user, esh_instances
     )
-    # TODO: Parallelize this operation so you don't wait for larger instances
-    # to finish 'wait_for' task below..
-    instances = []
-    for instance in filtered_instances:
-        core_instance = execute_provider_action(
-            user, driver, identity, instance, action
+    return enforce_provider_action(
+        user, driver, identity, filtered_instances, action
+    )
+
+
+def map_with_driver_pool(first_driver, make_driver, fn, items, max_workers):
+    """
+    Return `[fn(driver, item) for item in items]`, computed by at most
+    `max_workers` threads.
+
+    libcloud connections are not thread-safe, so every call borrows a driver
+    that no other thread is using: `first_driver`, or one of the
+    `max_workers - 1` others made with `make_driver()`.
+    """
+    if not items:
+        return []
+    max_workers = min(max_workers, len(items))
+    drivers = Queue.Queue()
+    drivers.put(first_driver)
+    for _ in range(max_workers - 1):
+        drivers.put(make_driver())
+
+    def _call(item):
+        driver = drivers.get()
+        try:
+            return fn(driver, item)
+        finally:
+            drivers.put(driver)
+            # Each worker thread has its own database connection
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_call, items))
+
+
+# Provider UUID -> Semaphore, shared by all enforcement in this process
+_provider_enforcement_semaphores = {}
+_provider_enforcement_semaphores_lock = threading.Lock()
+
+
+def _get_provider_enforcement_semaphore(provider):
+    with _provider_enforcement_semaphores_lock:
+        semaphore = _provider_enforcement_semaphores.get(provider.uuid)
+        if not semaphore:
+            semaphore = threading.BoundedSemaphore(
+                getattr(settings, 'ENFORCEMENT_CONCURRENCY', 4)
+            )
+            _provider_enforcement_semaphores[provider.uuid] = semaphore
+    return semaphore
+
+
+def enforce_provider_action(user, driver, identity, instances, action):
+    """
+    Execute the provider `action` on each of the (esh) `instances`, concurrently.
+
+    At most `settings.ENFORCEMENT_CONCURRENCY` actions run at once on the
+    identity's provider. libcloud connections are not thread-safe, so every
+    action borrows a driver that no other thread is using: `driver` and
+    one more per additional worker. Returns one result per instance, in order:
+    {
+        "instance_id": "<provider alias>",
+        "action": "Suspend",
+        "result": "enforced", "skipped" (Instance was not active) or "failed",
+        "instance": <Core Instance> or None,
+        "error": <Exception message> or None,
+        "duration": <seconds>
+    }
+    """
+    if not instances:
+        return []
+    semaphore = _get_provider_enforcement_semaphore(identity.provider)
+
+    def _enforce(worker_driver, instance):
+        result = {
+            'instance_id': instance.id,
+            'action': action.name,
+            'result': 'skipped',
+            'instance': None,
+            'error': None,
+        }
+        started = time.time()
+        try:
+            with semaphore:
+                result['instance'] = execute_provider_action(
+                    user, worker_driver, identity, instance, action
+                )
+            if result['instance']:
+                result['result'] = 'enforced'
+        except Exception as exc:
+            result['result'] = 'failed'
+            result['error'] = str(exc)
+        result['duration'] = time.time() - started
+        logger.info(
+            "Enforcement of %s on Instance %s for User %s: %s (%.1fs)",
+            action.name, instance.id, user, result['result'], result['duration']
         )
-        instances.append(core_instance)
-    return instances
+        return result
+
+    return map_with_driver_pool(
+        driver, lambda: get_esh_driver(identity), _enforce, instances,
+        getattr(settings, 'ENFORCEMENT_CONCURRENCY', 4)
+    )
+
+
+def wait_for_terminal_state(driver, instance_id):
+    """
+    Poll the provider until the instance is no longer active (or has been
+    removed), for up to `settings.ENFORCEMENT_TIMEOUT` seconds.
+    Returns the last (esh) instance seen, None if it no longer exists.
+    """
+    poll_interval = getattr(settings, 'ENFORCEMENT_POLL_INTERVAL', 2)
+    timeout = getattr(settings, 'ENFORCEMENT_TIMEOUT', 120)
+    deadline = time.time() + timeout
+    while True:
+        esh_instance = driver.get_instance(instance_id)
+        if not esh_instance:
+            return None
+        if not driver._is_active_instance(esh_instance) \
+                and not esh_instance.extra.get('task'):
+            return esh_instance
+        if time.time() >= deadline:
+            logger.warn(
+                "Instance %s is still active %s seconds after enforcement",
+                instance_id, timeout
+            )
+            return esh_instance
+        time.sleep(poll_interval)
 
 
 def execute_provider_action(user, driver, identity, instance, action):
@@ -365,16 +750,17 @@ def execute_provider_action(user, driver, identity, instance, action):
             # NOTE: identity.created_by COULD BE the Admin User, indicating that this action/InstanceHistory was
             #       executed by the administrator.. Future Release Idea.
             _execute_provider_action(
-                identity, identity.created_by, instance, action.name
+                identity,
+                identity.created_by,
+                instance,
+                action.name,
+                driver=driver
             )
-            # NOTE: Intentionally added to allow time for
-            #      the Cloud to begin 'suspend' operation
-            #      before querying for the instance again.
-            # TODO: Instead: Add "wait_for" change from active to any
-            # terminal, non-active state?
-            wait_time = random.uniform(2, 6)
-            time.sleep(wait_time)
-            updated_esh = driver.get_instance(instance.id)
+            updated_esh = wait_for_terminal_state(driver, instance.id)
+            if not updated_esh:
+                # Instance was removed (Terminate)
+                return CoreInstance.objects.filter(provider_alias=instance.id
+                                                  ).first()
             core_instance = convert_esh_instance(
                 driver, updated_esh, identity.provider.uuid, identity.uuid, user
             )
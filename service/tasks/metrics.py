@@ -0,0 +1,23 @@
+"""
+Precompute (and cache) metrics served by the API
+"""
+import time
+
+from celery.decorators import task
+from threepio import celery_logger
+
+from core.metrics.application import precompute_application_metrics
+
+
+@task(name="precompute_application_metrics_task", ignore_result=True)
+def precompute_application_metrics_task(incremental=True):
+    started = time.time()
+    try:
+        count = precompute_application_metrics(incremental=incremental)
+    except Exception as exc:
+        celery_logger.exception(exc)
+        return
+    celery_logger.info(
+        "Precomputed metrics for %s applications in %.2f seconds" %
+        (count, time.time() - started)
+    )
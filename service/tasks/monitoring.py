@@ -1,27 +1,35 @@
+import time
 from datetime import timedelta
 
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Q, Count
-from django.core.exceptions import ObjectDoesNotExist
 from django.utils import timezone
 
 from celery.decorators import task
 
 from core.plugins import MachineValidationPluginManager, AllocationSourcePluginManager, EnforcementOverrideChoice
+from core.memo import memoize
+from core.redis_client import get_many, get_redis_client
 from core.query import (
-    contains_credential, only_current, only_current_source, source_in_range,
-    inactive_versions
+    only_current, only_current_source, source_in_range, inactive_versions
 )
 from core.models.group import Group
-from core.models.size import Size, convert_esh_size
-from core.models.volume import Volume, convert_esh_volume
+from core.models.size import (Size, convert_esh_size, _update_from_cloud_size)
+from core.models.credential import Credential
+from core.models.volume import (Volume, VolumeStatusHistory, convert_esh_volume)
 from core.models.instance import convert_esh_instance
 from core.models.provider import Provider
 from core.models.machine import convert_glance_image, ProviderMachine, ProviderMachineMembership
+from core.models.instance_source import (
+    InstanceSource, update_instance_source_size
+)
 from core.models.machine_request import MachineRequest
 from core.models.application import Application, ApplicationMembership
-from core.models.allocation_source import AllocationSource
-from core.models.application_version import ApplicationVersion
+from core.models.allocation_source import AllocationSource, UserAllocationSource
+from core.models.application_version import (
+    ApplicationVersion, ApplicationVersionMembership
+)
 
 from service.machine import (
     update_db_membership_for_group, update_cloud_membership_for_machine,
@@ -29,9 +37,10 @@ from service.machine import (
 )
 from service.monitoring import (
     _cleanup_missing_instances, _get_instance_owner_map,
-    _get_identity_from_tenant_name, allocation_source_overage_enforcement_for
+    _get_identity_from_tenant_name, allocation_source_overage_enforcement_for,
+    map_with_driver_pool, reconcile_provider_instances
 )
-from service.driver import get_account_driver
+from service.driver import get_account_driver, get_admin_driver
 from service.cache import get_cached_driver
 from service.exceptions import TimeoutError
 from rtwo.models.size import OSSize
@@ -186,7 +195,8 @@ def monitor_machines_for(
     limit_machines=[],
     print_logs=False,
     dry_run=False,
-    validate=True
+    validate=True,
+    bulk=None
 ):
     """
     Run the set of tasks related to monitoring machines for a provider.
@@ -194,19 +204,24 @@ def monitor_machines_for(
     While debugging, print_logs=True can be very helpful.
     start_date and end_date allow you to search a 'non-standard' window of time.
 
-    NEW LOGIC:
+    bulk - Sync every machine at once (See `_sync_machines_bulk`)
+           Defaults to settings.MONITOR_MACHINES_BULK_SYNC
+
+    Returns {'machines': [ProviderMachine, ...], 'timings': {stage: seconds}}
     """
     provider = Provider.objects.get(id=provider_id)
 
     if print_logs:
         console_handler = _init_stdout_logging()
 
+    timings = {}
+    started = time.time()
     account_driver = get_account_driver(provider)
     #Bail out if account driver is invalid
     if not account_driver:
         if print_logs:
             _exit_stdout_logging(console_handler)
-        return []
+        return {'machines': [], 'timings': timings}
 
     if account_driver.user_manager.version == 2:
         #Old providers need to use v1 glance to get owner information.
@@ -220,12 +235,43 @@ def monitor_machines_for(
         cloud_machines = [
             cm for cm in cloud_machines if cm.id in limit_machines
         ]
-    db_machines = []
+    timings['list_images'] = time.time() - started
     # ASSERT: All non-end-dated machines in the DB can be found in the cloud
     # if you do not believe this is the case, you should call 'prune_machines_for'
     machine_validator = MachineValidationPluginManager.get_validator(
         account_driver
     )
+    if bulk is None:
+        bulk = getattr(settings, 'MONITOR_MACHINES_BULK_SYNC', True)
+    if bulk:
+        db_machines = _sync_machines_bulk(
+            account_driver, provider, cloud_machines, machine_validator,
+            validate, timings
+        )
+    else:
+        db_machines = _sync_machines(
+            account_driver, provider, cloud_machines, machine_validator,
+            validate, timings
+        )
+    timings['total'] = time.time() - started
+    celery_logger.info(
+        "Synced %s machines for %s: %s" % (len(db_machines), provider, timings)
+    )
+
+    if print_logs:
+        _exit_stdout_logging(console_handler)
+    return {'machines': db_machines, 'timings': timings}
+
+
+def _sync_machines(
+    account_driver, provider, cloud_machines, machine_validator, validate,
+    timings
+):
+    """
+    Convert, and update the membership of, one cloud machine at a time.
+    """
+    started = time.time()
+    db_machines = []
     for cloud_machine in cloud_machines:
         if validate and not machine_validator.machine_is_valid(cloud_machine):
             continue
@@ -256,25 +302,133 @@ def monitor_machines_for(
         # 1) We will never 'remove' membership,
         # 2) We will never 'remove' a public or private flag as listed in application.
         # 2b) Future: Individual versions/machines as described by relationships above dictate whats shown in the application.
-
-    if print_logs:
-        _exit_stdout_logging(console_handler)
+    timings['sync'] = time.time() - started
     return db_machines
 
 
-def distribute_image_membership(account_driver, cloud_machine, provider):
+def _sync_machines_bulk(
+    account_driver, provider, cloud_machines, machine_validator, validate,
+    timings
+):
     """
-    Based on what we know about the DB, at a minimum, ensure that their projects are added to the image_members list for this cloud_machine.
+    Same steps as `_sync_machines`, but:
+    - Projects are listed once, instead of looked up per machine
+    - Every ProviderMachine (and its version and application) of the provider
+      is loaded up front, and compared to the cloud machines in memory
+    - Creates and updates are written MONITOR_MACHINES_BATCH_SIZE machines
+      per transaction
+    - Memberships to re-distribute are loaded with a single query
     """
-    pm = ProviderMachine.objects.get(
-        instance_source__provider=provider,
-        instance_source__identifier=cloud_machine.id
+    started = time.time()
+    projects_by_id = {}
+    projects_by_name = {}
+    for project in account_driver.list_projects():
+        projects_by_id[project.id] = project
+        projects_by_name[project.name] = project
+    timings['list_projects'] = time.time() - started
+
+    started = time.time()
+    known_machines = dict(
+        (provider_machine.instance_source.identifier, provider_machine)
+        for provider_machine in ProviderMachine.objects.filter(
+            instance_source__provider=provider
+        ).select_related('instance_source', 'application_version__application')
     )
-    group_ids = ProviderMachineMembership.objects.filter(provider_machine=pm
-                                                        ).values_list(
-                                                            'group', flat=True
-                                                        )
-    groups = Group.objects.filter(id__in=group_ids)
+    timings['load_machines'] = time.time() - started
+
+    #STEP 1: Get the application, version, and provider_machine registered in Atmosphere
+    started = time.time()
+    synced_machines = []
+    batch_size = getattr(settings, 'MONITOR_MACHINES_BATCH_SIZE', 500)
+    for idx in range(0, len(cloud_machines), batch_size):
+        with transaction.atomic():
+            for cloud_machine in cloud_machines[idx:idx + batch_size]:
+                if validate and not machine_validator.machine_is_valid(
+                    cloud_machine
+                ):
+                    continue
+                db_machine = known_machines.get(cloud_machine.id)
+                if db_machine:
+                    if db_machine.is_end_dated():
+                        continue
+                    # Only saved if the size has changed
+                    update_instance_source_size(
+                        db_machine.instance_source, cloud_machine.get('size')
+                    )
+                else:
+                    owner = cloud_machine.get('owner')
+                    if owner:
+                        owner_project = projects_by_id.get(owner)
+                    else:
+                        owner_project = projects_by_name.get(
+                            cloud_machine.get('application_owner')
+                        )
+                    (db_machine, created) = convert_glance_image(
+                        account_driver, cloud_machine, provider.uuid,
+                        owner_project
+                    )
+                    if not db_machine:
+                        continue
+                synced_machines.append((cloud_machine, db_machine))
+    timings['convert'] = time.time() - started
+
+    #STEP 2: For any private cloud_machine, convert the 'shared users' as known by cloud
+    #        into DB relationships: ApplicationVersionMembership, ProviderMachineMembership
+    started = time.time()
+    reconcile_image_memberships(
+        account_driver,
+        provider,
+        synced_machines,
+        remove_stale=getattr(
+            settings, 'MONITOR_MACHINES_REMOVE_MEMBERSHIP', False
+        )
+    )
+    timings['membership'] = time.time() - started
+
+    # STEP 3: if ENFORCING -- occasionally 're-distribute' any ACLs that
+    # are *listed on DB but not on cloud* -- removals should be done
+    # explicitly, outside of this function
+    if settings.ENFORCING:
+        started = time.time()
+        groups_by_machine = {}
+        for membership in ProviderMachineMembership.objects.filter(
+            provider_machine__instance_source__provider=provider
+        ).select_related('group'):
+            groups_by_machine.setdefault(membership.provider_machine_id,
+                                         []).append(membership.group)
+        for cloud_machine, db_machine in synced_machines:
+            distribute_image_membership(
+                account_driver,
+                cloud_machine,
+                provider,
+                provider_machine=db_machine,
+                groups=groups_by_machine.get(db_machine.id, [])
+            )
+        timings['distribute'] = time.time() - started
+    return [db_machine for _, db_machine in synced_machines]
+
+
+def distribute_image_membership(
+    account_driver, cloud_machine, provider, provider_machine=None, groups=None
+):
+    """
+    Based on what we know about the DB, at a minimum, ensure that their projects are added to the image_members list for this cloud_machine.
+    provider_machine, groups - (Optional) Skip looking up the ProviderMachine
+                               and its membership groups
+    """
+    pm = provider_machine
+    if not pm:
+        pm = ProviderMachine.objects.get(
+            instance_source__provider=provider,
+            instance_source__identifier=cloud_machine.id
+        )
+    if groups is None:
+        group_ids = ProviderMachineMembership.objects.filter(
+            provider_machine=pm
+        ).values_list(
+            'group', flat=True
+        )
+        groups = Group.objects.filter(id__in=group_ids)
     for group in groups:
         try:
             celery_logger.info(
@@ -388,6 +542,233 @@ def update_image_membership(account_driver, cloud_machine, db_machine):
     return groups
 
 
+def _get_image_members_many(account_driver, provider, image_ids):
+    """
+    Fetch the members of many images, at most
+    settings.MONITOR_MACHINES_MEMBER_CONCURRENCY at a time.
+    Every fetch borrows an account driver that no other thread is using:
+    `account_driver` and one more per additional worker.
+    Returns a dict of image ID -> set of project names (None if the fetch failed)
+    """
+
+    def _get_members(worker_driver, image_id):
+        try:
+            members = worker_driver.get_image_members(image_id, None)
+            return image_id, set(project.name for project in members)
+        except Exception:
+            celery_logger.exception(
+                "Could not retrieve the members of image %s" % image_id
+            )
+            return image_id, None
+
+    return dict(
+        map_with_driver_pool(
+            account_driver,
+            lambda: get_account_driver(provider, raise_exception=True),
+            _get_members, image_ids,
+            getattr(settings, 'MONITOR_MACHINES_MEMBER_CONCURRENCY', 8)
+        )
+    )
+
+
+def _get_last_machine_requests(image_ids):
+    """
+    Returns a dict of image ID -> the last 'completed' MachineRequest
+    that created it.
+    """
+    machine_requests = {}
+    for machine_request in MachineRequest.objects.filter(
+        new_machine__instance_source__identifier__in=image_ids,
+        status__name='completed'
+    ).select_related('new_machine__instance_source').order_by('id'):
+        image_id = machine_request.new_machine.instance_source.identifier
+        machine_requests[image_id] = machine_request
+    return machine_requests
+
+
+def reconcile_image_memberships(
+    account_driver, provider, synced_machines, remove_stale=False
+):
+    """
+    Set-based form of `update_image_membership` for many machines.
+
+    synced_machines - list of (cloud_machine, ProviderMachine)
+    remove_stale - Also remove the ProviderMachineMembership (and, once a
+                   group has no machine left in the version, the
+                   ApplicationVersionMembership) of groups that are no longer
+                   in the access list of the machine.
+
+    Image members are fetched concurrently, and the last completed
+    MachineRequest of every image is loaded with a single query. The access
+    lists are then compared to the existing memberships as sets, and the
+    difference is written with bulk inserts (and deletes).
+    Returns a dict of membership type -> (# added, # removed)
+    """
+    private_machines = [
+        (cloud_machine, db_machine)
+        for cloud_machine, db_machine in synced_machines
+        if cloud_machine.get('visibility', 'private').lower() != 'public'
+    ]
+    image_ids = [cloud_machine.id for cloud_machine, _ in private_machines]
+    image_members = _get_image_members_many(account_driver, provider, image_ids)
+    machine_requests = _get_last_machine_requests(image_ids)
+
+    application_access_lists = {}
+    shared_project_names = {}
+    for cloud_machine, db_machine in private_machines:
+        cloud_shared_set = image_members.get(cloud_machine.id)
+        if cloud_shared_set is None:
+            continue
+        # See `_get_all_access_list`
+        owner_set = set()
+        image_owner = cloud_machine.get('application_owner')
+        if image_owner:
+            owner_set.add(image_owner)
+        has_machine_request = machine_requests.get(cloud_machine.id)
+        machine_request_set = set()
+        if has_machine_request:
+            machine_request_set = {
+                name.strip()
+                for name in has_machine_request.get_access_list()
+            }
+        parent_app = db_machine.application_version.application
+        if parent_app.id not in application_access_lists:
+            application_access_lists[parent_app.id] = set(
+                parent_app.get_users_from_access_list().values_list(
+                    'username', flat=True
+                )
+            )
+        project_names = (
+            owner_set | cloud_shared_set | machine_request_set |
+            application_access_lists[parent_app.id]
+        )
+        # THIS IS A HACK - See `update_image_membership`. Images without a
+        # machine request are skipped; the others keep their access list
+        # (the reset to the machine request never applied to the groups).
+        if len(project_names) > 128:
+            celery_logger.warn(
+                "Application %s has too many shared users. Consider running 'prune_machines' to cleanup",
+                parent_app
+            )
+            if not has_machine_request:
+                continue
+        #ENDHACK
+        shared_project_names[db_machine] = project_names
+
+    group_ids = dict(
+        Group.objects.filter(
+            name__in=set().union(*shared_project_names.values())
+        ).values_list('name', 'id')
+    )
+    wanted = {
+        ProviderMachineMembership: set(),
+        ApplicationVersionMembership: set(),
+        ApplicationMembership: set()
+    }
+    for db_machine, project_names in shared_project_names.items():
+        for name in project_names:
+            group_id = group_ids.get(name)
+            if not group_id:
+                continue
+            wanted[ProviderMachineMembership].add((db_machine.id, group_id))
+            wanted[ApplicationVersionMembership].add(
+                (db_machine.application_version_id, group_id)
+            )
+            wanted[ApplicationMembership].add(
+                (db_machine.application_version.application_id, group_id)
+            )
+
+    fields = {
+        ProviderMachineMembership: 'provider_machine_id',
+        ApplicationVersionMembership: 'image_version_id',
+        ApplicationMembership: 'application_id'
+    }
+    reconciled_ids = {
+        ProviderMachineMembership:
+            set(m.id for m in shared_project_names),
+        ApplicationVersionMembership:
+            set(m.application_version_id for m in shared_project_names),
+        ApplicationMembership:
+            set(
+                m.application_version.application_id
+                for m in shared_project_names
+            )
+    }
+    changes = {}
+    with transaction.atomic():
+        for model, field in fields.items():
+            existing = set(
+                model.objects.filter(**{
+                    field + '__in': reconciled_ids[model]
+                }).values_list(field, 'group_id')
+            )
+            added = wanted[model] - existing
+            model.objects.bulk_create(
+                [
+                    model(**{
+                        field: object_id,
+                        'group_id': member_id
+                    }) for object_id, member_id in added
+                ]
+            )
+            changes[model.__name__] = (len(added), 0)
+        if remove_stale:
+            removed = _remove_stale_memberships(
+                wanted, reconciled_ids[ProviderMachineMembership],
+                reconciled_ids[ApplicationVersionMembership]
+            )
+            for name, count in removed.items():
+                changes[name] = (changes[name][0], count)
+    celery_logger.info(
+        "Reconciled membership of %s machines on %s: %s" %
+        (len(shared_project_names), provider, changes)
+    )
+    return changes
+
+
+def _delete_memberships(model, field, memberships):
+    group_ids = {}
+    for object_id, group_id in memberships:
+        group_ids.setdefault(object_id, []).append(group_id)
+    for object_id, object_group_ids in group_ids.items():
+        model.objects.filter(
+            **{
+                field: object_id,
+                'group_id__in': object_group_ids
+            }
+        ).delete()
+
+
+def _remove_stale_memberships(wanted, machine_ids, version_ids):
+    stale_machine_members = set(
+        ProviderMachineMembership.objects.filter(
+            provider_machine_id__in=machine_ids
+        ).values_list('provider_machine_id', 'group_id')
+    ) - wanted[ProviderMachineMembership]
+    _delete_memberships(
+        ProviderMachineMembership, 'provider_machine_id', stale_machine_members
+    )
+    # Versions can have machines on other providers, only remove groups that
+    # are not a member of any of them.
+    remaining_version_members = set(
+        ProviderMachineMembership.objects.filter(
+            provider_machine__application_version_id__in=version_ids
+        ).values_list('provider_machine__application_version_id', 'group_id')
+    )
+    stale_version_members = set(
+        ApplicationVersionMembership.objects.filter(
+            image_version_id__in=version_ids
+        ).values_list('image_version_id', 'group_id')
+    ) - wanted[ApplicationVersionMembership] - remaining_version_members
+    _delete_memberships(
+        ApplicationVersionMembership, 'image_version_id', stale_version_members
+    )
+    return {
+        ProviderMachineMembership.__name__: len(stale_machine_members),
+        ApplicationVersionMembership.__name__: len(stale_version_members)
+    }
+
+
 def remove_machine(db_machine, now_time=None, dry_run=False):
     """
     End date the DB ProviderMachine
@@ -430,39 +811,43 @@ def remove_machine(db_machine, now_time=None, dry_run=False):
     return True
 
 
-def memoized_image(account_driver, db_machine, image_maps={}):
-    provider = db_machine.instance_source.provider
-    identifier = db_machine.instance_source.identifier
-    cloud_machine = image_maps.get((provider, identifier))
-    # Return memoized result
-    if cloud_machine:
-        return cloud_machine
-    # Retrieve and remember
-    cloud_machine = account_driver.get_image(identifier)
-    image_maps[(provider, identifier)] = cloud_machine
-    return cloud_machine
+@memoize(
+    max_size=4096,
+    ttl=10 * 60,
+    task_scoped=True,
+    key=lambda account_driver, db_machine: (
+        db_machine.instance_source.provider_id,
+        db_machine.instance_source.identifier
+    )
+)
+def memoized_image(account_driver, db_machine):
+    return account_driver.get_image(db_machine.instance_source.identifier)
 
 
-def memoized_driver(machine, account_drivers={}):
+@memoize(
+    max_size=64,
+    ttl=30 * 60,
+    task_scoped=True,
+    key=lambda machine: machine.instance_source.provider_id
+)
+def memoized_driver(machine):
     provider = machine.instance_source.provider
-    account_driver = account_drivers.get(provider)
+    account_driver = get_account_driver(provider)
     if not account_driver:
-        account_driver = get_account_driver(provider)
-        if not account_driver:
-            raise Exception(
-                "Cannot instantiate an account driver for %s" % provider
-            )
-        account_drivers[provider] = account_driver
+        raise Exception(
+            "Cannot instantiate an account driver for %s" % provider
+        )
     return account_driver
 
 
-def memoized_tenant_name_map(account_driver, tenant_list_maps={}):
-    tenant_id_name_map = tenant_list_maps.get(account_driver.core_provider)
-    if not tenant_id_name_map:
-        tenant_id_name_map = tenant_id_to_name_map(account_driver)
-        tenant_list_maps[account_driver.core_provider] = tenant_id_name_map
-
-    return tenant_id_name_map
+@memoize(
+    max_size=64,
+    ttl=10 * 60,
+    task_scoped=True,
+    key=lambda account_driver: account_driver.core_provider.id
+)
+def memoized_tenant_name_map(account_driver):
+    return tenant_id_to_name_map(account_driver)
 
 
 def get_current_members(account_driver, machine, tenant_id_name_map):
@@ -516,7 +901,9 @@ def monitor_resources_for(provider_id, users=None, print_logs=False):
     resources = {}
     sizes = monitor_sizes_for(provider_id, print_logs=print_logs)
     volumes = monitor_volumes_for(provider_id, print_logs=print_logs)
-    machines = monitor_machines_for(provider_id, print_logs=print_logs)
+    machines = monitor_machines_for(
+        provider_id, print_logs=print_logs
+    )['machines']
     instances = monitor_instances_for(
         provider_id, users=users, print_logs=print_logs
     )
@@ -546,60 +933,58 @@ def monitor_allocation_sources(usernames=()):
     Monitor allocation sources, if a snapshot shows that all compute has been used, then enforce as necessary
     """
     celery_logger.debug('monitor_allocation_sources - usernames: %s', usernames)
-    allocation_sources = AllocationSource.objects.all()
-    for allocation_source in allocation_sources.order_by('name'):
+    memberships = UserAllocationSource.objects.select_related(
+        'allocation_source', 'user'
+    ).order_by('allocation_source__name', 'user__username')
+    if usernames:
+        memberships = memberships.filter(user__username__in=usernames)
+    source_user_pairs = [
+        (membership.allocation_source, membership.user)
+        for membership in memberships
+    ]
+    time_remaining = AllocationSource.time_remaining_for(source_user_pairs)
+    enforcement_overrides = AllocationSourcePluginManager.get_enforcement_overrides(
+        source_user_pairs
+    )
+
+    for allocation_source, user in source_user_pairs:
+        over_allocation = time_remaining[(allocation_source.id, user.id)] < 0
+        enforcement_override_choice = enforcement_overrides[
+            (allocation_source.id, user.id)]
         celery_logger.debug(
-            'monitor_allocation_sources - allocation_source: %s',
-            allocation_source
+            'monitor_allocation_sources - allocation_source: %s, user: %s, '
+            'over_allocation: %s, enforcement_override_choice: %s',
+            allocation_source, user, over_allocation,
+            enforcement_override_choice
         )
-        for user in allocation_source.all_users.order_by('username'):
-            celery_logger.debug('monitor_allocation_sources - user: %s', user)
-            if usernames and user.username not in usernames:
-                celery_logger.info(
-                    "Skipping User %s - not in the list" % user.username
-                )
-                continue
-            over_allocation = allocation_source.is_over_allocation(user)
+
+        if over_allocation and enforcement_override_choice == EnforcementOverrideChoice.NEVER_ENFORCE:
             celery_logger.debug(
-                'monitor_allocation_sources - user: %s, over_allocation: %s',
-                user, over_allocation
+                'Allocation source is over allocation, but %s + user %s has an override of %s, '
+                'therefore not enforcing', allocation_source, user,
+                enforcement_override_choice
             )
+            continue
 
-            enforcement_override_choice = AllocationSourcePluginManager.get_enforcement_override(
-                user, allocation_source
-            )
+        if not over_allocation and enforcement_override_choice == EnforcementOverrideChoice.ALWAYS_ENFORCE:
             celery_logger.debug(
-                'monitor_allocation_sources - enforcement_override_choice: %s',
+                'Allocation source is not over allocation, but %s + user %s has an override of %s, '
+                'therefore enforcing', allocation_source, user,
                 enforcement_override_choice
             )
-
-            if over_allocation and enforcement_override_choice == EnforcementOverrideChoice.NEVER_ENFORCE:
-                celery_logger.debug(
-                    'Allocation source is over allocation, but %s + user %s has an override of %s, '
-                    'therefore not enforcing', allocation_source, user,
-                    enforcement_override_choice
-                )
-                continue
-
-            if not over_allocation and enforcement_override_choice == EnforcementOverrideChoice.ALWAYS_ENFORCE:
-                celery_logger.debug(
-                    'Allocation source is not over allocation, but %s + user %s has an override of %s, '
-                    'therefore enforcing', allocation_source, user,
-                    enforcement_override_choice
-                )
-                # Note: The enforcing happens in the next `if` statement.
-            if over_allocation or enforcement_override_choice == EnforcementOverrideChoice.ALWAYS_ENFORCE:
-                assert enforcement_override_choice in (
-                    EnforcementOverrideChoice.NO_OVERRIDE,
-                    EnforcementOverrideChoice.ALWAYS_ENFORCE
-                )
-                celery_logger.debug(
-                    'monitor_allocation_sources - Going to enforce on user: %s',
-                    user
-                )
-                allocation_source_overage_enforcement_for_user.apply_async(
-                    args=(allocation_source, user)
-                )
+            # Note: The enforcing happens in the next `if` statement.
+        if over_allocation or enforcement_override_choice == EnforcementOverrideChoice.ALWAYS_ENFORCE:
+            assert enforcement_override_choice in (
+                EnforcementOverrideChoice.NO_OVERRIDE,
+                EnforcementOverrideChoice.ALWAYS_ENFORCE
+            )
+            celery_logger.debug(
+                'monitor_allocation_sources - Going to enforce on user: %s',
+                user
+            )
+            allocation_source_overage_enforcement_for_user.apply_async(
+                args=(allocation_source, user)
+            )
 
 
 @task(name="allocation_source_overage_enforcement_for_user")
@@ -627,30 +1012,11 @@ def allocation_source_overage_enforcement_for_user(allocation_source, user):
     return user_instances
 
 
-@task(name="monitor_instances_for")
-def monitor_instances_for(
-    provider_id, users=None, print_logs=False, start_date=None, end_date=None
-):
+def _monitor_instances_per_tenant(provider, instance_map):
     """
-    Run the set of tasks related to monitoring instances for a provider.
-    Optionally, provide a list of usernames to monitor
-    While debugging, print_logs=True can be very helpful.
-    start_date and end_date allow you to search a 'non-standard' window of time.
+    Convert the running instances and cleanup the DB, one tenant at a time.
     """
-    provider = Provider.objects.get(id=provider_id)
-
-    # For now, lets just ignore everything that isn't openstack.
-    if 'openstack' not in provider.type.name.lower():
-        return
-    instance_map = _get_instance_owner_map(provider, users=users)
-
-    if print_logs:
-        console_handler = _init_stdout_logging()
     seen_instances = []
-    # DEVNOTE: Potential slowdown running multiple functions
-    # Break this out when instance-caching is enabled
-    if not settings.ENFORCING:
-        celery_logger.debug('Settings dictate allocations are NOT enforced')
     for tenant_name in sorted(instance_map.keys()):
         running_instances = instance_map[tenant_name]
         identity = _get_identity_from_tenant_name(provider, tenant_name)
@@ -674,6 +1040,53 @@ def monitor_instances_for(
             core_running_instances = []
         # Using the 'known' list of running instances, cleanup the DB
         _cleanup_missing_instances(identity, core_running_instances)
+    return seen_instances
+
+
+@task(name="monitor_instances_for")
+def monitor_instances_for(
+    provider_id,
+    users=None,
+    print_logs=False,
+    start_date=None,
+    end_date=None,
+    bulk=None
+):
+    """
+    Run the set of tasks related to monitoring instances for a provider.
+    Optionally, provide a list of usernames to monitor
+    While debugging, print_logs=True can be very helpful.
+    start_date and end_date allow you to search a 'non-standard' window of time.
+    bulk - Reconcile every tenant at once (See `reconcile_provider_instances`)
+           Defaults to settings.MONITOR_INSTANCES_BULK_RECONCILE
+    """
+    provider = Provider.objects.get(id=provider_id)
+
+    # For now, lets just ignore everything that isn't openstack.
+    if 'openstack' not in provider.type.name.lower():
+        return
+    instance_map = _get_instance_owner_map(provider, users=users)
+
+    if print_logs:
+        console_handler = _init_stdout_logging()
+    # DEVNOTE: Potential slowdown running multiple functions
+    # Break this out when instance-caching is enabled
+    if not settings.ENFORCING:
+        celery_logger.debug('Settings dictate allocations are NOT enforced')
+    if bulk is None:
+        bulk = getattr(settings, 'MONITOR_INSTANCES_BULK_RECONCILE', True)
+    started = time.time()
+    if bulk:
+        seen_instances = reconcile_provider_instances(provider, instance_map)
+    else:
+        seen_instances = _monitor_instances_per_tenant(provider, instance_map)
+    celery_logger.info(
+        "Monitored %s running instances for %s tenants on %s in %.2f seconds" %
+        (
+            len(seen_instances), len(instance_map), provider,
+            time.time() - started
+        )
+    )
     if print_logs:
         _exit_stdout_logging(console_handler)
     # return seen_instances  NOTE: this has been commented out to avoid PicklingError!
@@ -699,62 +1112,59 @@ def monitor_volumes_for(provider_id, print_logs=False):
     start_date and end_date allow you to search a 'non-standard' window of time.
     """
     from service.driver import get_account_driver
-    from core.models import Identity
     if print_logs:
         console_handler = _init_stdout_logging()
 
     provider = Provider.objects.get(id=provider_id)
     account_driver = get_account_driver(provider)
-    # Non-End dated volumes on this provider
-    db_volumes = Volume.objects.filter(
-        only_current_source(), instance_source__provider=provider
-    )
     all_volumes = account_driver.admin_driver.list_all_volumes(timeout=30)
+    # Every volume (end-dated or not) on this provider, by identifier
+    db_volumes = dict(
+        (volume.instance_source.identifier, volume)
+        for volume in Volume.objects.filter(instance_source__provider=provider).
+        select_related('instance_source')
+    )
+    last_histories = dict(
+        (history.volume_id, history)
+        for history in VolumeStatusHistory.objects.filter(
+            volume__instance_source__provider=provider
+        ).select_related('status').order_by('volume_id', '-start_date').
+        distinct('volume_id')
+    )
     seen_volumes = []
+    unknown_volumes = []
     for cloud_volume in all_volumes:
-        try:
-            core_volume = convert_esh_volume(
-                cloud_volume, provider_uuid=provider.uuid
-            )
-            seen_volumes.append(core_volume)
-        except ObjectDoesNotExist:
-            tenant_id = cloud_volume.extra['object'][
-                'os-vol-tenant-attr:tenant_id']
-            tenant = account_driver.get_project_by_id(tenant_id)
-            tenant_name = tenant.name if tenant else tenant_id
-            try:
-                if not tenant:
-                    celery_logger.warn(
-                        "Warning: tenant_id %s found on volume %s, "
-                        "but did not exist from the account driver "
-                        "perspective.", tenant_id, cloud_volume
-                    )
-                    raise ObjectDoesNotExist()
-                identity = Identity.objects.filter(
-                    contains_credential('ex_project_name', tenant_name),
-                    provider=provider
-                ).first()
-                if not identity:
-                    raise ObjectDoesNotExist()
-                core_volume = convert_esh_volume(
-                    cloud_volume, provider.uuid, identity.uuid,
-                    identity.created_by
-                )
-            except ObjectDoesNotExist:
-                celery_logger.info(
-                    "Skipping Volume %s - No Identity for: Provider:%s + Project Name:%s"
-                    % (cloud_volume.id, provider, tenant_name)
-                )
-            pass
+        core_volume = db_volumes.get(cloud_volume.id)
+        if not core_volume:
+            unknown_volumes.append(cloud_volume)
+            continue
+        core_volume.esh = cloud_volume
+        core_volume._update_history(last_histories.get(core_volume.id))
+        seen_volumes.append(core_volume)
 
-    now_time = timezone.now()
-    needs_end_date = [
-        volume for volume in db_volumes if volume not in seen_volumes
+    if unknown_volumes:
+        seen_volumes.extend(
+            _convert_unknown_volumes(account_driver, provider, unknown_volumes)
+        )
+
+    # Non-End dated volumes on this provider, that are no longer in the cloud
+    seen_identifiers = set(
+        volume.instance_source.identifier for volume in seen_volumes
+    )
+    missing_source_ids = [
+        volume.instance_source_id for identifier, volume in db_volumes.items()
+        if identifier not in seen_identifiers and (
+            not volume.instance_source.end_date
+            or volume.instance_source.end_date > timezone.now()
+        )
     ]
-    for volume in needs_end_date:
-        celery_logger.debug("End dating inactive volume: %s" % volume)
-        volume.end_date = now_time
-        volume.save()
+    if missing_source_ids:
+        end_dated = InstanceSource.objects.filter(
+            id__in=missing_source_ids
+        ).update(end_date=timezone.now())
+        celery_logger.info(
+            "End dated %s inactive volumes on %s" % (end_dated, provider)
+        )
 
     if print_logs:
         _exit_stdout_logging(console_handler)
@@ -763,6 +1173,48 @@ def monitor_volumes_for(provider_id, print_logs=False):
     return [vol.instance_source.identifier for vol in seen_volumes]
 
 
+def _convert_unknown_volumes(account_driver, provider, cloud_volumes):
+    """
+    Create the volumes found in the cloud, but not in the DB, for the
+    Identity of their project. Projects and identities are looked up once.
+    """
+    project_names = dict(
+        (project.id, project.name) for project in account_driver.list_projects()
+    )
+    identities = {}
+    for credential in Credential.objects.filter(
+        key='ex_project_name',
+        value__in=set(project_names.values()),
+        identity__provider=provider
+    ).select_related('identity__created_by').order_by('identity_id'):
+        identities.setdefault(credential.value, credential.identity)
+
+    core_volumes = []
+    for cloud_volume in cloud_volumes:
+        tenant_id = cloud_volume.extra['object']['os-vol-tenant-attr:tenant_id']
+        tenant_name = project_names.get(tenant_id)
+        if not tenant_name:
+            celery_logger.warn(
+                "Warning: tenant_id %s found on volume %s, "
+                "but did not exist from the account driver "
+                "perspective.", tenant_id, cloud_volume
+            )
+            tenant_name = tenant_id
+        identity = identities.get(tenant_name)
+        if not identity:
+            celery_logger.info(
+                "Skipping Volume %s - No Identity for: Provider:%s + Project Name:%s"
+                % (cloud_volume.id, provider, tenant_name)
+            )
+            continue
+        core_volumes.append(
+            convert_esh_volume(
+                cloud_volume, provider.uuid, identity.uuid, identity.created_by
+            )
+        )
+    return core_volumes
+
+
 @task(name="monitor_sizes")
 def monitor_sizes():
     """
@@ -787,41 +1239,41 @@ def monitor_sizes_for(provider_id, print_logs=False):
 
     provider = Provider.objects.get(id=provider_id)
     admin_driver = get_admin_driver(provider)
-    # Non-End dated sizes on this provider
-    db_sizes = Size.objects.filter(only_current(), provider=provider)
+    # Every size (end-dated or not) on this provider, by alias
+    db_sizes = dict(
+        (size.alias, size) for size in Size.objects.filter(provider=provider)
+    )
     all_sizes = admin_driver.list_sizes()
     seen_sizes = []
     for cloud_size in all_sizes:
-        core_size = convert_esh_size(cloud_size, provider.uuid)
+        core_size = db_sizes.get(cloud_size.id)
+        if core_size:
+            core_size = _update_from_cloud_size(core_size, cloud_size)
+            core_size.esh = cloud_size
+        else:
+            core_size = convert_esh_size(cloud_size, provider.uuid)
         seen_sizes.append(core_size)
 
-    now_time = timezone.now()
-    needs_end_date = [size for size in db_sizes if size not in seen_sizes]
-    for size in needs_end_date:
-        celery_logger.debug("End dating inactive size: %s" % size)
-        size.end_date = now_time
-        size.save()
+    seen_aliases = set(size.alias for size in seen_sizes)
+    end_dated = Size.objects.filter(
+        only_current(), provider=provider
+    ).exclude(alias__in=seen_aliases).update(end_date=timezone.now())
+    if end_dated:
+        celery_logger.debug(
+            "End dated %s inactive sizes on %s" % (end_dated, provider)
+        )
 
     # Find home for 'Unknown Size'
-    unknown_sizes = Size.objects.filter(
-        provider=provider, name__contains='Unknown Size'
-    )
-    for size in unknown_sizes:
-        # Lookup sizes may not show up in 'list_sizes'
-        if size.alias == 'N/A':
-            continue    # This is a sentinal value added for a separate purpose.
-        try:
-            libcloud_size = admin_driver.get_size(
-                size.alias, forced_lookup=True
-            )
-        except BaseHTTPError as error:
-            if error.code == 404:
-                # The size may have been truly deleted
-                continue
-        if not libcloud_size:
-            continue
-        cloud_size = OSSize(libcloud_size)
-        core_size = convert_esh_size(cloud_size, provider.uuid)
+    # Lookup sizes may not show up in 'list_sizes'
+    # 'N/A' is a sentinal value added for a separate purpose.
+    unknown_aliases = [
+        alias for alias, size in db_sizes.items() if 'Unknown Size' in size.name
+        and alias != 'N/A' and alias not in seen_aliases
+    ]
+    for libcloud_size in _lookup_unknown_sizes(
+        admin_driver, provider, unknown_aliases
+    ):
+        convert_esh_size(OSSize(libcloud_size), provider.uuid)
 
     if print_logs:
         _exit_stdout_logging(console_handler)
@@ -830,6 +1282,84 @@ def monitor_sizes_for(provider_id, print_logs=False):
     return seen_sizes
 
 
+def _missing_size_key(provider, alias):
+    return "monitor_sizes.missing.%s.%s" % (provider.uuid, alias)
+
+
+def _lookup_unknown_sizes(admin_driver, provider, aliases):
+    """
+    Look up sizes that are not listed by the cloud, at most
+    settings.MONITOR_SIZES_LOOKUP_CONCURRENCY at a time (with `admin_driver`
+    and one more admin driver per additional worker).
+
+    Sizes that are not found are not looked up again until their backoff
+    (settings.MONITOR_SIZES_MISSING_BACKOFF seconds, doubled after every
+    miss up to settings.MONITOR_SIZES_MISSING_MAX_BACKOFF) has passed.
+    Returns the libcloud sizes that were found.
+    """
+    if not aliases:
+        return []
+    redis_client = get_redis_client()
+    now = time.time()
+    keys = [_missing_size_key(provider, alias) for alias in aliases]
+    misses = {}
+    due_aliases = []
+    for alias, value in zip(aliases, get_many(keys, client=redis_client)):
+        if value:
+            miss_count, retry_at = value.split(':')
+            misses[alias] = int(miss_count)
+            if float(retry_at) > now:
+                continue
+        due_aliases.append(alias)
+    if not due_aliases:
+        return []
+
+    def _get_size(worker_driver, alias):
+        try:
+            return alias, worker_driver.get_size(alias, forced_lookup=True)
+        except BaseHTTPError as error:
+            if error.code == 404:
+                # The size may have been truly deleted
+                return alias, None
+            celery_logger.warn("Could not look up size %s: %s", alias, error)
+        except Exception:
+            celery_logger.exception("Could not look up size %s" % alias)
+        # Try again on the next run
+        return alias, False
+
+    results = map_with_driver_pool(
+        admin_driver, lambda: get_admin_driver(provider), _get_size,
+        due_aliases, getattr(settings, 'MONITOR_SIZES_LOOKUP_CONCURRENCY', 4)
+    )
+
+    backoff = getattr(settings, 'MONITOR_SIZES_MISSING_BACKOFF', 3600)
+    max_backoff = getattr(
+        settings, 'MONITOR_SIZES_MISSING_MAX_BACKOFF', 7 * 24 * 3600
+    )
+    found_sizes = []
+    pipe = redis_client.pipeline(transaction=False)
+    for alias, libcloud_size in results:
+        key = _missing_size_key(provider, alias)
+        if libcloud_size:
+            found_sizes.append(libcloud_size)
+            pipe.delete(key)
+        elif libcloud_size is None:
+            miss_count = misses.get(alias, 0) + 1
+            delay = min(backoff * 2**(miss_count - 1), max_backoff)
+            celery_logger.debug(
+                "Size %s was not found (%s times), "
+                "next lookup in %s seconds", alias, miss_count, delay
+            )
+            # Remember the miss count well past the retry
+            pipe.set(
+                key,
+                "%s:%s" % (miss_count, now + delay),
+                ex=int(delay + max_backoff)
+            )
+    pipe.execute()
+    return found_sizes
+
+
 def _clean_memberships(db_machines, acct_driver=None):
     """
     For each db_machine, check the # of shared access.
@@ -0,0 +1,131 @@
+import datetime
+import uuid
+
+import pytz
+from django.test import TestCase
+from django.utils import timezone
+
+from api.tests.factories import (
+    InstanceFactory, InstanceHistoryFactory, SizeFactory, UserFactory
+)
+from core.models import AllocationSource, EventTable, InstanceStatus
+from core.models.allocation_source import UserAllocationLedger, total_usage
+from service.allocation_logic import create_report
+
+
+class AllocationLedgerTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.allocation_source = AllocationSource.objects.create(
+            name='LedgerAllocation', compute_allowed=1000
+        )
+        today = timezone.now().astimezone(pytz.utc).date()
+        self.base = datetime.datetime(
+            today.year, today.month, today.day, tzinfo=pytz.utc
+        ) - datetime.timedelta(days=7)
+        self.instance = InstanceFactory.create(
+            created_by=self.user,
+            provider_alias=str(uuid.uuid4()),
+            start_date=self.base
+        )
+        self.active = InstanceStatus.objects.get_or_create(name='active')[0]
+        self.suspended = InstanceStatus.objects.get_or_create(name='suspended'
+                                                             )[0]
+        self._history(self.active, 2, self._at(0, 3), self._at(2, 5))
+        self._history(self.suspended, 2, self._at(2, 5), self._at(3, 0))
+        self._history(self.active, 1, self._at(3, 0), self._at(4, 12))
+        EventTable.objects.create(
+            name='instance_allocation_source_changed',
+            entity_id=self.user.username,
+            timestamp=self._at(1, 6),
+            payload={
+                'instance_id': self.instance.provider_alias,
+                'allocation_source_name': self.allocation_source.name
+            }
+        )
+        # Starts and ends mid-day, several completed days in between
+        self.start_date = self._at(0, 1)
+        self.end_date = self._at(5, 7)
+
+    def _at(self, days, hours):
+        return self.base + datetime.timedelta(days=days, hours=hours)
+
+    def _history(self, status, cpu, start_date, end_date):
+        return InstanceHistoryFactory.create(
+            instance=self.instance,
+            status=status,
+            size=SizeFactory.create(cpu=cpu),
+            start_date=start_date,
+            end_date=end_date
+        )
+
+    def _report_usage(self):
+        rows = create_report(
+            self.start_date,
+            self.end_date,
+            user_id=self.user.username,
+            allocation_source_name=self.allocation_source.name
+        )
+        return round(
+            sum(row['applicable_duration'] for row in rows) / 3600.0, 2
+        )
+
+    def _total_usage(self):
+        return total_usage(
+            self.user.username,
+            self.start_date,
+            allocation_source_name=self.allocation_source.name,
+            end_date=self.end_date
+        )
+
+    def test_total_usage_matches_report_across_days(self):
+        expected = self._report_usage()
+        self.assertEqual(expected, 2 * 23 + 1 * 36)
+        self.assertEqual(self._total_usage(), expected)
+        # Every completed day of the window is materialized...
+        self.assertEqual(
+            set(
+                UserAllocationLedger.objects.filter(
+                    user=self.user
+                ).values_list('day', flat=True)
+            ), set(self._at(days, 0).date() for days in range(1, 5))
+        )
+        # ...and read back from the ledger the next time
+        self.assertEqual(self._total_usage(), expected)
+
+    def test_new_history_invalidates_ledger(self):
+        self._total_usage()
+        self._history(self.active, 4, self._at(4, 12), self._at(5, 3))
+        self.assertEqual(
+            set(
+                UserAllocationLedger.objects.filter(
+                    user=self.user
+                ).values_list('day', flat=True)
+            ), set(self._at(days, 0).date() for days in range(1, 4))
+        )
+        expected = self._report_usage()
+        self.assertEqual(expected, 2 * 23 + 1 * 36 + 4 * 15)
+        self.assertEqual(self._total_usage(), expected)
+
+    def test_allocation_source_change_invalidates_ledger(self):
+        AllocationSource.objects.create(
+            name='OtherAllocation', compute_allowed=1000
+        )
+        self._total_usage()
+        EventTable.objects.create(
+            name='instance_allocation_source_changed',
+            entity_id=self.user.username,
+            timestamp=self._at(3, 12),
+            payload={
+                'instance_id': self.instance.provider_alias,
+                'allocation_source_name': 'OtherAllocation'
+            }
+        )
+        self.assertFalse(
+            UserAllocationLedger.objects.filter(
+                user=self.user, day__gte=self._at(3, 0).date()
+            ).exists()
+        )
+        expected = self._report_usage()
+        self.assertEqual(expected, 2 * 23 + 1 * 12)
+        self.assertEqual(self._total_usage(), expected)
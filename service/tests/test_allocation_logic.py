@@ -0,0 +1,137 @@
+import datetime
+import uuid
+from operator import itemgetter
+
+import pytz
+from django.test import TestCase
+from django.utils import timezone
+
+from api.tests.factories import (
+    InstanceFactory, InstanceHistoryFactory, SizeFactory, UserFactory
+)
+from core.models import AllocationSource, EventTable, InstanceStatus
+from service.allocation_logic import create_report
+
+
+class CreateReportTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.other_user = UserFactory.create()
+        self.source_by_name = AllocationSource.objects.create(
+            name='SourceByName', compute_allowed=1000
+        )
+        self.source_by_id = AllocationSource.objects.create(
+            name='SourceById', compute_allowed=1000
+        )
+        self.active = InstanceStatus.objects.get_or_create(name='active')[0]
+        now = timezone.now().astimezone(pytz.utc)
+        self.base = datetime.datetime(
+            now.year, now.month, now.day, tzinfo=pytz.utc
+        ) - datetime.timedelta(days=10)
+        self.report_start = self._at(2, 0)
+        self.report_end = self._at(4, 0)
+
+        # Started before the report, re-assigned (by id) before it started
+        self.early_instance = self._instance()
+        self._history(self.early_instance, 1, self._at(1, 0), self._at(3, 0))
+        # Started during the report, assigned (by name) while running
+        self.late_instance = self._instance()
+        self._history(self.late_instance, 2, self._at(2, 6), self._at(3, 0))
+
+        # Events are inserted without their hooks, which expect an
+        # 'allocation_source_name' in the payload. The third one is made by
+        # somebody else, and ignored.
+        EventTable.objects.bulk_create(
+            [
+                self._event(
+                    self.early_instance, self._at(0, 0),
+                    {'allocation_source_name': self.source_by_name.name}
+                ),
+                self._event(
+                    self.early_instance, self._at(1, 12),
+                    {'allocation_source_id': str(self.source_by_id.uuid)}
+                ),
+                self._event(
+                    self.late_instance,
+                    self._at(1, 0),
+                    {'allocation_source_name': self.source_by_id.name},
+                    user=self.other_user
+                ),
+                self._event(
+                    self.late_instance, self._at(2, 12),
+                    {'allocation_source_name': self.source_by_name.name}
+                ),
+            ]
+        )
+
+    def _at(self, days, hours):
+        return self.base + datetime.timedelta(days=days, hours=hours)
+
+    def _instance(self):
+        return InstanceFactory.create(
+            created_by=self.user,
+            provider_alias=str(uuid.uuid4()),
+            start_date=self.base
+        )
+
+    def _history(self, instance, cpu, start_date, end_date):
+        return InstanceHistoryFactory.create(
+            instance=instance,
+            status=self.active,
+            size=SizeFactory.create(cpu=cpu),
+            start_date=start_date,
+            end_date=end_date
+        )
+
+    def _event(self, instance, timestamp, payload, user=None):
+        username = (user or self.user).username
+        payload = dict(
+            payload, instance_id=instance.provider_alias, username=username
+        )
+        return EventTable(
+            name='instance_allocation_source_changed',
+            entity_id=username,
+            timestamp=timestamp,
+            payload=payload
+        )
+
+    def test_create_report(self):
+        rows = create_report(
+            self.report_start, self.report_end, user_id=self.user.username
+        )
+        rows.sort(key=itemgetter('instance_id', 'instance_status_start_date'))
+        self.assertEqual(
+            [
+                (
+                    row['provider_alias'], row['allocation_source'],
+                    row['applicable_duration'], row['image_name']
+                ) for row in rows
+            ], [
+                (
+                    self.early_instance.provider_alias, 'SourceById',
+                    24 * 3600.0, self.early_instance.application_name()
+                ),
+                (
+                    self.late_instance.provider_alias, 'N/A', 2 * 6 * 3600.0,
+                    self.late_instance.application_name()
+                ),
+                (
+                    self.late_instance.provider_alias, 'SourceByName',
+                    2 * 12 * 3600.0, self.late_instance.application_name()
+                ),
+            ]
+        )
+
+    def test_create_report_for_allocation_source(self):
+        rows = create_report(
+            self.report_start,
+            self.report_end,
+            user_id=self.user.username,
+            allocation_source_name='SourceById'
+        )
+        self.assertEqual(
+            [
+                (row['provider_alias'], row['applicable_duration'])
+                for row in rows
+            ], [(self.early_instance.provider_alias, 86400.0)]
+        )
@@ -0,0 +1,203 @@
+import datetime
+import uuid
+
+import mock
+import pytz
+from django.test import TestCase
+from django.utils import timezone
+
+from api.tests.factories import (
+    InstanceFactory, InstanceHistoryFactory, SizeFactory, UserFactory
+)
+from core.models import AllocationSource, EventTable, InstanceStatus
+from core.models.allocation_source import (
+    AllocationSourceSnapshot, UserAllocationSnapshot, UserAllocationSource,
+    total_usage
+)
+from service.allocation_snapshot import (
+    compute_usage, merge_usage, save_snapshots
+)
+
+
+class AllocationSnapshotTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.other_user = UserFactory.create()
+        self.source_a = AllocationSource.objects.create(
+            name='SnapshotSourceA', compute_allowed=1000
+        )
+        self.source_b = AllocationSource.objects.create(
+            name='SnapshotSourceB', compute_allowed=1000
+        )
+        self.pairs = [
+            (self.user, self.source_a),
+            (self.user, self.source_b),
+            (self.other_user, self.source_a),
+        ]
+        for user, source in self.pairs:
+            UserAllocationSource.objects.create(
+                user=user, allocation_source=source
+            )
+        self.active = InstanceStatus.objects.get_or_create(name='active')[0]
+        self.suspended = InstanceStatus.objects.get_or_create(name='suspended'
+                                                             )[0]
+        today = timezone.now().astimezone(pytz.utc).date()
+        self.base = datetime.datetime(
+            today.year, today.month, today.day, tzinfo=pytz.utc
+        ) - datetime.timedelta(days=7)
+        self.start_date = self._at(0, 0)
+        self.end_date = self._at(4, 12)
+
+        # Moves from A to B while running, then is resized (still running)
+        self.instance = self._instance(self.user)
+        self._history(
+            self.instance, self.active, 2, self._at(0, 3), self._at(2, 0)
+        )
+        self._history(self.instance, self.active, 1, self._at(2, 0), None)
+        # Suspended, then running on A
+        self.other_instance = self._instance(self.other_user)
+        self._history(
+            self.other_instance, self.suspended, 4, self._at(0, 0),
+            self._at(1, 0)
+        )
+        self._history(self.other_instance, self.active, 4, self._at(1, 0), None)
+        EventTable.objects.bulk_create(
+            [
+                self._event(self.instance, self._at(-1, 0), self.source_a),
+                self._event(self.instance, self._at(1, 12), self.source_b),
+                self._event(
+                    self.other_instance, self._at(-1, 0), self.source_a
+                ),
+            ]
+        )
+
+    def _at(self, days, hours):
+        return self.base + datetime.timedelta(days=days, hours=hours)
+
+    def _instance(self, user):
+        return InstanceFactory.create(
+            created_by=user,
+            provider_alias=str(uuid.uuid4()),
+            start_date=self._at(-1, 0)
+        )
+
+    def _history(self, instance, status, cpu, start_date, end_date):
+        return InstanceHistoryFactory.create(
+            instance=instance,
+            status=status,
+            size=SizeFactory.create(cpu=cpu),
+            start_date=start_date,
+            end_date=end_date
+        )
+
+    def _event(self, instance, timestamp, allocation_source):
+        username = instance.created_by.username
+        return EventTable(
+            name='instance_allocation_source_changed',
+            entity_id=username,
+            timestamp=timestamp,
+            payload={
+                'instance_id': instance.provider_alias,
+                'allocation_source_name': allocation_source.name,
+                'username': username
+            }
+        )
+
+    def _compute_usage(self, user_ids=None):
+        return compute_usage(
+            [self.source_a, self.source_b],
+            self.end_date,
+            start_date=self.start_date,
+            user_ids=user_ids
+        )
+
+    def _snapshots(self):
+        return dict(
+            (
+                (snapshot.user_id, snapshot.allocation_source_id),
+                [float(snapshot.compute_used),
+                 float(snapshot.burn_rate)]
+            ) for snapshot in UserAllocationSnapshot.objects.all()
+        )
+
+    def test_snapshots_match_total_usage(self):
+        save_snapshots(self._compute_usage())
+
+        expected = dict(
+            (
+                (user.id, source.id),
+                total_usage(
+                    user.username,
+                    self.start_date,
+                    allocation_source_name=source.name,
+                    end_date=self.end_date,
+                    burn_rate=True
+                )
+            ) for user, source in self.pairs
+        )
+        self.assertEqual(
+            expected, {
+                (self.user.id, self.source_a.id): [2 * 33, 0],
+                (self.user.id, self.source_b.id): [2 * 12 + 60, 1],
+                (self.other_user.id, self.source_a.id): [4 * 84, 1]
+            }
+        )
+        self.assertEqual(self._snapshots(), expected)
+        source_snapshot = AllocationSourceSnapshot.objects.get(
+            allocation_source=self.source_a
+        )
+        self.assertEqual(float(source_snapshot.compute_used), 2 * 33 + 4 * 84)
+        self.assertEqual(float(source_snapshot.global_burn_rate), 1)
+
+    def test_open_histories_count_when_now_is_end_date(self):
+        with mock.patch(
+            'service.allocation_logic._get_current_date_utc',
+            return_value=self.end_date
+        ):
+            usage = self._compute_usage()
+
+        self.assertEqual(usage[self.source_b.id]['users'][self.user.id][1], 1)
+        self.assertEqual(
+            usage[self.source_a.id]['users'][self.other_user.id][1], 1
+        )
+
+    def test_merged_user_chunks_match_one_pass(self):
+        merged = merge_usage(
+            [
+                self._compute_usage(user_ids=[self.user.id]),
+                self._compute_usage(user_ids=[self.other_user.id])
+            ]
+        )
+
+        self.assertEqual(merged, self._compute_usage())
+
+    def test_existing_snapshots_are_updated(self):
+        last_renewed = self._at(-10, 0)
+        UserAllocationSnapshot.objects.create(
+            user=self.user,
+            allocation_source=self.source_a,
+            compute_used=500,
+            burn_rate=3
+        )
+        AllocationSourceSnapshot.objects.create(
+            allocation_source=self.source_a,
+            compute_used=500,
+            global_burn_rate=3,
+            compute_allowed=1000,
+            last_renewed=last_renewed
+        )
+
+        save_snapshots(self._compute_usage())
+
+        self.assertEqual(UserAllocationSnapshot.objects.count(), 3)
+        self.assertEqual(
+            self._snapshots()[(self.user.id, self.source_a.id)], [2 * 33, 0]
+        )
+        source_snapshot = AllocationSourceSnapshot.objects.get(
+            allocation_source=self.source_a
+        )
+        self.assertEqual(float(source_snapshot.compute_used), 2 * 33 + 4 * 84)
+        self.assertEqual(float(source_snapshot.global_burn_rate), 1)
+        # Kept from the existing snapshot
+        self.assertEqual(float(source_snapshot.compute_allowed), 1000)
+        self.assertEqual(source_snapshot.last_renewed, last_renewed)
@@ -0,0 +1,184 @@
+import threading
+import time
+import uuid
+
+import mock
+from django.test import TestCase, override_settings
+
+from service import cache
+
+
+class CachedObject(object):
+    def __init__(self, id, status='active'):
+        self.id = id
+        self.status = status
+
+
+@override_settings(INSTANCE_CACHE_TTL=30, INSTANCE_CACHE_STALE_TTL=300)
+class GetCachedTest(TestCase):
+    def setUp(self):
+        self.key = "test.instances.%s" % uuid.uuid4()
+        self.calls = 0
+        self.calls_lock = threading.Lock()
+
+    def tearDown(self):
+        cache.redis_connection().delete(self.key, self.key + cache.LOCK_SUFFIX)
+
+    def _list_objects(self, delay=0):
+        with self.calls_lock:
+            self.calls += 1
+        time.sleep(delay)
+        return [CachedObject('a'), CachedObject('b')]
+
+    def _get(self, force=False, delay=0):
+        return cache._get_cached(
+            self.key,
+            lambda: self._list_objects(delay),
+            lambda objects: None,
+            force=force
+        )
+
+    def _set_refreshed(self, seconds_ago):
+        cache.redis_connection().hset(
+            self.key, cache.REFRESHED_FIELD, repr(time.time() - seconds_ago)
+        )
+
+    def test_records_are_stored_per_object(self):
+        self._get()
+
+        records = cache.redis_connection().hkeys(self.key)
+        self.assertEqual(
+            sorted(records), sorted(['a', 'b', cache.REFRESHED_FIELD])
+        )
+
+    def test_fresh_data_is_not_refreshed(self):
+        self._get()
+        objects = self._get()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(sorted(obj.id for obj in objects), ['a', 'b'])
+
+    def test_stale_data_is_returned_and_revalidated(self):
+        self._get()
+        self._set_refreshed(60)
+
+        with mock.patch(
+            'service.cache._revalidate_in_background'
+        ) as revalidate:
+            objects = self._get()
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(objects), 2)
+        self.assertEqual(revalidate.call_count, 1)
+
+    def test_revalidation_closes_its_connection(self):
+        with mock.patch('service.cache.connection') as connection:
+            cache._revalidate(
+                self.key, self._list_objects, lambda objects: None
+            )
+
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(connection.close.call_count, 1)
+
+        with mock.patch('service.cache.connection') as connection:
+            cache._revalidate(
+                self.key, mock.Mock(side_effect=ValueError),
+                lambda objects: None
+            )
+
+        self.assertEqual(connection.close.call_count, 1)
+
+    def test_expired_data_is_refreshed(self):
+        self._get()
+        self._set_refreshed(400)
+
+        self._get()
+
+        self.assertEqual(self.calls, 2)
+
+    def test_concurrent_refreshes_call_the_cloud_once(self):
+        threads = [
+            threading.Thread(target=self._get, kwargs={'delay': 0.3})
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls, 1)
+
+    def test_partial_update(self):
+        self._get()
+        identity = mock.Mock()
+        with mock.patch('service.cache._instances_key', return_value=self.key):
+            cache.update_cached_instances(
+                [CachedObject('a', status='suspended')], identity=identity
+            )
+            cache.remove_cached_instance('b', identity=identity)
+
+        objects = self._get()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(
+            [(obj.id, obj.status) for obj in objects], [('a', 'suspended')]
+        )
+
+    def test_complete_update(self):
+        self._get()
+        self._set_refreshed(60)
+        identity = mock.Mock()
+        with mock.patch('service.cache._instances_key', return_value=self.key):
+            cache.update_cached_instances(
+                [CachedObject('b', status='shutoff'),
+                 CachedObject('c')],
+                identity=identity,
+                complete=True
+            )
+
+        objects = self._get()
+        # The update counts as a refresh: the data is fresh again
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(
+            sorted((obj.id, obj.status) for obj in objects),
+            [('b', 'shutoff'), ('c', 'active')]
+        )
+
+    def test_update_without_cached_instances(self):
+        with mock.patch('service.cache._instances_key', return_value=self.key):
+            cache.update_cached_instances(
+                [CachedObject('a')], identity=mock.Mock(), complete=True
+            )
+
+        self.assertFalse(cache.redis_connection().exists(self.key))
+
+
+class GetCachedInstancesTest(TestCase):
+    def setUp(self):
+        self.key = "test.instances.%s" % uuid.uuid4()
+        self.identity = mock.Mock()
+        self.identity.created_by.username = 'user'
+
+    def tearDown(self):
+        cache.redis_connection().delete(self.key, self.key + cache.LOCK_SUFFIX)
+
+    def test_every_listing_uses_a_new_driver(self):
+        drivers = []
+
+        def get_esh_driver(identity):
+            driver = mock.Mock()
+            driver.list_instances.return_value = [CachedObject('a')]
+            drivers.append(driver)
+            return driver
+
+        with mock.patch(
+            'service.cache._instances_key', return_value=self.key
+        ), mock.patch(
+            'service.cache.get_esh_driver', side_effect=get_esh_driver
+        ):
+            cache.get_cached_instances(identity=self.identity, force=True)
+            cache.get_cached_instances(identity=self.identity, force=True)
+
+        self.assertEqual(len(drivers), 2)
+        for driver in drivers:
+            driver.list_instances.assert_called_once_with()
+            self.assertFalse(driver.list_all_instances.called)
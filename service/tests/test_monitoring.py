@@ -0,0 +1,838 @@
+import threading
+import time
+import uuid
+
+import mock
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from libcloud.common.exceptions import BaseHTTPError
+
+from api.tests.factories import (
+    UserFactory, ProviderFactory, IdentityFactory, InstanceFactory,
+    InstanceHistoryFactory, InstanceStatusFactory, SizeFactory, GroupFactory,
+    ProviderMachineFactory, VolumeFactory
+)
+from core.models import (
+    AllocationSource, AllocationSourceSnapshot, ApplicationMembership,
+    ApplicationVersionMembership, Credential, Instance, InstanceSource,
+    InstanceStatusHistory, ProviderMachineMembership, UserAllocationSnapshot,
+    UserAllocationSource, Volume
+)
+from core.redis_client import get_redis_client
+from service.driver import get_esh_driver
+from service.monitoring import (
+    enforce_provider_action, map_with_driver_pool, reconcile_provider_instances,
+    wait_for_terminal_state
+)
+from service.tasks.monitoring import (
+    _get_image_members_many, _lookup_unknown_sizes, _missing_size_key,
+    monitor_allocation_sources, monitor_machines_for, monitor_volumes_for,
+    reconcile_image_memberships
+)
+
+
+class MapWithDriverPoolTest(TestCase):
+    def setUp(self):
+        self.running = 0
+        self.max_running = 0
+        self.pool_filled = False
+        self.drivers_in_use = set()
+        self.drivers_used = set()
+        self.shared_driver = False
+        self.condition = threading.Condition()
+        self.first_driver = mock.Mock()
+        self.make_driver = mock.Mock(side_effect=mock.Mock)
+
+    def _double(self, driver, item):
+        with self.condition:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            self.shared_driver |= driver in self.drivers_in_use
+            self.drivers_in_use.add(driver)
+            self.drivers_used.add(driver)
+            # Hold the first calls until all the workers run one
+            if self.running == 3:
+                self.pool_filled = True
+                self.condition.notify_all()
+            if not self.pool_filled:
+                self.condition.wait(5)
+            self.running -= 1
+            self.drivers_in_use.discard(driver)
+        return item * 2
+
+    def test_calls_run_concurrently_up_to_the_limit(self):
+        results = map_with_driver_pool(
+            self.first_driver, self.make_driver, self._double, range(6), 3
+        )
+
+        self.assertEqual(results, [0, 2, 4, 6, 8, 10])
+        self.assertTrue(self.pool_filled)
+        self.assertEqual(self.max_running, 3)
+        # No driver (libcloud connection) is used by two threads at once
+        self.assertFalse(self.shared_driver)
+        self.assertEqual(self.make_driver.call_count, 2)
+        self.assertIn(self.first_driver, self.drivers_used)
+        self.assertEqual(len(self.drivers_used), 3)
+
+    def test_workers_are_limited_by_items(self):
+        results = map_with_driver_pool(
+            self.first_driver, self.make_driver, lambda driver, item: item,
+            [1, 2], 8
+        )
+
+        self.assertEqual(results, [1, 2])
+        self.assertEqual(self.make_driver.call_count, 1)
+
+    def test_no_items(self):
+        self.assertEqual(
+            map_with_driver_pool(
+                self.first_driver, self.make_driver, self._double, [], 3
+            ), []
+        )
+        self.assertFalse(self.make_driver.called)
+
+    def test_errors_are_raised(self):
+        def _fail(driver, item):
+            raise ValueError(item)
+
+        with self.assertRaises(ValueError):
+            map_with_driver_pool(
+                self.first_driver, self.make_driver, _fail, [1, 2], 2
+            )
+
+
+@override_settings(ENFORCEMENT_CONCURRENCY=3)
+class EnforceProviderActionTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.provider = ProviderFactory.create(type__name='mock')
+        self.identity = IdentityFactory.create_identity(
+            created_by=self.user, provider=self.provider
+        )
+        self.driver = get_esh_driver(self.identity)
+        self.action = mock.Mock()
+        self.action.name = 'Suspend'
+
+    def _create_instances(self, count, status='active'):
+        return [
+            self.driver.create_instance(
+                id=str(uuid.uuid4()), extra={
+                    'status': status,
+                    'metadata': {}
+                }
+            ) for _ in range(count)
+        ]
+
+    def _suspend(self, identity, user, instance, action_name, driver=None):
+        return driver.suspend_instance(instance)
+
+    def _enforce(self, instances):
+        with mock.patch(
+            'service.monitoring._execute_provider_action',
+            side_effect=self._suspend
+        ), mock.patch(
+            'service.monitoring.convert_esh_instance',
+            side_effect=lambda driver, esh_instance, *args: esh_instance.id
+        ):
+            return enforce_provider_action(
+                self.user, self.driver, self.identity, instances, self.action
+            )
+
+    def test_actions_are_enforced(self):
+        instances = self._create_instances(6)
+        with mock.patch(
+            'service.monitoring.map_with_driver_pool',
+            wraps=map_with_driver_pool
+        ) as pool:
+            results = self._enforce(instances)
+
+        self.assertEqual(
+            [result['instance_id'] for result in results],
+            [instance.id for instance in instances]
+        )
+        for result in results:
+            self.assertEqual(result['result'], 'enforced')
+            self.assertEqual(result['instance'], result['instance_id'])
+        for instance in instances:
+            self.assertEqual(instance.extra['status'], 'suspended')
+        (first_driver, _, _, _, max_workers), _ = pool.call_args
+        self.assertIs(first_driver, self.driver)
+        self.assertEqual(max_workers, 3)
+
+    def test_inactive_and_failed_instances_are_reported(self):
+        inactive_instance = self._create_instances(1, status='suspended')[0]
+        failing_instance = self._create_instances(1)[0]
+
+        def _suspend_or_fail(identity, user, instance, action_name, driver):
+            if instance is failing_instance:
+                raise Exception("Cloud is unavailable")
+            return driver.suspend_instance(instance)
+
+        self._suspend = _suspend_or_fail
+        results = self._enforce([inactive_instance, failing_instance])
+
+        self.assertEqual(results[0]['result'], 'skipped')
+        self.assertIsNone(results[0]['instance'])
+        self.assertEqual(results[1]['result'], 'failed')
+        self.assertEqual(results[1]['error'], "Cloud is unavailable")
+
+
+class FakeClock(object):
+    """
+    Replaces the `time` module: `sleep` advances `time` instantly.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@override_settings(ENFORCEMENT_POLL_INTERVAL=2, ENFORCEMENT_TIMEOUT=10)
+class WaitForTerminalStateTest(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch('service.monitoring.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.driver = mock.Mock()
+        self.driver._is_active_instance.side_effect = (
+            lambda esh_instance: esh_instance.extra['status'] == 'active'
+        )
+
+    def _instance(self, status, task=None):
+        return mock.Mock(id='instance', extra={'status': status, 'task': task})
+
+    def test_polls_until_inactive(self):
+        suspended = self._instance('suspended')
+        self.driver.get_instance.side_effect = [
+            self._instance('active'),
+            self._instance('suspended', task='suspending'), suspended
+        ]
+        self.assertIs(
+            wait_for_terminal_state(self.driver, 'instance'), suspended
+        )
+        self.assertEqual(self.clock.sleeps, [2, 2])
+
+    def test_gives_up_after_timeout(self):
+        active = self._instance('active')
+        self.driver.get_instance.return_value = active
+        self.assertIs(wait_for_terminal_state(self.driver, 'instance'), active)
+        self.assertEqual(self.clock.sleeps, [2] * 5)
+
+    def test_removed_instance(self):
+        self.driver.get_instance.side_effect = [self._instance('active'), None]
+        self.assertIsNone(wait_for_terminal_state(self.driver, 'instance'))
+        self.assertEqual(self.clock.sleeps, [2])
+
+
+class ReconcileProviderInstancesTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.provider = ProviderFactory.create(type__name='mock')
+        self.identity = IdentityFactory.create_identity(
+            created_by=self.user, provider=self.provider
+        )
+        Credential.objects.create(
+            key='ex_project_name',
+            value=self.user.username,
+            identity=self.identity
+        )
+        self.size = SizeFactory.create(provider=self.provider)
+        self.active = InstanceStatusFactory.create(name='active')
+        self.running = self._create_instance()
+        self.missing = self._create_instance()
+
+    def _create_instance(self):
+        instance = InstanceFactory.create(
+            provider_alias=str(uuid.uuid4()),
+            created_by=self.user,
+            created_by_identity=self.identity,
+            ip_address='10.0.0.1'
+        )
+        InstanceHistoryFactory.create(
+            instance=instance,
+            status=self.active,
+            size=self.size,
+            start_date=instance.start_date
+        )
+        return instance
+
+    def _esh_instance(self, core_instance, status='active'):
+        esh_instance = mock.Mock(
+            id=core_instance.provider_alias,
+            ip='10.0.0.1',
+            extra={
+                'status': status,
+                'metadata': {}
+            }
+        )
+        esh_instance.size.id = self.size.alias
+        return esh_instance
+
+    def _reconcile(self, esh_instances):
+        with mock.patch('service.monitoring.get_cached_driver'), \
+                mock.patch(
+                    'service.monitoring._esh_instance_size_to_core',
+                    return_value=self.size):
+            return reconcile_provider_instances(
+                self.provider, {self.user.username: esh_instances}
+            )
+
+    def test_unchanged_instances_are_not_written(self):
+        with mock.patch.object(Instance, 'save') as save, \
+                mock.patch.object(Instance, 'update_history') as update_history:
+            seen_instances = self._reconcile([self._esh_instance(self.running)])
+
+        self.assertEqual([i.id for i in seen_instances], [self.running.id])
+        save.assert_not_called()
+        update_history.assert_not_called()
+
+    def test_status_change_adds_history(self):
+        self._reconcile([self._esh_instance(self.running, 'suspended')])
+
+        histories = InstanceStatusHistory.objects.filter(
+            instance=self.running
+        ).order_by('start_date')
+        self.assertEqual(
+            [history.status.name for history in histories],
+            ['active', 'suspended']
+        )
+        self.assertIsNotNone(histories[0].end_date)
+        self.assertIsNone(histories[1].end_date)
+
+    def test_missing_instances_are_end_dated(self):
+        self._reconcile([self._esh_instance(self.running)])
+
+        self.assertIsNone(Instance.objects.get(id=self.running.id).end_date)
+        self.assertIsNotNone(Instance.objects.get(id=self.missing.id).end_date)
+        self.assertFalse(
+            InstanceStatusHistory.objects.filter(
+                instance=self.missing, end_date=None
+            ).exists()
+        )
+
+
+class CloudImage(dict):
+    def __init__(self, id, **kwargs):
+        super(CloudImage, self).__init__(**kwargs)
+        self.id = id
+
+
+class ReconcileImageMembershipsTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.provider = ProviderFactory.create()
+        self.identity = IdentityFactory.create_identity(
+            created_by=self.user, provider=self.provider
+        )
+        self.machine = ProviderMachineFactory.create_provider_machine(
+            self.user, self.identity
+        )
+        self.member = GroupFactory.create(name='member-project')
+        self.former_member = GroupFactory.create(name='former-project')
+        ProviderMachineMembership.objects.create(
+            provider_machine=self.machine, group=self.former_member
+        )
+        self.account_driver = mock.Mock()
+        self.cloud_members = [mock.Mock(), mock.Mock()]
+        self.cloud_members[0].name = 'member-project'
+        self.cloud_members[1].name = 'unknown-project'
+        self.account_driver.get_image_members.return_value = self.cloud_members
+
+    def _reconcile(self, visibility='shared', remove_stale=False):
+        cloud_machine = CloudImage(
+            self.machine.identifier, visibility=visibility
+        )
+        return reconcile_image_memberships(
+            self.account_driver,
+            self.provider, [(cloud_machine, self.machine)],
+            remove_stale=remove_stale
+        )
+
+    def _machine_members(self):
+        return set(
+            ProviderMachineMembership.objects.filter(
+                provider_machine=self.machine
+            ).values_list('group__name', flat=True)
+        )
+
+    def test_members_are_added(self):
+        self._reconcile()
+
+        self.assertEqual(
+            self._machine_members(), {'member-project', 'former-project'}
+        )
+        self.assertTrue(
+            ApplicationVersionMembership.objects.filter(
+                image_version=self.machine.application_version,
+                group=self.member
+            ).exists()
+        )
+        self.assertTrue(
+            ApplicationMembership.objects.filter(
+                application=self.machine.application, group=self.member
+            ).exists()
+        )
+
+    def test_reconcile_is_idempotent(self):
+        self._reconcile()
+        changes = self._reconcile()
+
+        self.assertEqual(changes['ProviderMachineMembership'], (0, 0))
+
+    def test_stale_members_are_removed(self):
+        self._reconcile(remove_stale=True)
+
+        self.assertEqual(self._machine_members(), {'member-project'})
+
+    def test_public_images_are_skipped(self):
+        self._reconcile(visibility='public')
+
+        self.assertFalse(self.account_driver.get_image_members.called)
+        self.assertEqual(self._machine_members(), {'former-project'})
+
+    def test_too_many_members_without_machine_request(self):
+        for idx in range(129):
+            project = mock.Mock()
+            project.name = 'project-%s' % idx
+            self.cloud_members.append(project)
+
+        self._reconcile()
+
+        self.assertEqual(self._machine_members(), {'former-project'})
+
+    def test_too_many_members_with_machine_request(self):
+        for idx in range(129):
+            project = mock.Mock()
+            project.name = 'project-%s' % idx
+            self.cloud_members.append(project)
+        machine_request = mock.Mock()
+        machine_request.get_access_list.return_value = []
+
+        with mock.patch(
+            'service.tasks.monitoring._get_last_machine_requests',
+            return_value={self.machine.identifier: machine_request}
+        ):
+            self._reconcile()
+
+        self.assertEqual(
+            self._machine_members(), {'member-project', 'former-project'}
+        )
+
+
+@override_settings(ENFORCING=False)
+class MonitorMachinesForTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.provider = ProviderFactory.create()
+        self.identity = IdentityFactory.create_identity(
+            created_by=self.user, provider=self.provider
+        )
+        self.known = self._machine()
+        self.end_dated = self._machine()
+        self.end_dated.instance_source.end_date = timezone.now()
+        self.end_dated.instance_source.save()
+        self.converted = self._machine()
+        self.owner_project = mock.Mock(id='owner-id')
+        self.owner_project.name = 'owner-project'
+        self.account_driver = mock.Mock()
+        self.account_driver.user_manager.version = 3
+        self.account_driver.list_projects.return_value = [self.owner_project]
+        patchers = [
+            mock.patch(
+                'service.tasks.monitoring.get_account_driver',
+                return_value=self.account_driver
+            ),
+            mock.patch(
+                'service.tasks.monitoring.convert_glance_image',
+                return_value=(self.converted, True)
+            ),
+            mock.patch('service.tasks.monitoring.reconcile_image_memberships'),
+        ]
+        (_, self.convert_glance_image, self.reconcile_image_memberships) = [
+            patcher.start() for patcher in patchers
+        ]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+    def _machine(self):
+        return ProviderMachineFactory.create_provider_machine(
+            self.user, self.identity
+        )
+
+    def _cloud_image(self, machine=None, **kwargs):
+        image_id = str(
+            machine.instance_source.identifier if machine else uuid.uuid4()
+        )
+        return CloudImage(image_id, visibility='public', **kwargs)
+
+    def _monitor(self, cloud_images):
+        self.account_driver.list_all_images.return_value = cloud_images
+        return monitor_machines_for(self.provider.id, bulk=True, validate=False)
+
+    def _size_bytes(self, machine):
+        return InstanceSource.objects.get(
+            id=machine.instance_source.id
+        ).size_bytes
+
+    def test_known_machines_are_updated(self):
+        known_image = self._cloud_image(self.known, size=1024)
+        result = self._monitor(
+            [known_image,
+             self._cloud_image(self.end_dated, size=2048)]
+        )
+
+        self.assertEqual(result['machines'], [self.known])
+        self.assertEqual(
+            set(result['timings']), {
+                'list_images', 'list_projects', 'load_machines', 'convert',
+                'membership', 'total'
+            }
+        )
+        self.assertEqual(self._size_bytes(self.known), 1024)
+        # End-dated machines are skipped
+        self.assertNotEqual(self._size_bytes(self.end_dated), 2048)
+        self.assertFalse(self.convert_glance_image.called)
+        self.reconcile_image_memberships.assert_called_once_with(
+            self.account_driver,
+            self.provider, [(known_image, self.known)],
+            remove_stale=False
+        )
+
+    def test_new_images_are_converted(self):
+        cloud_images = [
+            self._cloud_image(owner='owner-id'),
+            self._cloud_image(application_owner='owner-project'),
+            self._cloud_image(owner='unknown-id'),
+        ]
+        result = self._monitor(cloud_images)
+
+        self.assertEqual(result['machines'], [self.converted] * 3)
+        self.assertEqual(
+            self.convert_glance_image.call_args_list, [
+                mock.call(
+                    self.account_driver, cloud_images[0], self.provider.uuid,
+                    self.owner_project
+                ),
+                mock.call(
+                    self.account_driver, cloud_images[1], self.provider.uuid,
+                    self.owner_project
+                ),
+                mock.call(
+                    self.account_driver, cloud_images[2], self.provider.uuid,
+                    None
+                ),
+            ]
+        )
+        # Projects are listed once, not looked up per image
+        self.assertEqual(self.account_driver.list_projects.call_count, 1)
+        self.assertFalse(self.account_driver.get_project_by_id.called)
+        self.assertFalse(self.account_driver.get_project.called)
+
+    @override_settings(MONITOR_MACHINES_BATCH_SIZE=2)
+    def test_machines_are_synced_in_batches(self):
+        cloud_images = [
+            self._cloud_image(self.known),
+            self._cloud_image(self.end_dated),
+        ] + [self._cloud_image() for _ in range(3)]
+        with mock.patch.object(
+            transaction, 'atomic', wraps=transaction.atomic
+        ) as atomic:
+            result = self._monitor(cloud_images)
+
+        self.assertEqual(atomic.call_count, 3)
+        self.assertEqual(
+            result['machines'], [self.known] + [self.converted] * 3
+        )
+
+
+@override_settings(MONITOR_MACHINES_MEMBER_CONCURRENCY=3)
+class GetImageMembersManyTest(TestCase):
+    def setUp(self):
+        self.account_driver = self._account_driver()
+
+    def _account_driver(self, *args, **kwargs):
+        driver = mock.Mock()
+        driver.get_image_members.side_effect = self._get_image_members
+        return driver
+
+    def _get_image_members(self, image_id, project):
+        if image_id == 'image-missing':
+            raise BaseHTTPError(404, 'Not Found')
+        project = mock.Mock()
+        project.name = 'member-project'
+        return [project]
+
+    def test_members_are_fetched_with_a_driver_pool(self):
+        image_ids = ['image-%s' % idx for idx in range(5)] + ['image-missing']
+        with mock.patch(
+            'service.tasks.monitoring.get_account_driver',
+            side_effect=self._account_driver
+        ) as get_account_driver:
+            members = _get_image_members_many(
+                self.account_driver, mock.Mock(), image_ids
+            )
+
+        expected = dict(
+            (image_id, {'member-project'}) for image_id in image_ids[:-1]
+        )
+        expected['image-missing'] = None
+        self.assertEqual(members, expected)
+        self.assertEqual(get_account_driver.call_count, 2)
+
+
+@override_settings(
+    MONITOR_SIZES_MISSING_BACKOFF=60, MONITOR_SIZES_MISSING_MAX_BACKOFF=300
+)
+class LookupUnknownSizesTest(TestCase):
+    def setUp(self):
+        self.provider = mock.Mock(uuid=uuid.uuid4())
+        self.found_size = mock.Mock()
+        self.looked_up = []
+        self.admin_driver = self._admin_driver()
+        self.aliases = ['found', 'deleted']
+        get_admin_driver_patcher = mock.patch(
+            'service.tasks.monitoring.get_admin_driver',
+            side_effect=self._admin_driver
+        )
+        self.get_admin_driver = get_admin_driver_patcher.start()
+        self.addCleanup(get_admin_driver_patcher.stop)
+
+    def tearDown(self):
+        get_redis_client().delete(
+            *[
+                _missing_size_key(self.provider, alias)
+                for alias in self.aliases
+            ]
+        )
+
+    def _admin_driver(self, *args):
+        driver = mock.Mock()
+        driver.get_size.side_effect = (
+            lambda alias, forced_lookup=False: self._get_size(driver, alias)
+        )
+        return driver
+
+    def _get_size(self, driver, alias):
+        self.looked_up.append(alias)
+        if alias == 'deleted':
+            raise BaseHTTPError(404, 'Not Found')
+        return self.found_size
+
+    def _looked_up(self):
+        looked_up, self.looked_up = self.looked_up, []
+        return looked_up
+
+    def test_missing_sizes_are_not_looked_up_again(self):
+        found = _lookup_unknown_sizes(
+            self.admin_driver, self.provider, self.aliases
+        )
+        self.assertEqual(found, [self.found_size])
+        self.assertEqual(sorted(self._looked_up()), ['deleted', 'found'])
+        # A second driver for the second concurrent lookup
+        self.assertEqual(self.get_admin_driver.call_count, 1)
+
+        _lookup_unknown_sizes(self.admin_driver, self.provider, self.aliases)
+        self.assertEqual(self._looked_up(), ['found'])
+
+    def test_backoff_doubles(self):
+        _lookup_unknown_sizes(self.admin_driver, self.provider, ['deleted'])
+        with mock.patch(
+            'service.tasks.monitoring.time.time', return_value=time.time() + 61
+        ):
+            _lookup_unknown_sizes(self.admin_driver, self.provider, ['deleted'])
+
+        value = get_redis_client().get(
+            _missing_size_key(self.provider, 'deleted')
+        )
+        miss_count, retry_at = value.split(':')
+        self.assertEqual(miss_count, '2')
+        self.assertAlmostEqual(float(retry_at), time.time() + 61 + 120, delta=5)
+
+
+@override_settings(
+    ALLOCATION_OVERRIDES_NEVER_ENFORCE=['NeverEnforced'],
+    ALLOCATION_OVERRIDES_ALWAYS_ENFORCE=['AlwaysEnforced'],
+    SPECIAL_ALLOCATION_SOURCES={'Shared': {
+        'compute_allowed': 50
+    }}
+)
+class MonitorAllocationSourcesTest(TestCase):
+    def setUp(self):
+        self.alice = UserFactory.create(username='alice')
+        self.bob = UserFactory.create(username='bob')
+        # name -> (compute_allowed, compute_used or None for no snapshot)
+        sources = {
+            'Over': (10, 20),
+            'Under': (100, 5),
+            'NeverEnforced': (10, 20),
+            'AlwaysEnforced': (100, 5),
+            'Unlimited': (-1, 1000),
+            'NoSnapshot': (10, None),
+            'Shared': (1000, 0),
+        }
+        self.sources = {}
+        for name, (compute_allowed, compute_used) in sources.items():
+            source = AllocationSource.objects.create(
+                name=name, compute_allowed=compute_allowed
+            )
+            if compute_used is not None:
+                AllocationSourceSnapshot.objects.create(
+                    allocation_source=source,
+                    compute_used=compute_used,
+                    global_burn_rate=0
+                )
+            for user in (self.alice, self.bob):
+                UserAllocationSource.objects.create(
+                    allocation_source=source, user=user
+                )
+            self.sources[name] = source
+        # Shared sources are enforced per user (bob has no snapshot yet)
+        UserAllocationSnapshot.objects.create(
+            allocation_source=self.sources['Shared'],
+            user=self.alice,
+            compute_used=10,
+            burn_rate=0
+        )
+
+    def test_enforced_pairs(self):
+        with mock.patch(
+            'service.tasks.monitoring.allocation_source_overage_enforcement_for_user'
+        ) as enforcement, self.assertNumQueries(3):
+            monitor_allocation_sources()
+        self.assertEqual(
+            [
+                call_args[1]['args']
+                for call_args in enforcement.apply_async.call_args_list
+            ], [
+                (self.sources['AlwaysEnforced'], self.alice),
+                (self.sources['AlwaysEnforced'], self.bob),
+                (self.sources['Over'], self.alice),
+                (self.sources['Over'], self.bob),
+                (self.sources['Shared'], self.bob),
+            ]
+        )
+
+    def test_time_remaining_matches_batch(self):
+        pairs = [
+            (source, user) for source in self.sources.values()
+            for user in (self.alice, self.bob, None)
+        ]
+        time_remaining = AllocationSource.time_remaining_for(pairs)
+        for source, user in pairs:
+            self.assertEqual(
+                source.time_remaining(user),
+                time_remaining[(source.id, user.id if user else None)]
+            )
+        self.assertEqual(self.sources['Over'].time_remaining(), -10)
+        self.assertEqual(self.sources['Shared'].time_remaining(self.alice), 40)
+        self.assertEqual(self.sources['Shared'].time_remaining(self.bob), -1)
+        self.assertEqual(self.sources['Shared'].time_remaining(), 1000)
+
+
+class MonitorVolumesForTest(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.provider = ProviderFactory.create()
+        self.identity = IdentityFactory.create_identity(
+            created_by=self.user, provider=self.provider
+        )
+        Credential.objects.create(
+            key='ex_project_name',
+            value='known-project',
+            identity=self.identity
+        )
+        self.kept = self._volume()
+        self.vanished = self._volume()
+        self.revived = self._volume(
+            end_date=timezone.now() - timezone.timedelta(days=1)
+        )
+        self.account_driver = mock.Mock()
+        known_project = mock.Mock(id='known-id')
+        known_project.name = 'known-project'
+        self.account_driver.list_projects.return_value = [known_project]
+
+    def _volume(self, end_date=None):
+        return VolumeFactory.create(
+            name='volume',
+            size=1,
+            instance_source__provider=self.provider,
+            instance_source__created_by=self.user,
+            instance_source__created_by_identity=self.identity,
+            instance_source__end_date=end_date
+        )
+
+    def _cloud_volume(self, identifier, tenant_id='known-id'):
+        cloud_volume = mock.Mock(
+            id=str(identifier),
+            size=1,
+            extra={
+                'status': 'available',
+                'object': {
+                    'os-vol-tenant-attr:tenant_id': tenant_id
+                }
+            }
+        )
+        cloud_volume.name = 'volume'
+        return cloud_volume
+
+    def _monitor(self, cloud_volumes):
+        self.account_driver.admin_driver.list_all_volumes.return_value = (
+            cloud_volumes
+        )
+        with mock.patch(
+            'service.driver.get_account_driver',
+            return_value=self.account_driver
+        ):
+            return monitor_volumes_for(self.provider.id)
+
+    def _end_date(self, volume):
+        return Volume.objects.get(id=volume.id).end_date
+
+    def test_vanished_volumes_are_end_dated(self):
+        seen = self._monitor(
+            [
+                self._cloud_volume(self.kept.identifier),
+                self._cloud_volume(self.revived.identifier)
+            ]
+        )
+
+        self.assertEqual(
+            sorted(seen),
+            sorted([str(self.kept.identifier),
+                    str(self.revived.identifier)])
+        )
+        self.assertIsNone(self._end_date(self.kept))
+        self.assertIsNotNone(self._end_date(self.vanished))
+        # A volume that is back in the cloud is no longer end-dated
+        self.assertIsNone(self._end_date(self.revived))
+
+    def test_unknown_volumes(self):
+        new_id = str(uuid.uuid4())
+        seen = self._monitor(
+            [
+                self._cloud_volume(new_id),
+                self._cloud_volume(uuid.uuid4(), tenant_id='unknown-id')
+            ]
+        )
+
+        self.assertEqual(seen, [new_id])
+        new_volume = Volume.objects.get(instance_source__identifier=new_id)
+        self.assertEqual(
+            new_volume.instance_source.created_by_identity, self.identity
+        )
+        self.assertEqual(
+            Volume.objects.filter(instance_source__provider=self.provider
+                                 ).count(), 4
+        )
+        self.assertEqual(
+            new_volume.volumestatushistory_set.get().status.name, 'available'
+        )